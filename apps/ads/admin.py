@@ -1,5 +1,8 @@
 from django.contrib import admin
+from django.template.response import TemplateResponse
+from django.urls import path
 from django.utils.html import format_html
+from .duplicates import MIN_SIMILARITY, REPORT_ADS, duplicate_groups
 from .models import Ad, ExchangeProposal
 
 
@@ -22,6 +25,9 @@ class AdAdmin(admin.ModelAdmin):
         ('Категоризация', {
             'fields': ('category', 'condition')
         }),
+        ('Что хочет взамен', {
+            'fields': ('wanted_categories', 'wanted_keywords')
+        }),
         ('Статус', {
             'fields': ('is_active',)
         }),
@@ -33,19 +39,17 @@ class AdAdmin(admin.ModelAdmin):
     
     def image_preview(self, obj):
         """Превью изображения в списке"""
-        if obj.image:
-            return format_html('<img src="{}" style="width: 50px; height: 50px; object-fit: cover;">', obj.image.url)
-        elif obj.image_url:
-            return format_html('<img src="{}" style="width: 50px; height: 50px; object-fit: cover;">', obj.image_url)
+        url = obj.get_image_url('admin')
+        if url:
+            return format_html('<img src="{}" style="width: 50px; height: 50px; object-fit: cover;">', url)
         return "Нет изображения"
     image_preview.short_description = 'Превью'
     
     def image_preview_large(self, obj):
         """Большое превью изображения"""
-        if obj.image:
-            return format_html('<img src="{}" style="max-width: 300px; max-height: 300px;">', obj.image.url)
-        elif obj.image_url:
-            return format_html('<img src="{}" style="max-width: 300px; max-height: 300px;">', obj.image_url)
+        url = obj.get_image_url('card')
+        if url:
+            return format_html('<img src="{}" style="max-width: 300px; max-height: 300px;">', url)
         return "Нет изображения"
     image_preview_large.short_description = 'Превью изображения'
     
@@ -53,6 +57,32 @@ class AdAdmin(admin.ModelAdmin):
         """Оптимизация запросов"""
         qs = super().get_queryset(request)
         return qs.select_related('user')
+    
+    def get_urls(self):
+        return [
+            path(
+                'duplicates/',
+                self.admin_site.admin_view(self.duplicates_view),
+                name='ads_ad_duplicates',
+            ),
+            *super().get_urls(),
+        ]
+    
+    def duplicates_view(self, request):
+        """Отчет: группы почти одинаковых объявлений среди новейших"""
+        groups = [
+            {'ads': ads, 'users': len({ad.user_id for ad in ads})}
+            for ads in duplicate_groups()
+        ]
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Дубликаты объявлений',
+            'groups': groups,
+            'report_ads': REPORT_ADS,
+            'min_similarity': round(MIN_SIMILARITY * 100),
+        }
+        return TemplateResponse(request, 'admin/ads/ad/duplicates.html', context)
 
 
 @admin.register(ExchangeProposal)
@@ -8,8 +8,13 @@ app_name = 'api_ads'
 router = DefaultRouter()
 router.register(r'ads', views.AdViewSet, basename='ad')
 router.register(r'proposals', views.ExchangeProposalViewSet, basename='proposal')
+router.register(r'trade-cycles', views.TradeCycleViewSet, basename='trade-cycle')
 
 urlpatterns = [
+    # Составной запрос к маршрутам этого роутера
+    path('batch/', views.ApiBatchView.as_view(), name='batch'),
+    # Очередь фоновых задач сервера (только для staff)
+    path('tasks/', views.TaskQueueView.as_view(), name='task-queue'),
     # Включаем все маршруты из роутера
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,7 +1,21 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def install_search_index(sender, using, **kwargs):
+    """Восстановить поисковый индекс после миграций (SQLite теряет триггеры при пересоздании таблиц)"""
+    from django.db import connections
+    from .models import Ad
+    from .search import get_search_backend
+
+    if Ad._meta.db_table in connections[using].introspection.table_names():
+        get_search_backend(using).install()
 
 
 class AdsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.ads'
-    verbose_name = 'Объявления'
\ No newline at end of file
+    verbose_name = 'Объявления'
+
+    def ready(self):
+        post_migrate.connect(install_search_index, sender=self)
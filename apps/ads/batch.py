@@ -0,0 +1,100 @@
+"""
+Составной запрос к API: несколько чтений за один HTTP-запрос.
+
+    POST /api/batch/
+    {"requests": [{"id": "feed", "path": "/api/ads/?page_size=10"}, {"path": "/api/proposals/received/"}]}
+
+Части выполняются в том же процессе представлениями маршрутов api_ads:
+аутентификация, middleware и соединение с базой одни на весь пакет. Ответ -
+{"responses": [{"id", "status", "body"}, ...]} в порядке запроса; ошибка части
+(404, 403, 400) не прерывает остальные. Поддерживаются только GET-запросы.
+
+Части выполняются по очереди, а не в потоках: соединение Django привязано к
+потоку, и каждая параллельная часть открывала бы свое соединение - дороже самих
+запросов. Бюджет запросов (barter_platform/querybudget.py) проверяется для каждой
+части по ее маршруту.
+"""
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+
+from barter_platform.querybudget import QueryRecorder, check_query_budget
+
+BATCH_NAMESPACE = 'api_ads'
+BATCH_URL_NAME = 'batch'
+
+# Заголовки пакета, которые не относятся к частям
+SKIPPED_META = ('CONTENT_TYPE', 'CONTENT_LENGTH', 'HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE')
+
+
+def parse_batch(data):
+    """{'requests': [{'id': ..., 'method': 'GET', 'path': ...}, ...]} -> список частей"""
+    items = data.get('requests') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ValidationError({'requests': ['Ожидается непустой список запросов']})
+    if len(items) > settings.API_BATCH_MAX_REQUESTS:
+        raise ValidationError({'requests': [f'Не больше {settings.API_BATCH_MAX_REQUESTS} запросов в пакете']})
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+            raise ValidationError({'requests': ['Каждый запрос - объект с полем path']})
+    return items
+
+
+def build_subrequest(request, path, query):
+    """GET-запрос части с пользователем пакета: повторной аутентификации нет"""
+    outer = request._request
+    sub = HttpRequest()
+    sub.method = 'GET'
+    sub.path = sub.path_info = path
+    sub.META = {key: value for key, value in outer.META.items() if key not in SKIPPED_META}
+    sub.META.update(REQUEST_METHOD='GET', PATH_INFO=path, QUERY_STRING=query, HTTP_ACCEPT='application/json')
+    sub.GET = QueryDict(query)
+    sub.COOKIES = outer.COOKIES
+    sub.user = request.user
+    if getattr(outer, 'session', None) is not None:
+        sub.session = outer.session
+    if request.user.is_authenticated:
+        # Request из DRF принимает этого пользователя вместо аутентификаторов
+        sub._force_auth_user = request.user
+        sub._force_auth_token = request.auth
+    return sub
+
+
+def run_subrequest(request, item):
+    """Выполнить одну часть пакета: {'id', 'status', 'body'}"""
+    result = {'id': item.get('id'), 'status': status.HTTP_200_OK, 'body': None}
+    if str(item.get('method', 'GET')).upper() != 'GET':
+        result.update(status=status.HTTP_405_METHOD_NOT_ALLOWED, body={'detail': 'В пакете допустимы только GET-запросы'})
+        return result
+    url = urlsplit(item['path'])
+    try:
+        match = resolve(url.path)
+    except Resolver404:
+        match = None
+    if match is None or match.namespace != BATCH_NAMESPACE or match.url_name == BATCH_URL_NAME:
+        result.update(status=status.HTTP_404_NOT_FOUND, body={'detail': 'Маршрут не найден'})
+        return result
+
+    sub = build_subrequest(request, url.path, url.query)
+    sub.resolver_match = match
+    if getattr(settings, 'QUERY_BUDGET_MODE', 'off') == 'off':
+        response = match.func(sub, *match.args, **match.kwargs)
+    else:
+        with QueryRecorder() as recorder:
+            response = match.func(sub, *match.args, **match.kwargs)
+        check_query_budget(recorder, match.view_name, 'GET', f'batch GET {item["path"]}')
+    # Тело части - данные ответа DRF: весь пакет рендерится один раз
+    result.update(status=response.status_code, body=getattr(response, 'data', None))
+    return result
+
+
+def run_batch(request):
+    """Выполнить части пакета по очереди"""
+    items = parse_batch(request.data)
+    # Бюджет запросов проверяется по частям, а не для пакета целиком
+    request._request.query_budget_checked = True
+    return [run_subrequest(request, item) for item in items]
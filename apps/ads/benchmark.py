@@ -0,0 +1,249 @@
+"""
+Бенчмарк основных сценариев платформы.
+
+Сценарий - HTTP-запрос через тестовый клиент Django к заполненной базе.
+Для каждого сценария замеряются задержка (p50/p95) и количество SQL-запросов;
+результат сохраняется в JSON, чтобы сравнивать прогоны между собой.
+По умолчанию кэш отключен (DummyCache): иначе после прогрева сценарии чтения
+измеряли бы попадания в кэш, а не запросы к базе. С cached=True используется
+настроенный кэш - замер теплого кэша.
+Запуск: python manage.py benchmark (см. команду benchmark).
+"""
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+from contextlib import nullcontext
+
+import django
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.users.counters import recount
+from barter_platform.querybudget import QueryRecorder
+
+from .datagen import ITEM_NAMES, generate_data
+from .models import Ad, ExchangeProposal
+
+BENCH_USERNAME = 'bench_user'
+
+DUMMY_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+# Слова для поисковых запросов: названия предметов из генератора данных
+WORDS = [name.lower() for name in ITEM_NAMES if ' ' not in name]
+
+
+def text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def seed_dataset(users=200, ads=5000, proposals=2000, seed=0, batch_size=5000):
+    """Заполнить базу генератором данных; возвращает пользователя бенчмарка"""
+    stats = generate_data(users=users, ads=ads, proposals=proposals, seed=seed, batch_size=batch_size)
+    # Пользователь бенчмарка - самый активный из созданных (первый по закону Ципфа)
+    User.objects.filter(pk=stats['first_user_id']).update(username=BENCH_USERNAME)
+    return User.objects.get(username=BENCH_USERNAME)
+
+
+def percentile(values, p):
+    """Перцентиль с линейной интерполяцией"""
+    values = sorted(values)
+    if not values:
+        return None
+    k = (len(values) - 1) * p / 100
+    low = int(k)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (k - low)
+
+
+class Scenario:
+    """
+    Сценарий бенчмарка.
+
+    request(context, iteration) возвращает (метод, url, данные) для очередной итерации;
+    setup(context, iterations) готовит данные, которые сценарий расходует (например,
+    предложения для принятия).
+    """
+
+    def __init__(self, name, request, api=False, setup=None):
+        self.name = name
+        self.request = request
+        self.api = api
+        self.setup = setup
+
+
+class BenchmarkContext:
+    """Данные и клиенты, общие для всех сценариев"""
+
+    def __init__(self, user, seed=0):
+        self.user = user
+        self.rng = random.Random(seed)
+        self.client = Client()
+        self.client.force_login(user)
+        self.api = APIClient()
+        self.api.force_authenticate(user=user)
+        self.ad_ids = list(Ad.objects.filter(is_active=True).values_list('pk', flat=True)[:1000])
+        self.proposals_to_accept = []
+
+    def random_ad(self):
+        return self.rng.choice(self.ad_ids)
+
+
+def prepare_proposals_to_accept(context, iterations):
+    """Входящие предложения пользователя бенчмарка: по одному на итерацию"""
+    rng = context.rng
+    others = list(User.objects.exclude(pk=context.user.pk).values_list('pk', flat=True)[:iterations * 2])
+    proposals = []
+    for i in range(iterations):
+        sender = rng.choice(others)
+        own, theirs = Ad.objects.bulk_create([
+            Ad(user=context.user, title=f'Бенчмарк обмена {i}', description=text(rng, 20),
+               category='other', condition='good'),
+            Ad(user_id=sender, title=f'Предложение обмена {i}', description=text(rng, 20),
+               category='other', condition='good'),
+        ])
+        proposals.append(ExchangeProposal(
+            ad_sender=theirs, ad_receiver=own, sender_id=sender, receiver=context.user,
+            comment='Бенчмарк', status='pending',
+        ))
+    context.proposals_to_accept = [p.pk for p in ExchangeProposal.objects.bulk_create(proposals)]
+    recount(user_ids=[context.user.pk, *others])
+
+
+def ad_payload(context, iteration):
+    return {
+        'title': f'Новое объявление {iteration}',
+        'description': text(context.rng, 12),
+        'category': 'electronics',
+        'condition': 'new',
+    }
+
+
+SCENARIOS = [
+    Scenario('ad_list', lambda c, i: ('get', '/', None)),
+    Scenario('ad_list_page_10', lambda c, i: ('get', '/', {'page': 10})),
+    Scenario('ad_list_cursor', lambda c, i: ('get', '/', {'cursor': ''})),
+    Scenario('ad_list_search', lambda c, i: ('get', '/', {'query': c.rng.choice(WORDS)})),
+    Scenario('ad_list_filter', lambda c, i: ('get', '/', {'category': 'electronics', 'condition': 'new'})),
+    Scenario('ad_list_search_filter', lambda c, i: (
+        'get', '/', {'query': c.rng.choice(WORDS), 'category': 'books'}
+    )),
+    Scenario('ad_detail', lambda c, i: ('get', f'/{c.random_ad()}/', None)),
+    Scenario('api_ads_list', lambda c, i: ('get', '/api/ads/', None), api=True),
+    Scenario('api_ads_search', lambda c, i: ('get', '/api/ads/', {'search': c.rng.choice(WORDS)}), api=True),
+    Scenario('api_ads_retrieve', lambda c, i: ('get', f'/api/ads/{c.random_ad()}/', None), api=True),
+    Scenario('api_ads_create', lambda c, i: ('post', '/api/ads/', ad_payload(c, i)), api=True),
+    Scenario('api_proposals_sent', lambda c, i: ('get', '/api/proposals/sent/', None), api=True),
+    Scenario('api_proposals_received', lambda c, i: ('get', '/api/proposals/received/', None), api=True),
+    Scenario(
+        'api_proposal_accept',
+        lambda c, i: ('post', f'/api/proposals/{c.proposals_to_accept[i]}/accept/', None),
+        api=True,
+        setup=prepare_proposals_to_accept,
+    ),
+    Scenario('profile', lambda c, i: ('get', '/users/profile/', None)),
+]
+
+
+def run_scenario(scenario, context, iterations, warmup):
+    """Выполнить сценарий; вернуть статистику задержек и запросов"""
+    total = iterations + warmup
+    if scenario.setup:
+        scenario.setup(context, total)
+    client = context.api if scenario.api else context.client
+
+    timings, queries, statuses = [], [], set()
+    for i in range(total):
+        method, url, data = scenario.request(context, i)
+        # Тело запросов к API - JSON: в multipart отсутствующее булево поле (is_active)
+        # DRF читает как False, и созданное объявление было бы неактивным
+        options = {'format': 'json'} if scenario.api and method != 'get' else {}
+        with QueryRecorder() as recorder:
+            start = time.perf_counter()
+            response = getattr(client, method)(url, data or {}, **options)
+            elapsed = time.perf_counter() - start
+        if i < warmup:
+            continue
+        timings.append(elapsed * 1000)
+        queries.append(len(recorder))
+        statuses.add(response.status_code)
+
+    return {
+        'iterations': iterations,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'mean_ms': round(statistics.mean(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'queries_median': statistics.median(queries),
+        'queries_max': max(queries),
+        'status_codes': sorted(statuses),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(scenarios, iterations=30, warmup=3, seed=0, dataset=None, cached=False):
+    """Прогнать сценарии (без кэша или, при cached=True, с настроенным) и собрать результат для JSON"""
+    user = User.objects.get(username=BENCH_USERNAME)
+    context = BenchmarkContext(user, seed=seed)
+    results = {}
+    with nullcontext() if cached else override_settings(CACHES=DUMMY_CACHES):
+        for scenario in scenarios:
+            results[scenario.name] = run_scenario(scenario, context, iterations, warmup)
+    return {
+        'meta': {
+            'timestamp': timezone.now().isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'iterations': iterations,
+            'warmup': warmup,
+            'seed': seed,
+            'cache': 'settings' if cached else 'off',
+            'dataset': dataset or {
+                'users': User.objects.count(),
+                'ads': Ad.objects.count(),
+                'proposals': ExchangeProposal.objects.count(),
+            },
+        },
+        'scenarios': results,
+    }
+
+
+def compare(current, baseline):
+    """Изменение p50/p95 и количества запросов относительно прошлого прогона: {сценарий: {...}}"""
+    diff = {}
+    for name, result in current['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        diff[name] = {
+            'p50_change_pct': round((result['p50_ms'] / previous['p50_ms'] - 1) * 100, 1),
+            'p95_change_pct': round((result['p95_ms'] / previous['p95_ms'] - 1) * 100, 1),
+            'queries_change': result['queries_median'] - previous['queries_median'],
+        }
+    return diff
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_results(results, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,347 @@
+"""
+Массовые операции: создание, частичное изменение и деактивация объявлений в API,
+принятие и отклонение нескольких полученных предложений обмена.
+
+Каждый элемент пакета проверяется AdSerializer отдельно. Прошедшие проверку
+записываются одним bulk_create / bulk_update / UPDATE в одной транзакции,
+остальные возвращаются с ошибками - результат по каждому элементу в порядке
+запроса. Принадлежность объявлений проверяется одним запросом.
+
+Запись идет в обход save() и сигналов, поэтому счетчики профилей, updated_at,
+ключи взаимного обмена (wants.py) и поиска дубликатов (duplicates.py) и кэш
+списков и карточек обновляются здесь явно. Повторные публикации автора
+проверяются сразу для всего пакета одним запросом. Изображения в пакете не
+загружаются (JSON), поле image игнорируется; image_url можно задать.
+
+Предложения обрабатываются иначе - все или ничего (resolve_proposals).
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+
+from apps.users.counters import CounterChanges
+
+from .cache import invalidate_ad_details, invalidate_ad_lists
+from . import tasks
+from .duplicates import batch_duplicate_errors, refresh_duplicate_keys
+from .models import Ad, AdDuplicateKey, AdTradeKey, ExchangeProposal, ProposalConflict
+from .serializers import AdSerializer
+from .wants import refresh_trade_keys
+
+# Верхняя граница размера пакета, что бы ни было в ADS_BULK_MAX_ITEMS
+BULK_HARD_LIMIT = 1000
+
+
+def get_max_items():
+    return min(settings.ADS_BULK_MAX_ITEMS, BULK_HARD_LIMIT)
+
+
+class AdBulkSerializer(AdSerializer):
+    """AdSerializer без загрузки файла изображения"""
+
+    check_duplicates = False
+
+    class Meta(AdSerializer.Meta):
+        fields = [name for name in AdSerializer.Meta.fields if name != 'image']
+
+
+class BulkResult:
+    """Результаты элементов пакета: {'index', 'status', 'id', 'data'} или {'index', 'status', 'errors'}"""
+
+    def __init__(self):
+        self.items = {}
+
+    def ok(self, index, status_code, instance, context):
+        self.items[index] = {
+            'index': index,
+            'status': status_code,
+            'id': instance.pk,
+            'data': AdBulkSerializer(instance, context=context).data,
+        }
+
+    def error(self, index, status_code, errors):
+        self.items[index] = {'index': index, 'status': status_code, 'errors': errors}
+
+    def status_code(self, success_status):
+        """success_status - все элементы успешны, 207 - часть, 400 - ни одного"""
+        failed = sum(1 for item in self.items.values() if 'errors' in item)
+        if not failed:
+            return success_status
+        if failed == len(self.items):
+            return status.HTTP_400_BAD_REQUEST
+        return status.HTTP_207_MULTI_STATUS
+
+    def as_dict(self):
+        results = [self.items[index] for index in sorted(self.items)]
+        failed = sum(1 for item in results if 'errors' in item)
+        return {'results': results, 'succeeded': len(results) - failed, 'failed': failed}
+
+
+def check_batch(items, key=None):
+    """Пакет - непустой список не длиннее ADS_BULK_MAX_ITEMS"""
+    if key is not None:
+        items = items.get(key) if isinstance(items, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ValidationError({key or 'non_field_errors': ['Ожидается непустой список']})
+    if len(items) > get_max_items():
+        raise ValidationError({key or 'non_field_errors': [f'Не больше {get_max_items()} элементов за запрос']})
+    return items
+
+
+def load_own_ads(ids, user, result):
+    """Объявления пользователя по id одним запросом; чужие и несуществующие - в ошибки"""
+    ads = {ad.pk: ad for ad in Ad.objects.filter(pk__in={pk for _, pk in ids})}
+    own = {}
+    for index, pk in ids:
+        ad = ads.get(pk)
+        if ad is None:
+            result.error(index, status.HTTP_404_NOT_FOUND, {'id': ['Объявление не найдено']})
+        elif ad.user_id != user.pk:
+            result.error(index, status.HTTP_403_FORBIDDEN, {'id': ['Это чужое объявление']})
+        else:
+            # Автор уже загружен - сериализатор не будет запрашивать его снова
+            ad.user = user
+            own[index] = ad
+    return own
+
+
+def parse_id(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def bulk_create_ads(items, user, context):
+    """Создать объявления пользователя из списка словарей"""
+    result = BulkResult()
+    ads = {}
+    for index, item in enumerate(check_batch(items)):
+        serializer = AdBulkSerializer(data=item, context=context)
+        if serializer.is_valid():
+            ads[index] = Ad(user=user, **serializer.validated_data)
+        else:
+            result.error(index, status.HTTP_400_BAD_REQUEST, serializer.errors)
+
+    duplicates = batch_duplicate_errors(
+        [(index, ad.title, ad.description) for index, ad in ads.items() if ad.is_active], user.pk
+    )
+    for index, message in duplicates.items():
+        result.error(index, status.HTTP_400_BAD_REQUEST, {'non_field_errors': [message]})
+        del ads[index]
+
+    if ads:
+        counters = CounterChanges()
+        with transaction.atomic():
+            Ad.objects.bulk_create(ads.values(), batch_size=get_max_items())
+            counters.add(user.pk, 'active_ads_count', sum(1 for ad in ads.values() if ad.is_active))
+            counters.apply()
+            wishing = [ad for ad in ads.values() if ad.wanted_categories or ad.wanted_keywords]
+            if wishing:
+                refresh_trade_keys(wishing, replace=False)
+            refresh_duplicate_keys(list(ads.values()), replace=False)
+            invalidate_ad_lists(*{ad.category for ad in ads.values()})
+        active = [ad.pk for ad in ads.values() if ad.is_active]
+        if active:
+            tasks.update_similar_ads.delay(active)
+        for index, ad in ads.items():
+            result.ok(index, status.HTTP_201_CREATED, ad, context)
+    return result
+
+
+def bulk_update_ads(items, user, context):
+    """Частично изменить объявления пользователя: [{'id': 1, 'title': ...}, ...]"""
+    result = BulkResult()
+    ids, seen = [], set()
+    for index, item in enumerate(check_batch(items)):
+        pk = parse_id(item.get('id')) if isinstance(item, dict) else None
+        if pk is None:
+            result.error(index, status.HTTP_400_BAD_REQUEST, {'id': ['Укажите id объявления']})
+        elif pk in seen:
+            result.error(index, status.HTTP_400_BAD_REQUEST, {'id': ['Объявление уже есть в пакете']})
+        else:
+            seen.add(pk)
+            ids.append((index, pk))
+
+    valid = {}
+    for index, ad in load_own_ads(ids, user, result).items():
+        serializer = AdBulkSerializer(ad, data=items[index], partial=True, context=context)
+        if serializer.is_valid():
+            valid[index] = (ad, serializer.validated_data)
+        else:
+            result.error(index, status.HTTP_400_BAD_REQUEST, serializer.errors)
+
+    # Дубликаты проверяются у объявлений, текст которых меняется (их прежний текст не в счет)
+    texts = {}
+    for index, (ad, data) in valid.items():
+        text = (data.get('title', ad.title), data.get('description', ad.description))
+        if data.get('is_active', ad.is_active) and text != (ad.title, ad.description):
+            texts[index] = (ad.pk, *text)
+    duplicates = batch_duplicate_errors(
+        [(index, title, description) for index, (_, title, description) in texts.items()],
+        user.pk, [pk for pk, _, _ in texts.values()],
+    )
+    for index, message in duplicates.items():
+        result.error(index, status.HTTP_400_BAD_REQUEST, {'non_field_errors': [message]})
+        del valid[index]
+
+    changed, fields, categories, rekeyed, retexted = {}, set(), set(), [], []
+    counters = CounterChanges()
+    now = timezone.now()
+    for index, (ad, data) in valid.items():
+        categories.add(ad.category)
+        was_active = ad.is_active
+        for name, value in data.items():
+            setattr(ad, name, value)
+            fields.add(name)
+        if ad.is_active != was_active:
+            counters.add(user.pk, 'active_ads_count', 1 if ad.is_active else -1)
+        ad.updated_at = now
+        categories.add(ad.category)
+        if ad.trade_source() != ad._loaded_trade_source:
+            rekeyed.append(ad)
+        if ad.duplicate_source() != ad._loaded_duplicate_source:
+            retexted.append(ad)
+        changed[index] = ad
+
+    if changed:
+        with transaction.atomic():
+            Ad.objects.bulk_update(changed.values(), [*fields, 'updated_at'], batch_size=get_max_items())
+            counters.apply()
+            if rekeyed:
+                refresh_trade_keys(rekeyed)
+            if retexted:
+                refresh_duplicate_keys(retexted)
+            invalidate_ad_details(*(ad.pk for ad in changed.values()))
+            invalidate_ad_lists(*categories)
+        for index, ad in changed.items():
+            result.ok(index, status.HTTP_200_OK, ad, context)
+    return result
+
+
+def bulk_deactivate_ads(data, user, context):
+    """Деактивировать объявления пользователя: {'ids': [1, 2, 3]}"""
+    result = BulkResult()
+    ids = []
+    for index, value in enumerate(check_batch(data, 'ids')):
+        pk = parse_id(value)
+        if pk is None:
+            result.error(index, status.HTTP_400_BAD_REQUEST, {'id': ['Ожидается id объявления']})
+        else:
+            ids.append((index, pk))
+
+    own = load_own_ads(ids, user, result)
+    active = {ad.pk: ad for ad in own.values() if ad.is_active}
+    if active:
+        now = timezone.now()
+        counters = CounterChanges()
+        with transaction.atomic():
+            # Условие is_active: параллельная деактивация не спишет счетчик дважды
+            deactivated = Ad.objects.filter(pk__in=active, is_active=True).update(is_active=False, updated_at=now)
+            AdTradeKey.objects.filter(ad__in=active).delete()
+            AdDuplicateKey.objects.filter(ad__in=active).delete()
+            counters.add(user.pk, 'active_ads_count', -deactivated)
+            counters.apply()
+            invalidate_ad_details(*active)
+            invalidate_ad_lists(*{ad.category for ad in active.values()})
+        for ad in active.values():
+            ad.is_active, ad.updated_at = False, now
+    # Уже неактивные объявления - тоже успех: результат тот же
+    for index, ad in own.items():
+        result.ok(index, status.HTTP_200_OK, ad, context)
+    return result
+
+
+def load_pending_proposals(ids, user):
+    """
+    Ожидающие предложения, полученные пользователем, одним запросом.
+    
+    Возвращает ({id: предложение}, {id: текст ошибки}).
+    """
+    proposals = ExchangeProposal.objects.filter(
+        Q(sender=user) | Q(receiver=user), pk__in=ids
+    ).select_related('ad_sender', 'ad_receiver')
+    found = {proposal.pk: proposal for proposal in proposals}
+    pending, errors = {}, {}
+    for pk in ids:
+        proposal = found.get(pk)
+        if proposal is None:
+            errors[pk] = 'Предложение не найдено'
+        elif proposal.receiver_id != user.pk:
+            errors[pk] = 'Только получатель может изменить статус предложения'
+        elif proposal.status != 'pending':
+            errors[pk] = 'Предложение уже обработано'
+        else:
+            pending[pk] = proposal
+    return pending, errors
+
+
+def parse_resolve_request(data):
+    """{'accept': id, 'reject': [id, ...]} -> (accept или None, список reject)"""
+    if hasattr(data, 'getlist'):
+        # Данные формы: reject=1&reject=2
+        data = {**data.dict(), 'reject': data.getlist('reject')}
+    if not isinstance(data, dict):
+        raise ValidationError({'non_field_errors': ['Ожидается объект с полями accept и reject']})
+    accept = data.get('accept')
+    if accept is not None:
+        accept = parse_id(accept)
+        if accept is None:
+            raise ValidationError({'accept': ['Ожидается id предложения']})
+    reject = data.get('reject', [])
+    if reject or accept is None:
+        reject = check_batch(data, 'reject')
+    ids = [parse_id(value) for value in reject]
+    if None in ids:
+        raise ValidationError({'reject': ['Ожидается список id предложений']})
+    return accept, ids
+
+
+def resolve_proposals(user, accept=None, reject=()):
+    """
+    Принять предложение accept (id или None) и отклонить предложения reject одной транзакцией.
+    
+    Проверка - одним запросом, отклонение - одним UPDATE. Если хоть одно
+    предложение нельзя обработать, ничего не меняется: ошибки возвращаются
+    как {id: текст}. Если предложения успели обработать параллельно -
+    ProposalConflict. Возвращает (принятое предложение или None, отклоненные
+    предложения, число отклоненных конкурирующих предложений, ошибки).
+    """
+    reject = list(dict.fromkeys(reject))
+    if accept in reject:
+        return None, [], 0, {accept: 'Предложение нельзя одновременно принять и отклонить'}
+    pending, errors = load_pending_proposals([*reject, *([accept] if accept is not None else [])], user)
+    if errors:
+        return None, [], 0, errors
+
+    rejected = [pending[pk] for pk in reject]
+    accepted = pending.get(accept)
+    competing = 0
+    now = timezone.now()
+    with transaction.atomic():
+        if rejected:
+            # Условие status='pending': параллельно обработанные предложения не перезаписываются
+            updated = ExchangeProposal.objects.filter(
+                pk__in=reject, receiver=user, status='pending'
+            ).update(status='rejected', updated_at=now)
+            if updated != len(rejected):
+                raise ProposalConflict('Часть предложений уже обработана')
+            counters = CounterChanges()
+            for proposal in rejected:
+                counters.change_proposal_status('pending', 'rejected', proposal.sender_id, proposal.receiver_id)
+            counters.apply()
+        if accepted is not None:
+            # Конфликт при принятии откатывает и отклонение
+            competing = accepted.accept()
+
+    for proposal in rejected:
+        proposal.status = proposal._loaded_status = 'rejected'
+        proposal.updated_at = now
+    if rejected:
+        tasks.send_notifications.delay([proposal.sender_notification() for proposal in rejected])
+    return accepted, rejected, competing, {}
@@ -0,0 +1,198 @@
+"""
+Кэширование списков и карточек объявлений.
+
+Списки (страницы AdListView и ответы API) кэшируются по нормализованным
+параметрам. Ключ содержит версию категории: список с фильтром по категории
+зависит от версии этой категории, список без фильтра - от общей версии. При
+изменении объявления (сигналы и методы моделей в apps.ads.models) версии его
+категории и общая версия увеличиваются, и старые записи просто перестают
+читаться - удалять их не нужно, они истекают по таймауту. Карточка объявления
+кэшируется по id и удаляется из кэша при изменении объявления. Списки и карточки
+показывают имя автора (API - и email), поэтому их смена (touch_author_ads) сбрасывает
+общую версию и карточки всех объявлений автора. Списки похожих
+объявлений (apps/ads/similar.py) кэшируются по id и сбрасываются при их
+пересчете: для одного объявления - удалением, полный пересчет - сменой версии.
+
+Сброс выполняется после коммита транзакции: иначе параллельный запрос мог бы
+закэшировать данные, которые еще не видны.
+
+Значения читаются через get_or_refresh: у записи есть мягкий срок жизни, после
+которого ее пересчитывает один процесс (блокировка через cache.add), а
+остальные до жесткого срока отдают устаревшее значение. Так истечение
+популярного ключа не приводит к одновременному пересчету во всех воркерах.
+cache.add атомарен и в LocMemCache, и в Redis (SET NX).
+"""
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+LIST_CACHE_PREFIX = 'ads:list'
+DETAIL_CACHE_PREFIX = 'ads:detail'
+SIMILAR_CACHE_PREFIX = 'ads:similar'
+# Версия списков без фильтра по категории
+ALL_CATEGORIES = '*'
+# Пауза между проверками кэша, пока значение считает другой процесс
+WAIT_INTERVAL = 0.05
+# Поля автора, которые показывают закэшированные страницы: хэш пароля, email и
+# флаги доступа в общий кэш не попадают
+CACHED_AUTHOR_FIELDS = ('username',)
+
+
+def version_key(category):
+    return f'{LIST_CACHE_PREFIX}:version:{category or ALL_CATEGORIES}'
+
+
+def initial_version():
+    # Версия от времени: после вытеснения ключа версии старые страницы не оживут
+    return time.time_ns() // 1000
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, initial_version(), timeout=None)
+        version = cache.get(key, 0)
+    return version
+
+
+def bump_versions(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, initial_version(), timeout=None)
+
+
+def get_list_version(category=None):
+    """Текущая версия списков категории (без категории - общая)"""
+    return get_version(version_key(category))
+
+
+def bump_list_versions(categories):
+    keys = {version_key(category) for category in categories}
+    keys.add(version_key(None))
+    bump_versions(keys)
+
+
+def invalidate_ad_lists(*categories):
+    """
+    Сбросить кэш списков для категорий после коммита.
+
+    Без аргументов сбрасываются списки всех категорий.
+    """
+    from .models import Ad
+
+    categories = [category for category in categories if category] or [
+        value for value, _ in Ad.CATEGORY_CHOICES
+    ]
+    transaction.on_commit(lambda: bump_list_versions(categories))
+
+
+def invalidate_ad_details(*pks):
+    """Удалить карточки объявлений из кэша после коммита"""
+    keys = [detail_cache_key(pk) for pk in pks]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_similar(*pks):
+    """Сбросить кэш похожих объявлений после коммита; без аргументов - всех"""
+    if pks:
+        transaction.on_commit(lambda: cache.delete_many([similar_cache_key(pk) for pk in pks]))
+    else:
+        transaction.on_commit(lambda: bump_versions([f'{SIMILAR_CACHE_PREFIX}:version']))
+
+
+def cacheable_ads(queryset):
+    """Объявления с автором для кэша: у автора загружаются только id и CACHED_AUTHOR_FIELDS"""
+    fields = [field.name for field in queryset.model._meta.concrete_fields]
+    return queryset.select_related('user').only(*fields, *(f'user__{name}' for name in CACHED_AUTHOR_FIELDS))
+
+
+def list_cache_key(namespace, category, *parts):
+    """
+    Ключ списка: версия категории + хэш параметров.
+
+    Неизвестная категория (параметр запроса) использует общую версию, чтобы
+    произвольные значения не создавали новых ключей версий.
+    """
+    from .models import Ad
+
+    if category not in dict(Ad.CATEGORY_CHOICES):
+        category = None
+    version = get_list_version(category)
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f'{LIST_CACHE_PREFIX}:{namespace}:{version}:{digest}'
+
+
+def detail_cache_key(pk):
+    return f'{DETAIL_CACHE_PREFIX}:{pk}'
+
+
+def similar_cache_key(pk):
+    return f'{SIMILAR_CACHE_PREFIX}:{get_version(f"{SIMILAR_CACHE_PREFIX}:version")}:{pk}'
+
+
+def get_or_refresh(key, build, soft_ttl=None, hard_ttl=None, lock_timeout=None):
+    """
+    Значение из кэша с мягким и жестким сроком жизни и одним пересчетом.
+
+    - запись моложе soft_ttl отдается сразу;
+    - запись старше soft_ttl (но еще в кэше, то есть моложе hard_ttl) пересчитывает
+      процесс, взявший блокировку; остальные в это время отдают устаревшее значение;
+    - записи нет - считает взявший блокировку, остальные ждут его результата не
+      дольше lock_timeout, после чего считают сами.
+
+    build() не должен возвращать None: None означает отсутствие записи.
+    """
+    soft_ttl = settings.ADS_CACHE_SOFT_TTL if soft_ttl is None else soft_ttl
+    hard_ttl = settings.ADS_CACHE_HARD_TTL if hard_ttl is None else hard_ttl
+    lock_timeout = settings.ADS_CACHE_LOCK_TIMEOUT if lock_timeout is None else lock_timeout
+
+    entry = cache.get(key)
+    if entry is not None:
+        fresh_until, value = entry
+        if time.time() < fresh_until:
+            return value
+        with CacheLock(key, lock_timeout) as locked:
+            if locked:
+                return refresh(key, build, soft_ttl, hard_ttl)
+        return value
+
+    deadline = time.monotonic() + lock_timeout
+    while True:
+        with CacheLock(key, lock_timeout) as locked:
+            if locked or time.monotonic() >= deadline:
+                return refresh(key, build, soft_ttl, hard_ttl)
+        time.sleep(WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[1]
+
+
+def refresh(key, build, soft_ttl, hard_ttl):
+    value = build()
+    cache.set(key, (time.time() + soft_ttl, value), max(hard_ttl, soft_ttl))
+    return value
+
+
+class CacheLock:
+    """Блокировка пересчета ключа через cache.add; with CacheLock(key, timeout) as locked"""
+
+    def __init__(self, key, timeout):
+        self.key = f'{key}:lock'
+        self.timeout = timeout
+        self.token = uuid.uuid4().hex
+        self.locked = False
+
+    def __enter__(self):
+        self.locked = cache.add(self.key, self.token, self.timeout)
+        return self.locked
+
+    def __exit__(self, *exc_info):
+        # Не снимаем чужую блокировку, если наша истекла во время пересчета
+        if self.locked and cache.get(self.key) == self.token:
+            cache.delete(self.key)
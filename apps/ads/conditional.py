@@ -0,0 +1,119 @@
+"""
+Условные HTTP-запросы: ETag и Last-Modified.
+
+Валидаторы считаются одним агрегатным запросом до формирования ответа: для
+списка - наибольший updated_at и количество строк после фильтров, для объекта -
+его updated_at (и updated_at связанных объектов, которые попадают в ответ).
+Если клиент прислал совпадающий If-None-Match или If-Modified-Since, сразу
+возвращается 304 - без сериализации, рендеринга шаблона и кэша.
+
+Любое изменение строки увеличивает updated_at (в том числе update() при обмене
+и обработке изображения), удаление и деактивация меняют количество, поэтому
+пара (max(updated_at), count) меняется вместе с содержимым списка. Имя и email
+автора тоже входят в ответ: при их смене updated_at всех объявлений автора
+сдвигается (touch_author_ads в apps/ads/models.py).
+Keyset-страницы (?cursor=) отдаются без валидаторов.
+"""
+import hashlib
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Count, Max, Subquery
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from .cache import get_or_refresh
+from .pagination import CURSOR_PARAM
+
+
+def aggregate_validators(queryset, fields=('updated_at',)):
+    """(наибольшее значение среди полей fields, количество строк) одним запросом"""
+    aggregates = {f'last_{i}': Max(field) for i, field in enumerate(fields)}
+    values = queryset.order_by().aggregate(count=Count('pk'), **aggregates)
+    count = values.pop('count')
+    return max(filter(None, values.values()), default=None), count
+
+
+def grouped_aggregate(queryset, group_field, expression):
+    """Подзапрос с агрегатом по queryset, все строки которого имеют одно значение group_field"""
+    return Subquery(
+        queryset.order_by().values(group_field).annotate(value=expression).values('value')
+    )
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def conditional_response(request, etag, last_modified, respond, private=False):
+    """
+    Ответ 304, если валидаторы клиента совпали, иначе respond().
+
+    Ответ получает заголовки ETag, Last-Modified и Cache-Control: no-cache
+    (клиент хранит копию, но перед использованием проверяет ее).
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = respond()
+    if response.status_code in (200, 304):
+        response.headers.setdefault('ETag', etag)
+        if timestamp is not None:
+            response.headers.setdefault('Last-Modified', http_date(timestamp))
+        if private:
+            patch_cache_control(response, no_cache=True, private=True)
+        else:
+            patch_cache_control(response, no_cache=True)
+    return response
+
+
+class ConditionalMixin:
+    """ETag и Last-Modified для действий чтения ViewSet'а"""
+    # Поля с датой изменения, от которых зависит представление объекта
+    validator_fields = ('updated_at',)
+    # Ответ зависит от пользователя: его id входит в ETag, кэш браузера - private
+    private_validators = False
+
+    def conditional(self, request, queryset, respond, detail=False, private=None, cache_key=None):
+        """
+        Ответ списка (или одного объекта при detail=True) с проверкой валидаторов.
+
+        cache_key - ключ кэша для валидаторов, если сам ответ тоже кэшируется
+        (с той же версией, apps/ads/cache.py): тогда повторный запрос обходится без БД.
+        """
+        if not detail and CURSOR_PARAM in request.query_params:
+            # Keyset-страницы нужны, чтобы не считать весь список; агрегат по
+            # всему списку свел бы это на нет, поэтому они идут без валидаторов
+            return respond()
+        if private is None:
+            private = self.private_validators
+        compute = lambda: aggregate_validators(queryset, self.validator_fields)
+        last_modified, count = get_or_refresh(cache_key, compute) if cache_key else compute()
+        if detail and not count:
+            # Объекта нет (или он недоступен) - обычный ответ 404
+            return respond()
+        etag = make_etag(
+            request.build_absolute_uri(request.path),
+            sorted(request.query_params.lists()),
+            request.accepted_media_type,
+            request.user.pk if private else None,
+            last_modified.isoformat() if last_modified else None,
+            count,
+        )
+        return conditional_response(request, etag, last_modified, respond, private=private)
+
+    def conditional_retrieve(self, request, respond):
+        """Ответ retrieve: валидаторы по объекту из lookup URL; несуществующий - как обычно (404)"""
+        lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        try:
+            queryset = self.get_queryset().filter(**{self.lookup_field: lookup})
+        except (TypeError, ValueError, DjangoValidationError):
+            return respond()
+        return self.conditional(request, queryset, respond, detail=True)
+
+    def paginated_response(self, queryset):
+        """Ответ со страницей queryset (как в ListModelMixin.list, без фильтров)"""
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(queryset, many=True).data)
@@ -0,0 +1,280 @@
+"""
+Поиск цепочных обменов (циклов) в графе ожидающих предложений.
+
+Вершины графа - активные объявления, ребро ad_sender -> ad_receiver - ожидающее
+предложение: владелец ad_sender отдает его за ad_receiver. Простой цикл
+a -> b -> c -> a означает обмен, в котором каждый отдает предложенное и
+получает то, что просил. Ищутся циклы длиной от 3 (пара встречных предложений -
+обычный обмен) до TRADE_CYCLE_MAX_LENGTH.
+
+Перебор - поиск в глубину с ограничением длины: каждый цикл находится один
+раз, из своей наименьшей вершины, а обратный обход в ширину заранее дает
+расстояние до нее, и ветви, из которых цикл не замкнуть в оставшиеся шаги,
+отсекаются. Работа зависит от окрестностей вершин радиуса max_length, а не от
+размера графа, поэтому полный перебор на сотнях тысяч ребер укладывается в
+секунды (см. benchmark_cycles и команду find_trade_cycles --benchmark).
+
+Новые предложения обрабатываются инкрементально (задача match_trade_cycles):
+цикл через новое ребро u -> v - это путь v -> u, поэтому из базы читается только
+окрестность: половина глубины вперед от v и половина назад от u, по запросу на
+уровень.
+"""
+import random
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Q
+
+from .conditional import grouped_aggregate
+from .models import ExchangeProposal, TradeCycle
+
+MIN_CYCLE_LENGTH = 3
+# Верхняя граница длины цикла, что бы ни было в TRADE_CYCLE_MAX_LENGTH: число
+# циклов растет с длиной экспоненциально, а длинные цепочки не договариваются
+MAX_CYCLE_LENGTH = 8
+# Сколько циклов сохраняется для одного нового предложения (вокруг популярных объявлений их тысячи)
+MAX_CYCLES_PER_PROPOSAL = 100
+BATCH_SIZE = 500
+
+# Предложение - ребро графа, пока оно ожидает ответа и оба объявления активны
+LIVE_PROPOSAL_FIELDS = {'status': 'pending', 'ad_sender__is_active': True, 'ad_receiver__is_active': True}
+
+
+def get_max_length():
+    return max(MIN_CYCLE_LENGTH, min(settings.TRADE_CYCLE_MAX_LENGTH, MAX_CYCLE_LENGTH))
+
+
+def build_graph(edges):
+    """(id ребра, u, v) -> списки смежности: {u: [(v, id)]} и обратный {v: [u]}"""
+    succ, pred = defaultdict(list), defaultdict(list)
+    for edge_id, u, v in edges:
+        if u != v:
+            succ[u].append((v, edge_id))
+            pred[v].append(u)
+    return succ, pred
+
+
+def distances_to(pred, target, max_depth, floor=None):
+    """Длины кратчайших путей до target (не длиннее max_depth) через вершины больше floor"""
+    dist = {target: 0}
+    frontier = [target]
+    for depth in range(1, max_depth + 1):
+        following = []
+        for node in frontier:
+            for previous in pred.get(node, ()):
+                if previous not in dist and (floor is None or previous > floor):
+                    dist[previous] = depth
+                    following.append(previous)
+        if not following:
+            break
+        frontier = following
+    return dist
+
+
+def walk(succ, source, target, dist, max_edges, min_edges=1, limit=None):
+    """
+    Простые пути source -> target из min_edges..max_edges ребер (кортежи id ребер).
+
+    Вершины пути - только из dist (расстояние до target); ветвь обрывается, если
+    target из нее не достичь за оставшиеся шаги. source == target - циклы.
+    """
+    paths = []
+    path, on_path = [], {source}
+    stack = [iter(succ.get(source, ()))]
+    nodes = [source]
+    while stack:
+        for node, edge_id in stack[-1]:
+            if node == target:
+                if len(path) + 1 >= min_edges:
+                    paths.append((*path, edge_id))
+                    if limit is not None and len(paths) >= limit:
+                        return paths
+                continue
+            remaining = dist.get(node)
+            if remaining is None or node in on_path or len(path) + 1 + remaining > max_edges:
+                continue
+            path.append(edge_id)
+            on_path.add(node)
+            nodes.append(node)
+            stack.append(iter(succ.get(node, ())))
+            break
+        else:
+            stack.pop()
+            if path:
+                path.pop()
+                on_path.discard(nodes.pop())
+    return paths
+
+
+def find_cycles(edges, max_length, min_length=MIN_CYCLE_LENGTH, limit=None):
+    """
+    Простые циклы длиной min_length..max_length в ориентированном графе.
+
+    edges - (id ребра, u, v); вершины должны быть сравнимы. Возвращает кортежи
+    id ребер в порядке обхода, каждый цикл - один раз (от наименьшей вершины).
+    """
+    succ, pred = build_graph(edges)
+    cycles = []
+    # В цикл входят только вершины и с входящими, и с исходящими ребрами
+    for start in sorted(node for node in succ if node in pred):
+        dist = distances_to(pred, start, max_length - 1, floor=start)
+        if len(dist) < min_length:
+            continue
+        left = None if limit is None else limit - len(cycles)
+        cycles += walk(succ, start, start, dist, max_length, min_length, limit=left)
+        if limit is not None and len(cycles) >= limit:
+            break
+    return cycles
+
+
+def signature(cycle):
+    return '-'.join(str(pk) for pk in sorted(cycle))
+
+
+def live_edges():
+    """Ребра графа: (id, ad_sender_id, ad_receiver_id) живых предложений"""
+    return ExchangeProposal.objects.filter(**LIVE_PROPOSAL_FIELDS).values_list('pk', 'ad_sender_id', 'ad_receiver_id')
+
+
+def local_edges(ad_sender_id, ad_receiver_id, max_length):
+    """
+    Ребра, через которые может пройти путь ad_receiver -> ad_sender длиной до max_length - 1.
+
+    Обход в ширину вперед от ad_receiver и назад от ad_sender на половину
+    глубины каждый; любое ребро такого пути попадает хотя бы в один из них.
+    """
+    forward_depth = (max_length - 1) // 2
+    edges = {}
+    for field, start, depth in (
+        ('ad_sender', ad_receiver_id, forward_depth),
+        ('ad_receiver', ad_sender_id, max_length - 1 - forward_depth),
+    ):
+        found = False
+        seen = frontier = {start}
+        for _ in range(depth):
+            rows = live_edges().filter(**{f'{field}__in': frontier})
+            frontier = set()
+            for row in rows:
+                found = True
+                edges[row[0]] = row
+                node = row[2] if field == 'ad_sender' else row[1]
+                if node not in seen:
+                    frontier.add(node)
+            if not frontier:
+                break
+            seen = seen | frontier
+        if not found:
+            # Из ad_receiver никуда не уйти (или в ad_sender ниоткуда не прийти) - циклов нет
+            return []
+    return edges.values()
+
+
+def match_proposal(proposal_id, ad_sender_id, ad_receiver_id, max_length=None):
+    """Сохранить циклы через предложение proposal_id; возвращает число найденных циклов"""
+    max_length = max_length or get_max_length()
+    succ, pred = build_graph(local_edges(ad_sender_id, ad_receiver_id, max_length))
+    dist = distances_to(pred, ad_sender_id, max_length - 1)
+    if ad_receiver_id not in dist:
+        return 0
+    paths = walk(
+        succ, ad_receiver_id, ad_sender_id, dist, max_length - 1, MIN_CYCLE_LENGTH - 1,
+        limit=MAX_CYCLES_PER_PROPOSAL,
+    )
+    cycles = [(proposal_id, *path) for path in paths]
+    save_cycles(cycles)
+    return len(cycles)
+
+
+def save_cycles(cycles):
+    """Сохранить циклы (кортежи id предложений), которых еще нет; возвращает число новых"""
+    links = TradeCycle.proposals.through
+    by_signature = {signature(cycle): cycle for cycle in cycles}
+    names = list(by_signature)
+    created = 0
+    for i in range(0, len(names), BATCH_SIZE):
+        batch = names[i:i + BATCH_SIZE]
+        with transaction.atomic():
+            existing = set(TradeCycle.objects.filter(signature__in=batch).values_list('signature', flat=True))
+            new = [name for name in batch if name not in existing]
+            if not new:
+                continue
+            TradeCycle.objects.bulk_create(
+                [TradeCycle(signature=name, length=len(by_signature[name])) for name in new],
+                ignore_conflicts=True,
+            )
+            # bulk_create с ignore_conflicts не возвращает id - читаем их по подписи
+            ids = TradeCycle.objects.filter(signature__in=new).values_list('signature', 'pk')
+            links.objects.bulk_create([
+                links(tradecycle_id=cycle_id, exchangeproposal_id=proposal_id)
+                for name, cycle_id in ids
+                for proposal_id in by_signature[name]
+            ], ignore_conflicts=True)
+            created += len(new)
+    return created
+
+
+def live_cycles():
+    """Циклы, все предложения которых ожидают ответа, а объявления активны"""
+    live = TradeCycle.proposals.through.objects.filter(
+        tradecycle=OuterRef('pk'), **{f'exchangeproposal__{key}': value for key, value in LIVE_PROPOSAL_FIELDS.items()}
+    )
+    # Удаленное предложение уносит свою связь с циклом, поэтому сравниваем с длиной цикла
+    return TradeCycle.objects.alias(
+        live_count=grouped_aggregate(live, 'tradecycle', Count('pk')),
+    ).filter(live_count=F('length'))
+
+
+def user_cycles(user):
+    """Живые циклы, в которых участвует пользователь"""
+    links = TradeCycle.proposals.through.objects.filter(tradecycle=OuterRef('pk'))
+    return live_cycles().filter(Exists(
+        links.filter(Q(exchangeproposal__sender=user) | Q(exchangeproposal__receiver=user))
+    ))
+
+
+def rebuild_cycles(max_length=None, limit=None):
+    """
+    Полный пересчет: удалить устаревшие циклы и сохранить все найденные.
+
+    Возвращает словарь: edges, found, created, deleted, seconds.
+    """
+    max_length = max_length or get_max_length()
+    started = time.perf_counter()
+    deleted, _ = TradeCycle.objects.exclude(pk__in=live_cycles().values('pk')).delete()
+    edges = list(live_edges().iterator(chunk_size=10000))
+    cycles = find_cycles(edges, max_length, limit=limit)
+    created = save_cycles(cycles)
+    return {
+        'edges': len(edges),
+        'found': len(cycles),
+        'created': created,
+        'deleted': deleted,
+        'seconds': time.perf_counter() - started,
+    }
+
+
+def generate_graph(nodes, edges, seed=0):
+    """Случайный граф предложений для бенчмарка: (id, u, v) без петель и повторов"""
+    rng = random.Random(seed)
+    pairs = set()
+    while len(pairs) < edges:
+        u, v = rng.randrange(nodes), rng.randrange(nodes)
+        if u != v:
+            pairs.add((u, v))
+    return [(i, u, v) for i, (u, v) in enumerate(pairs)]
+
+
+def benchmark_cycles(nodes, edges, max_length, seed=0, limit=None):
+    """Время полного перебора циклов на случайном графе"""
+    graph = generate_graph(nodes, edges, seed)
+    started = time.perf_counter()
+    cycles = find_cycles(graph, max_length, limit=limit)
+    return {
+        'nodes': nodes,
+        'edges': edges,
+        'max_length': max_length,
+        'cycles': len(cycles),
+        'seconds': time.perf_counter() - started,
+    }
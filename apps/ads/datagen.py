@@ -0,0 +1,528 @@
+"""
+Генератор синтетических данных для нагрузочного тестирования.
+
+Создает пользователей с профилями, объявления и предложения обмена с
+правдоподобными распределениями:
+
+- активность пользователей неравномерна (закон Ципфа): немногие пользователи
+  публикуют большую часть объявлений;
+- категории, состояния и города встречаются с разной частотой;
+- статусы предложений - смесь ожидающих, принятых и отклоненных; принятое
+  предложение снимает с публикации оба объявления, а ожидающие предложения по
+  ним отклоняются, как при ExchangeProposal.accept();
+- заголовки и описания на русском языке собираются из шаблонов по категориям;
+  пожелание обмена (категория и предмет из нее) записывается и в описание, и в
+  wanted_categories / wanted_keywords, а ключи взаимного обмена (wants.py) и
+  поиска дубликатов (duplicates.py) пишутся вместе с объявлениями.
+
+Результат детерминирован: одинаковые параметры и seed дают одинаковые данные,
+включая даты - период публикации заканчивается в DEFAULT_END (или в end).
+Записи создаются пачками многострочным INSERT (RawInsertWriter), в PostgreSQL - через COPY.
+Первичные ключи назначает генератор, поэтому связи между таблицами не требуют
+чтения из базы, а счетчики профилей считаются заранее (recount не нужен).
+Сигналы моделей не вызываются: фоновые задачи и уведомления не создаются.
+"""
+import io
+import json
+import random
+import time
+from array import array
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from django.db.models import Max
+
+from apps.users.models import UserProfile
+
+from .cache import invalidate_ad_lists
+from .duplicates import build_keys as build_duplicate_keys
+from .models import Ad, AdDuplicateKey, AdTradeKey, ExchangeProposal
+from .wants import build_keys
+
+DEFAULT_PASSWORD = 'password123'
+
+# Показатель закона Ципфа для активности пользователей и популярности городов
+ACTIVITY_SKEW = 1.1
+
+# Конец периода публикации по умолчанию: даты не зависят от дня запуска, и один
+# seed дает одни и те же created_at/updated_at
+DEFAULT_END = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+# Доля объявлений, снятых с публикации владельцем (без обмена)
+INACTIVE_SHARE = 0.08
+
+# Статус предложения до проверки согласованности с объявлениями
+STATUS_WEIGHTS = {'pending': 45, 'accepted': 20, 'rejected': 35}
+STATUSES = ('pending', 'accepted', 'rejected')
+
+CATEGORY_WEIGHTS = {
+    'electronics': 22, 'clothing': 18, 'home': 14, 'sports': 10, 'books': 9,
+    'toys': 8, 'auto': 6, 'beauty': 6, 'other': 7,
+}
+CONDITION_WEIGHTS = {'new': 15, 'like_new': 30, 'good': 40, 'fair': 15}
+
+# Предметы и бренды (для книг - авторы) по категориям
+ITEMS = {
+    'electronics': (
+        ['Смартфон', 'Ноутбук', 'Планшет', 'Наушники', 'Фотоаппарат', 'Игровая приставка',
+         'Монитор', 'Умные часы', 'Портативная колонка', 'Электронная книга'],
+        ['Samsung', 'Apple', 'Xiaomi', 'Sony', 'Lenovo', 'Huawei', 'Asus', 'Canon', 'Nikon', 'JBL'],
+    ),
+    'clothing': (
+        ['Куртка', 'Пальто', 'Кроссовки', 'Джинсы', 'Платье', 'Свитер', 'Ботинки', 'Пуховик',
+         'Рубашка', 'Сапоги'],
+        ['Zara', 'Nike', 'Adidas', 'Puma', 'Reebok', "Levi's", 'Mango', 'Uniqlo'],
+    ),
+    'home': (
+        ['Кофемашина', 'Пылесос', 'Микроволновка', 'Настольная лампа', 'Набор посуды', 'Блендер',
+         'Утюг', 'Чайник', 'Газонокосилка', 'Кресло'],
+        ['Bosch', 'Philips', 'DeLonghi', 'Tefal', 'Redmond', 'IKEA', 'Braun'],
+    ),
+    'sports': (
+        ['Велосипед', 'Самокат', 'Палатка', 'Гантели', 'Лыжи', 'Сноуборд', 'Беговая дорожка',
+         'Туристический рюкзак', 'Ролики', 'Теннисная ракетка'],
+        ['Stels', 'Forward', 'Decathlon', 'Salomon', 'Head', 'Wilson', 'Nordway'],
+    ),
+    'books': (
+        ['Книга', 'Собрание сочинений', 'Сборник рассказов', 'Роман', 'Биография', 'Подарочное издание'],
+        ['Толстого', 'Достоевского', 'Чехова', 'Пушкина', 'Булгакова', 'Стругацких', 'Пелевина'],
+    ),
+    'toys': (
+        ['Конструктор', 'Кукла', 'Настольная игра', 'Радиоуправляемая машина', 'Пазл',
+         'Мягкая игрушка', 'Железная дорога', 'Детский самокат'],
+        ['LEGO', 'Hasbro', 'Mattel', 'Playmobil', 'Hot Wheels'],
+    ),
+    'auto': (
+        ['Зимние шины', 'Автокресло', 'Видеорегистратор', 'Автомагнитола', 'Багажник на крышу',
+         'Компрессор', 'Набор инструментов', 'Литые диски'],
+        ['Michelin', 'Nokian', 'Bosch', 'Pioneer', 'Thule', 'Continental'],
+    ),
+    'beauty': (
+        ['Фен', 'Плойка', 'Электробритва', 'Набор косметики', 'Парфюм', 'Массажер', 'Эпилятор',
+         'Электрическая зубная щетка'],
+        ['Philips', 'Braun', 'Dyson', 'Rowenta', 'Oral-B', 'Babyliss'],
+    ),
+    'other': (
+        ['Гитара', 'Картина', 'Швейная машинка', 'Синтезатор', 'Коллекция марок', 'Аквариум',
+         'Виниловые пластинки', 'Микроскоп'],
+        ['Yamaha', 'Casio', 'Singer', 'Fender', 'Levenhuk'],
+    ),
+}
+
+CONDITION_PHRASES = {
+    'new': ['Вещь новая, в упаковке.', 'Не использовалась, остались бирки и чек.'],
+    'like_new': ['Пользовались пару раз, состояние как у нового.', 'Без царапин и потертостей.'],
+    'good': ['Есть небольшие следы использования, все работает.', 'Состояние хорошее, без серьезных дефектов.'],
+    'fair': ['Заметны следы использования, но все исправно.', 'Состояние среднее, подойдет на дачу.'],
+}
+REASON_PHRASES = [
+    'Отдаю, потому что переезжаю.', 'Купили новое, это больше не нужно.',
+    'Освобождаю место в квартире.', 'Подарили, но не пригодилось.', 'Пользовался недолго, не подошло.',
+]
+LOGISTICS_PHRASES = [
+    'Самовывоз, г. {city}.', 'Могу отправить почтой или курьером.', 'Встреча в центре, г. {city}.',
+    'Возможна доставка по городу {city}.',
+]
+COMMENT_PHRASES = [
+    'Здравствуйте! Предлагаю обмен.', 'Добрый день, заинтересовало ваше объявление.',
+    'Вещь в хорошем состоянии, могу показать.', 'Могу добавить к обмену аксессуары.',
+    'Удобно встретиться на выходных.', 'Давно ищу такую вещь, предлагаю свою.',
+]
+
+MALE_NAMES = ['Александр', 'Дмитрий', 'Максим', 'Сергей', 'Андрей', 'Алексей', 'Иван', 'Михаил', 'Николай', 'Егор']
+FEMALE_NAMES = ['Анна', 'Мария', 'Елена', 'Ольга', 'Наталья', 'Екатерина', 'Татьяна', 'Дарья', 'Ирина', 'Светлана']
+SURNAMES = [
+    'Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов',
+    'Новиков', 'Федоров', 'Морозов', 'Волков', 'Лебедев', 'Козлов',
+]
+CITIES = [
+    'Москва', 'Санкт-Петербург', 'Новосибирск', 'Екатеринбург', 'Казань', 'Нижний Новгород',
+    'Челябинск', 'Самара', 'Омск', 'Ростов-на-Дону', 'Уфа', 'Краснодар', 'Воронеж', 'Пермь',
+]
+
+CATEGORY_LABELS = dict(Ad.CATEGORY_CHOICES)
+
+# Все названия предметов: слова для поисковых запросов в бенчмарке
+ITEM_NAMES = sorted({name for names, _ in ITEMS.values() for name in names})
+
+
+def zipf_weights(n, skew=ACTIVITY_SKEW):
+    """Накопленные веса закона Ципфа для n элементов (для random.choices)"""
+    return list(accumulate(1 / (rank ** skew) for rank in range(1, n + 1)))
+
+
+class RawInsertWriter:
+    """
+    Запись пачек объектов многострочным INSERT (любая СУБД).
+
+    Пачка пишется через QuerySet._insert - им же bulk_create пишет каждую свою
+    пачку, - но с raw=True, как при loaddata: значения берутся из объектов без
+    pre_save, поэтому auto_now/auto_now_add не заменяют даты, заданные
+    генератором. Внутренний API здесь допустим: генератор заполняет тестовые базы
+    в обход моделей (без сигналов, как и COPY), а вставку после обновления Django
+    проверяет DataGeneratorTest.
+    """
+
+    def __init__(self, using='default'):
+        self.using = using
+
+    def write(self, model, objects):
+        fields = model._meta.concrete_fields
+        if objects and objects[0].pk is None:
+            fields = [field for field in fields if not field.primary_key]
+        queryset = model.objects.using(self.using)
+        size = max(connections[self.using].ops.bulk_batch_size(fields, objects), 1)
+        for start in range(0, len(objects), size):
+            queryset._insert(objects[start:start + size], fields=fields, raw=True, using=self.using)
+
+    def finish(self, models):
+        """Сдвинуть последовательности первичных ключей после явной вставки id"""
+        connection = connections[self.using]
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+
+
+class CopyWriter(RawInsertWriter):
+    """Запись пачек объектов через COPY FROM STDIN (PostgreSQL, psycopg2 и psycopg 3)"""
+
+    @staticmethod
+    def format_value(value):
+        if value is None:
+            return '\\N'
+        if isinstance(value, bool):
+            return 't' if value else 'f'
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value, ensure_ascii=False)
+        elif hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        else:
+            value = str(value)
+        return (
+            value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+        )
+
+    def write(self, model, objects):
+        fields = model._meta.concrete_fields
+        if objects and objects[0].pk is None:
+            # Первичный ключ назначит база
+            fields = [field for field in fields if not field.primary_key]
+        connection = connections[self.using]
+        qn = connection.ops.quote_name
+        buffer = io.StringIO()
+        for obj in objects:
+            buffer.write('\t'.join(
+                self.format_value(field.get_prep_value(field.value_from_object(obj))) for field in fields
+            ))
+            buffer.write('\n')
+        sql = 'COPY {} ({}) FROM STDIN'.format(
+            qn(model._meta.db_table), ', '.join(qn(field.column) for field in fields)
+        )
+        with connection.cursor() as cursor:
+            raw = cursor.cursor
+            buffer.seek(0)
+            if hasattr(raw, 'copy_expert'):
+                raw.copy_expert(sql, buffer)
+            else:
+                with raw.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+
+
+def get_writer(method='auto', using='default'):
+    """Способ записи: 'copy' (только PostgreSQL), 'insert' или 'auto'"""
+    vendor = connections[using].vendor
+    if method == 'copy' and vendor != 'postgresql':
+        raise ValueError('COPY поддерживается только в PostgreSQL')
+    if method == 'copy' or (method == 'auto' and vendor == 'postgresql'):
+        return CopyWriter(using)
+    return RawInsertWriter(using)
+
+
+def next_id(model, using):
+    return (model.objects.using(using).aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+class DataGenerator:
+    """
+    Генератор набора данных.
+
+        stats = DataGenerator(users=10000, ads=1000000, proposals=300000, seed=1).run()
+    """
+
+    def __init__(self, users=1000, ads=10000, proposals=5000, seed=0, days=365,
+                 batch_size=5000, method='auto', using='default', log=None, end=None):
+        if users < 2 and proposals:
+            raise ValueError('Для предложений обмена нужно минимум два пользователя')
+        self.users = users
+        self.ads = ads
+        self.proposals = proposals
+        self.days = days
+        self.batch_size = batch_size
+        self.using = using
+        self.rng = random.Random(seed)
+        self.writer = get_writer(method, using)
+        self.log = log or (lambda message: None)
+
+        self.end = (end or DEFAULT_END).replace(microsecond=0)
+        self.start = self.end - timedelta(days=days)
+        self.span = (self.end - self.start).total_seconds()
+
+    def run(self):
+        started = time.monotonic()
+        self.user_base = next_id(User, self.using)
+        self.ad_base = next_id(Ad, self.using)
+        self.proposal_base = next_id(ExchangeProposal, self.using)
+
+        # Сначала планируем владельцев, статусы и предложения (компактные массивы),
+        # затем пишем таблицы в порядке внешних ключей
+        self.plan_ads()
+        self.plan_proposals()
+        self.count_profiles()
+
+        self.trade_keys, self.trade_key_count = [], 0
+        self.duplicate_keys, self.duplicate_key_count = [], 0
+        models = [User, UserProfile, Ad, AdTradeKey, AdDuplicateKey, ExchangeProposal]
+        with transaction.atomic(using=self.using):
+            self.write('пользователи', User, self.user_objects(), self.users)
+            self.write('профили', UserProfile, self.profile_objects(), self.users)
+            self.write('объявления', Ad, self.ad_objects(), self.ads, on_batch=self.write_ad_keys)
+            self.write('предложения', ExchangeProposal, self.proposal_objects(), len(self.proposal_status))
+            self.writer.finish(models)
+            invalidate_ad_lists()
+
+        return {
+            'users': self.users,
+            'ads': self.ads,
+            'active_ads': sum(self.ad_active),
+            'proposals': len(self.proposal_status),
+            'trade_keys': self.trade_key_count,
+            'duplicate_keys': self.duplicate_key_count,
+            'statuses': {status: self.proposal_status.count(i) for i, status in enumerate(STATUSES)},
+            'first_user_id': self.user_base,
+            'seconds': round(time.monotonic() - started, 1),
+        }
+
+    def write(self, label, model, objects, total, on_batch=None):
+        """Записать объекты пачками; on_batch() - после каждой пачки"""
+        batch = []
+        done = 0
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                self.writer.write(model, batch)
+                if on_batch:
+                    on_batch()
+                done += len(batch)
+                batch = []
+                self.log(f'{label}: {done}/{total}')
+        if batch:
+            self.writer.write(model, batch)
+            if on_batch:
+                on_batch()
+            done += len(batch)
+        self.log(f'{label}: {done}/{total}')
+
+    def write_ad_keys(self):
+        """Ключи взаимного обмена и поиска дубликатов записанной пачки объявлений"""
+        if self.trade_keys:
+            self.writer.write(AdTradeKey, self.trade_keys)
+            self.trade_key_count += len(self.trade_keys)
+            self.trade_keys = []
+        if self.duplicate_keys:
+            self.writer.write(AdDuplicateKey, self.duplicate_keys)
+            self.duplicate_key_count += len(self.duplicate_keys)
+            self.duplicate_keys = []
+
+    def moment(self, fraction):
+        return self.start + timedelta(seconds=self.span * fraction)
+
+    # Планирование
+
+    def plan_ads(self):
+        rng = self.rng
+        # Номер пользователя (0..users-1) с весами Ципфа: первые пользователи самые активные
+        owners = rng.choices(range(self.users), cum_weights=zipf_weights(self.users), k=self.ads)
+        self.ad_owner = array('l', owners)
+        self.ad_active = bytearray(rng.random() >= INACTIVE_SHARE for _ in range(self.ads))
+
+    def plan_proposals(self):
+        rng = self.rng
+        n = self.ads
+        seen = set()
+        senders, receivers, statuses = array('l'), array('l'), bytearray()
+        status_weights = list(accumulate(STATUS_WEIGHTS[status] for status in STATUSES))
+        traded = bytearray(n)
+        attempts = 0
+        while len(statuses) < self.proposals and attempts < self.proposals * 20 and n > 1:
+            attempts += 1
+            sender = rng.randrange(n)
+            # Новые объявления получают больше предложений
+            receiver = n - 1 - int(n * rng.random() ** 2)
+            key = sender * n + receiver
+            if self.ad_owner[sender] == self.ad_owner[receiver] or key in seen:
+                continue
+            seen.add(key)
+            status = rng.choices(STATUSES, cum_weights=status_weights)[0]
+            available = self.ad_active[sender] and self.ad_active[receiver]
+            if status == 'accepted' and available and not (traded[sender] or traded[receiver]):
+                # Обмен состоялся: оба объявления сняты с публикации
+                traded[sender] = traded[receiver] = 1
+                self.ad_active[sender] = self.ad_active[receiver] = 0
+            elif status != 'rejected':
+                status = 'pending' if available else 'rejected'
+            senders.append(sender)
+            receivers.append(receiver)
+            statuses.append(STATUSES.index(status))
+
+        # Ожидающие предложения по обменянным объявлениям отклонены (как в accept())
+        pending = STATUSES.index('pending')
+        rejected = STATUSES.index('rejected')
+        for i, status in enumerate(statuses):
+            if status == pending and not (self.ad_active[senders[i]] and self.ad_active[receivers[i]]):
+                statuses[i] = rejected
+
+        self.proposal_sender, self.proposal_receiver, self.proposal_status = senders, receivers, statuses
+
+    def count_profiles(self):
+        self.active_ads = array('l', [0]) * self.users
+        self.pending_sent = array('l', [0]) * self.users
+        self.pending_received = array('l', [0]) * self.users
+        self.exchanges = array('l', [0]) * self.users
+        for owner, active in zip(self.ad_owner, self.ad_active):
+            self.active_ads[owner] += active
+        pending, accepted = STATUSES.index('pending'), STATUSES.index('accepted')
+        for sender, receiver, status in zip(self.proposal_sender, self.proposal_receiver, self.proposal_status):
+            sender, receiver = self.ad_owner[sender], self.ad_owner[receiver]
+            if status == pending:
+                self.pending_sent[sender] += 1
+                self.pending_received[receiver] += 1
+            elif status == accepted:
+                self.exchanges[sender] += 1
+                self.exchanges[receiver] += 1
+
+    # Объекты для записи
+
+    def user_objects(self):
+        rng = self.rng
+        password = make_password(DEFAULT_PASSWORD)
+        for i in range(self.users):
+            pk = self.user_base + i
+            female = rng.random() < 0.5
+            yield User(
+                id=pk,
+                username=f'user_{pk}',
+                email=f'user_{pk}@example.com',
+                password=password,
+                first_name=rng.choice(FEMALE_NAMES if female else MALE_NAMES),
+                last_name=rng.choice(SURNAMES) + ('а' if female else ''),
+                # Пользователи зарегистрированы до начала периода объявлений
+                date_joined=self.start - timedelta(seconds=rng.random() * self.span),
+            )
+
+    def profile_objects(self):
+        rng = self.rng
+        city_weights = zipf_weights(len(CITIES))
+        self.user_city = []
+        for i in range(self.users):
+            city = rng.choices(CITIES, cum_weights=city_weights)[0]
+            self.user_city.append(city)
+            created = self.start - timedelta(seconds=rng.random() * self.span)
+            yield UserProfile(
+                user_id=self.user_base + i,
+                city=city,
+                active_ads_count=self.active_ads[i],
+                pending_sent_count=self.pending_sent[i],
+                pending_received_count=self.pending_received[i],
+                successful_exchanges=self.exchanges[i],
+                rating=Decimal(f'{rng.uniform(3.5, 5):.2f}') if self.exchanges[i] else Decimal(0),
+                created_at=created,
+                updated_at=created,
+            )
+
+    def ad_time(self, index):
+        # Объявления создаются равномерно по периоду в порядке id
+        return self.moment(index / max(self.ads, 1))
+
+    def ad_objects(self):
+        rng = self.rng
+        categories, weights = zip(*CATEGORY_WEIGHTS.items())
+        category_weights = list(accumulate(weights))
+        conditions, weights = zip(*CONDITION_WEIGHTS.items())
+        condition_weights = list(accumulate(weights))
+        for i in range(self.ads):
+            category = rng.choices(categories, cum_weights=category_weights)[0]
+            condition = rng.choices(conditions, cum_weights=condition_weights)[0]
+            items, brands = ITEMS[category]
+            item = rng.choice(items)
+            title = f'{item} {rng.choice(brands)}'
+            if category == 'electronics' and rng.random() < 0.5:
+                title += f' {rng.randint(2, 15)}'
+            wish = rng.choice(categories)
+            # Предмет из нужной категории - без обращения к rng, чтобы данные не менялись
+            wanted_item = ITEMS[wish][0][i % len(ITEMS[wish][0])].lower()
+            description = ' '.join([
+                f'{title}.',
+                rng.choice(CONDITION_PHRASES[condition]),
+                rng.choice(REASON_PHRASES),
+                f'Рассмотрю обмен на вещи из категории «{CATEGORY_LABELS[wish]}».',
+                rng.choice(LOGISTICS_PHRASES).format(city=self.user_city[self.ad_owner[i]]),
+            ])
+            created = self.ad_time(i)
+            active = bool(self.ad_active[i])
+            updated = created if active else created + timedelta(seconds=rng.random() * (self.end - created).total_seconds())
+            if active:
+                # До yield: пачка пишется сразу после последнего объявления
+                self.trade_keys += build_keys(
+                    self.ad_base + i, self.user_base + self.ad_owner[i], title, category, [wish], wanted_item,
+                )
+                self.duplicate_keys += build_duplicate_keys(
+                    self.ad_base + i, self.user_base + self.ad_owner[i], title, description,
+                )
+            yield Ad(
+                id=self.ad_base + i,
+                user_id=self.user_base + self.ad_owner[i],
+                title=title,
+                description=description,
+                category=category,
+                condition=condition,
+                is_active=active,
+                created_at=created,
+                updated_at=updated,
+                wanted_categories=[wish],
+                wanted_keywords=wanted_item,
+            )
+
+    def proposal_objects(self):
+        rng = self.rng
+        for i, status in enumerate(self.proposal_status):
+            sender_ad, receiver_ad = self.proposal_sender[i], self.proposal_receiver[i]
+            # Предложение создано после обоих объявлений
+            created = self.ad_time(max(sender_ad, receiver_ad))
+            created += timedelta(seconds=rng.random() * (self.end - created).total_seconds())
+            status = STATUSES[status]
+            updated = created
+            if status != 'pending':
+                updated += timedelta(seconds=rng.random() * (self.end - created).total_seconds())
+            yield ExchangeProposal(
+                id=self.proposal_base + i,
+                ad_sender_id=self.ad_base + sender_ad,
+                ad_receiver_id=self.ad_base + receiver_ad,
+                sender_id=self.user_base + self.ad_owner[sender_ad],
+                receiver_id=self.user_base + self.ad_owner[receiver_ad],
+                comment=' '.join(rng.sample(COMMENT_PHRASES, rng.randint(1, 2))),
+                status=status,
+                created_at=created,
+                updated_at=updated,
+            )
+
+
+def generate_data(**options):
+    """Сгенерировать набор данных; параметры - как у DataGenerator"""
+    return DataGenerator(**options).run()
@@ -0,0 +1,249 @@
+"""
+Почти одинаковые объявления (повторные публикации одного и того же).
+
+Текст объявления - множество слов заголовка и описания; похожесть двух
+объявлений - коэффициент Жаккара этих множеств (доля общих слов). Дубликатом
+считается активное объявление с похожестью не ниже MIN_SIMILARITY.
+
+Чтобы не сравнивать со всеми объявлениями, при сохранении считается MinHash-
+подпись текста из NUM_BANDS * BAND_ROWS минимумов хэшей слов, и по каждой полосе
+из BAND_ROWS значений хранится ключ AdDuplicateKey (номер полосы, хэш полосы).
+Объявления с похожестью s совпадают хотя бы в одной полосе с вероятностью
+1 - (1 - s^4)^8: 0.98 при s = 0.8, 0.4 при s = 0.5. Кандидаты - не больше
+CANDIDATE_LIMIT новейших объявлений на полосу, проход по индексу (band, bucket,
+owner_id, ad); их похожесть проверяется точно по текстам.
+
+Ключи обновляются при сохранении объявления (сигнал update_duplicate_keys), при
+обмене и в массовых операциях API, как ключи взаимного обмена в wants.py;
+команда rebuild_duplicate_keys пересобирает индекс целиком.
+"""
+import hashlib
+import re
+
+import numpy as np
+from django.db.models import Q
+
+from .models import Ad, AdDuplicateKey
+
+NUM_BANDS = 8
+BAND_ROWS = 4
+# Доля общих слов, начиная с которой объявления считаются дубликатами
+MIN_SIMILARITY = 0.8
+# Сколько новейших объявлений на полосу проверяется
+CANDIDATE_LIMIT = 20
+# Отчет в админке: среди скольких новейших активных объявлений искать дубликаты
+REPORT_ADS = 5000
+BATCH_SIZE = 5000
+
+WORD_RE = re.compile(r'\w+')
+# Хэши слов по модулю простого числа: (a * h + b) % PRIME не переполняет uint64
+PRIME = (1 << 31) - 1
+
+
+def _coefficients(name):
+    """Постоянные между процессами коэффициенты хэш-функций подписи"""
+    return np.array([
+        int.from_bytes(hashlib.blake2b(f'{name}{i}'.encode(), digest_size=4).digest(), 'little') % (PRIME - 1) + 1
+        for i in range(NUM_BANDS * BAND_ROWS)
+    ], dtype=np.uint64)
+
+
+HASH_A, HASH_B = _coefficients('a'), _coefficients('b')
+
+
+def text_words(title, description):
+    """Множество слов текста без учета регистра и 'ё'"""
+    return frozenset(WORD_RE.findall(f'{title or ""} {description or ""}'.lower().replace('ё', 'е')))
+
+
+def similarity(words, other):
+    """Доля общих слов (коэффициент Жаккара)"""
+    if not words or not other:
+        return 0.0
+    return len(words & other) / len(words | other)
+
+
+def band_buckets(words):
+    """Хэши полос MinHash-подписи: [(номер полосы, хэш), ...]; у пустого текста полос нет"""
+    if not words:
+        return []
+    hashes = np.array([
+        int.from_bytes(hashlib.blake2b(word.encode(), digest_size=4).digest(), 'little') % PRIME
+        for word in words
+    ], dtype=np.uint64)
+    signature = ((HASH_A[:, None] * hashes[None, :] + HASH_B[:, None]) % PRIME).min(axis=1)
+    return [
+        # Знаковое 64-битное число - под BigIntegerField
+        (band, int.from_bytes(hashlib.blake2b(rows.tobytes(), digest_size=8).digest(), 'little', signed=True))
+        for band, rows in enumerate(signature.reshape(NUM_BANDS, BAND_ROWS))
+    ]
+
+
+def build_keys(ad_id, owner_id, title, description):
+    return [
+        AdDuplicateKey(ad_id=ad_id, owner_id=owner_id, band=band, bucket=bucket)
+        for band, bucket in band_buckets(text_words(title, description))
+    ]
+
+
+def refresh_duplicate_keys(ads, replace=True):
+    """Пересобрать ключи объявлений: одно удаление и одна вставка"""
+    if replace:
+        AdDuplicateKey.objects.filter(ad__in=[ad.pk for ad in ads]).delete()
+    keys = [
+        key
+        for ad in ads if ad.is_active
+        for key in build_keys(ad.pk, ad.user_id, ad.title, ad.description)
+    ]
+    AdDuplicateKey.objects.bulk_create(keys, batch_size=BATCH_SIZE)
+
+
+def rebuild_duplicate_keys(batch_size=BATCH_SIZE, log=None):
+    """Пересобрать весь индекс по активным объявлениям; возвращает число ключей"""
+    log = log or (lambda message: None)
+    AdDuplicateKey.objects.all().delete()
+    rows = (
+        Ad.objects.filter(is_active=True)
+        .values_list('pk', 'user_id', 'title', 'description')
+        .iterator(chunk_size=batch_size)
+    )
+    batch, total = [], 0
+    for row in rows:
+        batch += build_keys(*row)
+        if len(batch) >= batch_size:
+            AdDuplicateKey.objects.bulk_create(batch, batch_size=batch_size)
+            total += len(batch)
+            batch = []
+            log(f'ключей: {total}')
+    AdDuplicateKey.objects.bulk_create(batch, batch_size=batch_size)
+    return total + len(batch)
+
+
+def find_duplicates_many(texts, owner_id=None, exclude=()):
+    """
+    Дубликаты для нескольких текстов одним запросом.
+
+    texts - [(title, description), ...]; owner_id - искать только среди
+    объявлений этого пользователя; exclude - id объявлений, которые не считаются
+    (сами проверяемые объявления). Возвращает для каждого текста список
+    (объявление, похожесть), самые похожие первыми.
+    """
+    words = [text_words(title, description) for title, description in texts]
+    keys = AdDuplicateKey.objects.order_by('-ad_id').values('ad_id')
+    if owner_id is not None:
+        keys = keys.filter(owner_id=owner_id)
+    condition = Q()
+    for band, bucket in {pair for text in words for pair in band_buckets(text)}:
+        condition |= Q(pk__in=keys.filter(band=band, bucket=bucket)[:CANDIDATE_LIMIT])
+    if not condition:
+        return [[] for _ in texts]
+    candidates = [
+        (ad, text_words(ad.title, ad.description))
+        for ad in Ad.objects.filter(condition, is_active=True).exclude(pk__in=exclude).select_related('user')
+    ]
+    results = []
+    for text in words:
+        found = [(ad, similarity(text, other)) for ad, other in candidates]
+        found = [(ad, score) for ad, score in found if score >= MIN_SIMILARITY]
+        results.append(sorted(found, key=lambda item: (-item[1], -item[0].pk)))
+    return results
+
+
+def find_duplicates(title, description, owner_id=None, exclude=()):
+    """Активные объявления с почти тем же текстом: [(объявление, похожесть), ...]"""
+    return find_duplicates_many([(title, description)], owner_id, exclude)[0]
+
+
+def duplicate_message(ad):
+    return f'У вас уже есть почти такое же объявление «{ad.title}» (№ {ad.pk}). Измените его вместо повторной публикации.'
+
+
+def own_duplicate(user, title, description, instance=None, is_active=None):
+    """
+    Активное объявление пользователя с почти тем же текстом или None (проверка формы и API).
+
+    При изменении объявления instance проверка нужна, только если меняется текст;
+    неактивные объявления не проверяются.
+    """
+    if user is None or not user.is_authenticated:
+        return None
+    if instance is not None and instance.pk:
+        if (title, description) == (instance.title, instance.description):
+            return None
+        if is_active is None:
+            is_active = instance.is_active
+    if is_active is False:
+        return None
+    found = find_duplicates(title, description, user.pk, [instance.pk] if instance is not None and instance.pk else [])
+    return found[0][0] if found else None
+
+
+def batch_duplicate_errors(items, owner_id, exclude=()):
+    """
+    Ошибки дубликатов пакета (массовые операции API) одним запросом.
+
+    items - [(ключ, title, description), ...]. Элемент - дубликат, если у
+    владельца есть почти такое же активное объявление (кроме exclude) или такой
+    же текст у элемента раньше в пакете. Возвращает {ключ: текст ошибки}.
+    """
+    found = find_duplicates_many([(title, description) for _, title, description in items], owner_id, exclude)
+    errors, seen = {}, {}
+    for (key, title, description), duplicates in zip(items, found):
+        if duplicates:
+            errors[key] = duplicate_message(duplicates[0][0])
+            continue
+        words = text_words(title, description)
+        buckets = band_buckets(words)
+        earlier = next((
+            other
+            for bucket in buckets
+            for other, other_words in seen.get(bucket, ())
+            if similarity(words, other_words) >= MIN_SIMILARITY
+        ), None)
+        if earlier is not None:
+            errors[key] = f'Почти такое же объявление уже есть в пакете (элемент {earlier})'
+            continue
+        for bucket in buckets:
+            seen.setdefault(bucket, []).append((key, words))
+    return errors
+
+
+def duplicate_groups(limit=REPORT_ADS):
+    """
+    Группы дубликатов среди limit новейших активных объявлений (отчет в админке).
+
+    Два запроса: ключи этих объявлений и сами объявления. Пары сравниваются
+    внутри общих полос (не больше CANDIDATE_LIMIT новейших объявлений в полосе).
+    Каждая группа - список объявлений, новые первыми; группы - по новейшему
+    объявлению.
+    """
+    recent = Ad.objects.filter(is_active=True).order_by('-pk').values('pk')[:limit]
+    buckets = {}
+    for ad_id, band, bucket in (
+        AdDuplicateKey.objects.filter(ad__in=recent).order_by('-ad_id').values_list('ad_id', 'band', 'bucket')
+    ):
+        buckets.setdefault((band, bucket), []).append(ad_id)
+    shared = [ids[:CANDIDATE_LIMIT] for ids in buckets.values() if len(ids) > 1]
+    if not shared:
+        return []
+    ads = {ad.pk: ad for ad in Ad.objects.filter(pk__in=recent).select_related('user')}
+    words = {pk: text_words(ad.title, ad.description) for pk, ad in ads.items()}
+
+    # Объединение пар с похожестью не ниже порога (система непересекающихся множеств)
+    parent = {}
+
+    def root(pk):
+        while parent.get(pk, pk) != pk:
+            pk = parent[pk]
+        return pk
+
+    for ids in shared:
+        for i, pk in enumerate(ids):
+            for other in ids[i + 1:]:
+                if pk in ads and other in ads and similarity(words[pk], words[other]) >= MIN_SIMILARITY:
+                    parent[root(other)] = root(pk)
+    groups = {}
+    for pk in list(parent):
+        groups.setdefault(root(pk), set()).add(pk)
+    groups = [group | {pk} for pk, group in groups.items()]
+    return [[ads[pk] for pk in sorted(group, reverse=True)] for group in sorted(groups, key=max, reverse=True)]
@@ -1,13 +1,25 @@
 from django import forms
+from .duplicates import duplicate_message, own_duplicate
 from .models import Ad, ExchangeProposal
 
 
 class AdForm(forms.ModelForm):
     """Форма для создания и редактирования объявлений"""
     
+    # Что владелец хочет взамен: несколько категорий флажками
+    wanted_categories = forms.MultipleChoiceField(
+        choices=Ad.CATEGORY_CHOICES,
+        required=False,
+        widget=forms.CheckboxSelectMultiple(attrs={'class': 'form-check-input'}),
+        label='Что хочу взамен: категории',
+    )
+    
     class Meta:
         model = Ad
-        fields = ['title', 'description', 'image', 'image_url', 'category', 'condition']
+        fields = [
+            'title', 'description', 'image', 'image_url', 'category', 'condition',
+            'wanted_categories', 'wanted_keywords',
+        ]
         widgets = {
             'title': forms.TextInput(attrs={
                 'class': 'form-control',
@@ -32,6 +44,10 @@ class AdForm(forms.ModelForm):
             'condition': forms.Select(attrs={
                 'class': 'form-select'
             }),
+            'wanted_keywords': forms.TextInput(attrs={
+                'class': 'form-control',
+                'placeholder': 'Например: ноутбук, планшет'
+            }),
         }
         labels = {
             'title': 'Заголовок',
@@ -40,12 +56,19 @@ class AdForm(forms.ModelForm):
             'image_url': 'URL изображения',
             'category': 'Категория',
             'condition': 'Состояние',
+            'wanted_keywords': 'Что хочу взамен: слова',
         }
         help_texts = {
             'image': 'Загрузите фото товара (максимум 5MB, форматы: JPG, PNG, GIF)',
             'image_url': 'Или укажите ссылку на изображение в интернете',
+            'wanted_keywords': 'Слова через запятую; по ним и категориям подбираются взаимные предложения',
         }
     
+    def __init__(self, *args, **kwargs):
+        # Автор: его повторные публикации того же объявления не проходят проверку
+        self.user = kwargs.pop('user', None)
+        super().__init__(*args, **kwargs)
+    
     def clean_title(self):
         """Валидация заголовка"""
         title = self.cleaned_data.get('title')
@@ -83,6 +106,12 @@ class AdForm(forms.ModelForm):
         # Проверяем, что указано хотя бы одно изображение (необязательно)
         # Можно оставить объявление без изображения
         
+        title, description = cleaned_data.get('title'), cleaned_data.get('description')
+        if title and description:
+            duplicate = own_duplicate(self.user, title, description, self.instance)
+            if duplicate is not None:
+                raise forms.ValidationError(duplicate_message(duplicate))
+        
         return cleaned_data
 
 
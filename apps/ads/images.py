@@ -0,0 +1,89 @@
+"""
+Уменьшенные копии изображений объявлений.
+
+Из загруженного оригинала (до 5MB) генерируются JPEG-варианты фиксированного
+размера. Ориентация исправляется по EXIF, сами EXIF-данные (в том числе
+геолокация) в варианты не попадают.
+"""
+import io
+import logging
+import os
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Размеры вариантов: crop=True - обрезка до точного размера, иначе вписывание
+IMAGE_VARIANTS = {
+    'card': {'size': (600, 400), 'crop': True},      # карточка в списке объявлений
+    'detail': {'size': (1200, 1200), 'crop': False},  # страница объявления, API
+    'admin': {'size': (50, 50), 'crop': True},        # превью в админ-панели
+}
+
+VARIANTS_DIR = 'ads/variants'
+JPEG_QUALITY = 85
+
+
+def variant_name(image_name, size):
+    """Путь варианта в хранилище: ads/variants/<имя оригинала>_<размер>.jpg"""
+    base = os.path.splitext(os.path.basename(image_name))[0]
+    return f'{VARIANTS_DIR}/{base}_{size}.jpg'
+
+
+def open_image(field_file):
+    """Открыть оригинал, исправить ориентацию и привести к RGB"""
+    with field_file.storage.open(field_file.name, 'rb') as f:
+        image = Image.open(f)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # Прозрачный фон заменяем белым, JPEG не поддерживает альфа-канал
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_variant(image, size, crop):
+    """Построить один вариант изображения"""
+    if crop:
+        return ImageOps.fit(image, size, Image.LANCZOS)
+    variant = image.copy()
+    variant.thumbnail(size, Image.LANCZOS)
+    return variant
+
+
+def generate_image_variants(field_file):
+    """
+    Сгенерировать все варианты изображения.
+
+    Возвращает словарь {размер: путь в хранилище}. При ошибке чтения
+    оригинала возвращает пустой словарь - тогда используется оригинал.
+    """
+    try:
+        image = open_image(field_file)
+    except (OSError, Image.DecompressionBombError, ValueError) as exc:
+        logger.warning('Не удалось обработать изображение %s: %s', field_file.name, exc)
+        return {}
+
+    storage = field_file.storage
+    variants = {}
+    for size, spec in IMAGE_VARIANTS.items():
+        buffer = io.BytesIO()
+        render_variant(image, spec['size'], spec['crop']).save(
+            buffer, format='JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True
+        )
+        name = variant_name(field_file.name, size)
+        if storage.exists(name):
+            storage.delete(name)
+        variants[size] = storage.save(name, ContentFile(buffer.getvalue()))
+    return variants
+
+
+def delete_files(storage, names):
+    """Удалить файлы из хранилища, пропуская отсутствующие"""
+    for name in names:
+        if name and storage.exists(name):
+            storage.delete(name)
@@ -0,0 +1,73 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from apps.ads.benchmark import (
+    BENCH_USERNAME, SCENARIOS, compare, load_results, run_benchmark, save_results, seed_dataset,
+)
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк основных сценариев: задержка p50/p95 и количество SQL-запросов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help='Количество пользователей')
+        parser.add_argument('--ads', type=int, default=5000, help='Количество объявлений')
+        parser.add_argument('--proposals', type=int, default=2000, help='Количество предложений обмена')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора данных')
+        parser.add_argument('--iterations', type=int, default=30, help='Замеров на сценарий')
+        parser.add_argument('--warmup', type=int, default=3, help='Прогревочных запросов на сценарий')
+        parser.add_argument('--scenario', action='append', dest='scenarios', help='Запустить только указанные сценарии')
+        parser.add_argument('--output', default='bench_output.json', help='Файл для результатов в JSON')
+        parser.add_argument('--compare', help='JSON прошлого прогона для сравнения')
+        parser.add_argument(
+            '--cached', action='store_true',
+            help='С настроенным кэшем (замер теплого кэша); по умолчанию кэш отключен',
+        )
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='Не пересоздавать тестовую базу (данные из прошлого прогона переиспользуются)',
+        )
+
+    def handle(self, *args, **options):
+        scenarios = SCENARIOS
+        if options['scenarios']:
+            known = {scenario.name: scenario for scenario in SCENARIOS}
+            unknown = set(options['scenarios']) - set(known)
+            if unknown:
+                raise CommandError(f'Неизвестные сценарии: {", ".join(sorted(unknown))}')
+            scenarios = [known[name] for name in options['scenarios']]
+
+        # Бенчмарк работает с отдельной тестовой базой, рабочие данные не затрагиваются
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            if not User.objects.filter(username=BENCH_USERNAME).exists():
+                self.stdout.write('Заполнение базы...')
+                seed_dataset(
+                    users=options['users'], ads=options['ads'],
+                    proposals=options['proposals'], seed=options['seed'],
+                )
+            results = run_benchmark(
+                scenarios, iterations=options['iterations'], warmup=options['warmup'], seed=options['seed'],
+                cached=options['cached'],
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        self.print_results(results, load_results(options['compare']) if options['compare'] else None)
+        save_results(results, options['output'])
+        self.stdout.write(self.style.SUCCESS(f'Результаты сохранены в {options["output"]}'))
+
+    def print_results(self, results, baseline=None):
+        diff = compare(results, baseline) if baseline else {}
+        self.stdout.write(f'{"Сценарий":<26}{"p50, мс":>10}{"p95, мс":>10}{"запросов":>10}  изменение p50/p95')
+        for name, result in results['scenarios'].items():
+            line = f'{name:<26}{result["p50_ms"]:>10.2f}{result["p95_ms"]:>10.2f}{result["queries_median"]:>10}'
+            if name in diff:
+                change = diff[name]
+                line += f'  {change["p50_change_pct"]:+.1f}% / {change["p95_change_pct"]:+.1f}%'
+            self.stdout.write(line)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from apps.ads.models import Ad
+from apps.ads.sampling import SHOWCASE_SIZE, benchmark_sampling
+
+
+class Command(BaseCommand):
+    help = "Сравнение random_sample с order_by('?') на текущей базе"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=SHOWCASE_SIZE, help='Размер выборки')
+        parser.add_argument('--repeats', type=int, default=20, help='Замеров на способ')
+
+    def handle(self, *args, **options):
+        active = Ad.objects.filter(is_active=True)
+        querysets = [('все активные', active)]
+        # Блок "другие объявления пользователя" у самого активного автора
+        busiest = active.values('user').annotate(total=Count('pk')).order_by('-total').first()
+        if busiest:
+            querysets.append((f'пользователь {busiest["user"]}', active.filter(user=busiest['user'])))
+
+        for name, queryset in querysets:
+            timings = benchmark_sampling(queryset, options['size'], options['repeats'])
+            self.stdout.write(
+                f'{name}: random_sample {timings["random_sample"]:.2f} мс, '
+                f'order_by(\'?\') {timings["order_by_random"]:.2f} мс'
+            )
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.ads.cycles import MAX_CYCLE_LENGTH, MIN_CYCLE_LENGTH, benchmark_cycles, get_max_length, rebuild_cycles
+
+# Размеры случайных графов для --benchmark: (объявлений, предложений)
+BENCHMARK_SIZES = [(10000, 20000), (50000, 100000), (100000, 300000)]
+
+
+class Command(BaseCommand):
+    help = 'Поиск цепочных обменов (циклов) среди ожидающих предложений'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-length', type=int, default=None,
+            help=f'Наибольшая длина цикла, {MIN_CYCLE_LENGTH}..{MAX_CYCLE_LENGTH} (по умолчанию TRADE_CYCLE_MAX_LENGTH)',
+        )
+        parser.add_argument('--limit', type=int, default=None, help='Остановиться после стольких циклов')
+        parser.add_argument(
+            '--benchmark', action='store_true',
+            help='Замерить перебор на случайных графах вместо поиска в базе',
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора графов для --benchmark')
+
+    def handle(self, *args, **options):
+        max_length = options['max_length'] or get_max_length()
+        if not MIN_CYCLE_LENGTH <= max_length <= MAX_CYCLE_LENGTH:
+            raise CommandError(f'Длина цикла должна быть от {MIN_CYCLE_LENGTH} до {MAX_CYCLE_LENGTH}')
+
+        if options['benchmark']:
+            self.stdout.write(f'{"объявлений":>12}{"предложений":>13}{"циклов":>10}{"время, с":>10}')
+            for nodes, edges in BENCHMARK_SIZES:
+                result = benchmark_cycles(nodes, edges, max_length, seed=options['seed'], limit=options['limit'])
+                self.stdout.write(
+                    f'{result["nodes"]:>12}{result["edges"]:>13}{result["cycles"]:>10}{result["seconds"]:>10.2f}'
+                )
+            return
+
+        result = rebuild_cycles(max_length=max_length, limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Предложений в графе: {result["edges"]}, найдено циклов: {result["found"]}, '
+            f'новых: {result["created"]}, удалено устаревших: {result["deleted"]} '
+            f'({result["seconds"]:.2f} с)'
+        ))
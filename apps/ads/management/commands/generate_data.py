@@ -0,0 +1,54 @@
+import argparse
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.ads.datagen import DEFAULT_END, DEFAULT_PASSWORD, generate_data
+
+
+def moment(value):
+    """Дата или дата и время в ISO-формате; без часового пояса - в текущем"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('Ожидается дата в формате ГГГГ-ММ-ДД')
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+
+class Command(BaseCommand):
+    help = 'Генерация большого набора синтетических данных для нагрузочного тестирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Количество пользователей')
+        parser.add_argument('--ads', type=int, default=10000, help='Количество объявлений')
+        parser.add_argument('--proposals', type=int, default=5000, help='Количество предложений обмена')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора (одинаковое зерно - одинаковые данные)')
+        parser.add_argument('--days', type=int, default=365, help='Период публикации объявлений в днях')
+        parser.add_argument(
+            '--end', type=moment, default=DEFAULT_END,
+            help=f'Конец периода публикации (по умолчанию {DEFAULT_END.date()}: даты не зависят от дня запуска)',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='Размер пачки при записи')
+        parser.add_argument(
+            '--method', choices=['auto', 'insert', 'copy'], default='auto',
+            help='Способ записи: COPY (PostgreSQL), многострочный INSERT или auto',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            stats = generate_data(
+                users=options['users'], ads=options['ads'], proposals=options['proposals'],
+                seed=options['seed'], days=options['days'], end=options['end'], batch_size=options['batch_size'],
+                method=options['method'], log=self.stdout.write,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        statuses = ', '.join(f'{status}: {count}' for status, count in stats['statuses'].items())
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано за {stats["seconds"]} с: пользователей {stats["users"]}, '
+            f'объявлений {stats["ads"]} (активных {stats["active_ads"]}), '
+            f'предложений {stats["proposals"]} ({statuses})'
+        ))
+        self.stdout.write(f'Пароль всех созданных пользователей: {DEFAULT_PASSWORD}')
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from apps.ads.models import Ad
+
+
+class Command(BaseCommand):
+    help = 'Генерация уменьшенных копий изображений для существующих объявлений'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересоздать варианты и для объявлений, у которых они уже есть'
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help='Размер пакета при чтении объявлений')
+
+    def handle(self, *args, **options):
+        ads = Ad.objects.exclude(image='').exclude(image__isnull=True).order_by('pk')
+        if not options['force']:
+            ads = ads.filter(image_variants={})
+
+        total = ads.count()
+        self.stdout.write(f'Объявлений для обработки: {total}')
+
+        processed = failed = 0
+        for ad in ads.iterator(chunk_size=options['batch_size']):
+            ad.process_image()
+            if ad.image_variants:
+                processed += 1
+            else:
+                failed += 1
+                self.stdout.write(self.style.WARNING(f'Не удалось обработать изображение объявления #{ad.pk}'))
+
+        self.stdout.write(self.style.SUCCESS(f'Готово: обработано {processed}, с ошибками {failed}'))
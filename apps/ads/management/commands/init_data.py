@@ -39,70 +39,90 @@ class Command(BaseCommand):
                 'description': 'Отличный телефон в идеальном состоянии. Полный комплект, коробка, документы. Обменяю на ноутбук или планшет.',
                 'category': 'electronics',
                 'condition': 'like_new',
-                'image_url': 'https://via.placeholder.com/400x300/007bff/ffffff?text=iPhone+12+Pro'
+                'image_url': 'https://via.placeholder.com/400x300/007bff/ffffff?text=iPhone+12+Pro',
+                'wanted_categories': ['electronics'],
+                'wanted_keywords': 'ноутбук, планшет',
             },
             {
                 'title': 'Велосипед горный Trek',
                 'description': 'Профессиональный горный велосипед, 21 скорость, алюминиевая рама. Ищу электросамокат или спортивный инвентарь.',
                 'category': 'sports',
                 'condition': 'good',
-                'image_url': 'https://via.placeholder.com/400x300/28a745/ffffff?text=Mountain+Bike'
+                'image_url': 'https://via.placeholder.com/400x300/28a745/ffffff?text=Mountain+Bike',
+                'wanted_categories': ['sports'],
+                'wanted_keywords': 'электросамокат',
             },
             {
                 'title': 'Коллекция книг по программированию',
                 'description': '15 книг по Python, JavaScript, алгоритмам. Все в отличном состоянии. Обменяю на электронную книгу или планшет.',
                 'category': 'books',
                 'condition': 'good',
-                'image_url': 'https://via.placeholder.com/400x300/ffc107/000000?text=Programming+Books'
+                'image_url': 'https://via.placeholder.com/400x300/ffc107/000000?text=Programming+Books',
+                'wanted_categories': ['electronics'],
+                'wanted_keywords': 'электронная книга, планшет',
             },
             {
                 'title': 'Кофемашина DeLonghi',
                 'description': 'Автоматическая кофемашина, варит эспрессо, капучино. Обменяю на другую бытовую технику.',
                 'category': 'home',
                 'condition': 'like_new',
-                'image_url': 'https://via.placeholder.com/400x300/6c757d/ffffff?text=Coffee+Machine'
+                'image_url': 'https://via.placeholder.com/400x300/6c757d/ffffff?text=Coffee+Machine',
+                'wanted_categories': ['home'],
+                'wanted_keywords': '',
             },
             {
                 'title': 'PlayStation 4 Pro',
                 'description': 'Игровая консоль с двумя джойстиками и 5 играми. Обменяю на Nintendo Switch или Xbox.',
                 'category': 'electronics',
                 'condition': 'good',
-                'image_url': 'https://via.placeholder.com/400x300/dc3545/ffffff?text=PS4+Pro'
+                'image_url': 'https://via.placeholder.com/400x300/dc3545/ffffff?text=PS4+Pro',
+                'wanted_categories': [],
+                'wanted_keywords': 'Nintendo Switch, Xbox',
             },
             {
                 'title': 'Гитара акустическая Yamaha',
                 'description': 'Отличное звучание, мягкие струны, чехол в комплекте. Ищу электрогитару или синтезатор.',
                 'category': 'other',
                 'condition': 'good',
-                'image_url': 'https://via.placeholder.com/400x300/17a2b8/ffffff?text=Acoustic+Guitar'
+                'image_url': 'https://via.placeholder.com/400x300/17a2b8/ffffff?text=Acoustic+Guitar',
+                'wanted_categories': [],
+                'wanted_keywords': 'электрогитара, синтезатор',
             },
             {
                 'title': 'Набор для фитнеса',
                 'description': 'Гантели, коврик, эспандеры, скакалка. Все новое. Обменяю на велотренажер или эллипсоид.',
                 'category': 'sports',
                 'condition': 'new',
-                'image_url': 'https://via.placeholder.com/400x300/28a745/ffffff?text=Fitness+Set'
+                'image_url': 'https://via.placeholder.com/400x300/28a745/ffffff?text=Fitness+Set',
+                'wanted_categories': ['sports'],
+                'wanted_keywords': 'велотренажер, эллипсоид',
             },
             {
                 'title': 'Куртка кожаная мужская',
                 'description': 'Размер L, натуральная кожа, отличное состояние. Обменяю на другую одежду или обувь.',
                 'category': 'clothing',
                 'condition': 'like_new',
-                'image_url': 'https://via.placeholder.com/400x300/343a40/ffffff?text=Leather+Jacket'
+                'image_url': 'https://via.placeholder.com/400x300/343a40/ffffff?text=Leather+Jacket',
+                'wanted_categories': ['clothing'],
+                'wanted_keywords': 'обувь',
             },
             {
                 'title': 'Lego Technic набор',
                 'description': 'Большой набор 2000+ деталей, все инструкции. Обменяю на другие конструкторы или настольные игры.',
                 'category': 'toys',
                 'condition': 'good',
-                'image_url': 'https://via.placeholder.com/400x300/ffc107/000000?text=Lego+Technic'
+                'image_url': 'https://via.placeholder.com/400x300/ffc107/000000?text=Lego+Technic',
+                'wanted_categories': ['toys'],
+                'wanted_keywords': 'конструктор, настольные игры',
             },
             {
                 'title': 'Фотоаппарат Canon EOS',
                 'description': 'Зеркальная камера с объективом 18-55mm. Ищу видеокамеру или дрон.',
                 'category': 'electronics',
                 'condition': 'good',
-                'image_url': 'https://via.placeholder.com/400x300/6c757d/ffffff?text=Canon+Camera'
+                'image_url': 'https://via.placeholder.com/400x300/6c757d/ffffff?text=Canon+Camera',
+                'wanted_categories': [],
+                'wanted_keywords': 'видеокамера, дрон',
             }
         ]
         
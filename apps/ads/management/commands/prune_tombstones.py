@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.ads.models import Tombstone
+
+
+class Command(BaseCommand):
+    help = 'Удаление старых записей журнала удалений (синхронизация клиентов)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help='Срок хранения в днях (по умолчанию SYNC_TOMBSTONE_DAYS)',
+        )
+
+    def handle(self, *args, **options):
+        days = settings.SYNC_TOMBSTONE_DAYS if options['days'] is None else options['days']
+        deleted, _ = Tombstone.objects.filter(deleted_at__lt=timezone.now() - timedelta(days=days)).delete()
+        self.stdout.write(self.style.SUCCESS(f'Удалено записей журнала: {deleted}'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from apps.ads.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Перестроение полнотекстового индекса объявлений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Алиас базы данных')
+
+    def handle(self, *args, **options):
+        backend = get_search_backend(options['database'])
+        self.stdout.write(f'Поисковый бэкенд: {backend.__class__.__name__}')
+
+        if backend.install():
+            self.stdout.write('Созданы недостающие объекты поискового индекса')
+
+        indexed = backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Индекс перестроен, проиндексировано объявлений: {indexed}'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from apps.ads.similar import BATCH_SIZE, TOP_K, rebuild_similar
+
+
+class Command(BaseCommand):
+    help = 'Пересчет похожих объявлений (TF-IDF по заголовку и описанию)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=TOP_K, help='Сколько соседей хранить у объявления')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Строк матрицы в блоке')
+
+    def handle(self, *args, **options):
+        result = rebuild_similar(
+            k=options['top'],
+            batch_size=options['batch_size'],
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Объявлений: {result["ads"]}, термов: {result["terms"]}, '
+            f'сохранено соседей: {result["links"]} ({result["seconds"]:.2f} с)'
+        ))
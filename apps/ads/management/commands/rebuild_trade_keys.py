@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.ads.wants import BATCH_SIZE, rebuild_trade_keys
+
+
+class Command(BaseCommand):
+    help = 'Перестроение индекса взаимных предложений (ключей обмена) объявлений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Размер пачки вставки')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total = rebuild_trade_keys(
+            batch_size=options['batch_size'],
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Индекс перестроен, ключей: {total} ({time.perf_counter() - started:.2f} с)'
+        ))
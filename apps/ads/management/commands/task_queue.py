@@ -0,0 +1,26 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from barter_platform.tasks import get_backend, registry
+
+
+class Command(BaseCommand):
+    help = 'Состояние очереди фоновых задач'
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        self.stdout.write(f'Бэкенд задач: {backend.__class__.__name__}')
+        self.stdout.write('Зарегистрированные задачи:')
+        for name in sorted(registry):
+            self.stdout.write(f'  {name}')
+        if backend.in_process:
+            # У команды свой процесс и свой пустой пул: очередь сервера отсюда не видна
+            self.stdout.write(self.style.WARNING(
+                f'{backend.__class__.__name__} хранит очередь в памяти процесса сервера, отсюда ее не видно. '
+                'Состояние очереди работающего сервера: GET /api/tasks/ (только для staff). '
+                'Из отдельного процесса опрашивается только CeleryBackend.'
+            ))
+            return
+        state = backend.inspect()
+        self.stdout.write(json.dumps(state, ensure_ascii=False, indent=2, default=str))
@@ -0,0 +1,24 @@
+# Полнотекстовый индекс объявлений: FTS5 в SQLite, tsvector + GIN в PostgreSQL
+
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    from apps.ads.search import get_search_backend
+    get_search_backend(schema_editor.connection.alias).install()
+
+
+def uninstall_search_index(apps, schema_editor):
+    from apps.ads.search import get_search_backend
+    get_search_backend(schema_editor.connection.alias).uninstall()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0002_add_image_field'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
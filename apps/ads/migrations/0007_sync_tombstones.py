@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:13
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0006_conditional_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('ad', 'Объявление'), ('proposal', 'Предложение обмена')], max_length=20, verbose_name='Тип объекта')),
+                ('object_id', models.PositiveIntegerField(verbose_name='ID объекта')),
+                ('sender_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='ID отправителя')),
+                ('receiver_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='ID получателя')),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата удаления')),
+            ],
+            options={
+                'verbose_name': 'Запись об удалении',
+                'verbose_name_plural': 'Записи об удалении',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(fields=['updated_at', 'id'], name='ad_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeproposal',
+            index=models.Index(fields=['sender', 'updated_at'], name='proposal_sender_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeproposal',
+            index=models.Index(fields=['receiver', 'updated_at'], name='proposal_receiver_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['kind', 'deleted_at', 'id'], name='tombstone_kind_deleted_idx'),
+        ),
+    ]
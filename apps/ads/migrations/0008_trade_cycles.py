@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0007_sync_tombstones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TradeCycle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('signature', models.CharField(max_length=255, unique=True, verbose_name='Подпись цикла')),
+                ('length', models.PositiveSmallIntegerField(verbose_name='Число участников')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата обнаружения')),
+                ('proposals', models.ManyToManyField(related_name='trade_cycles', to='ads.exchangeproposal', verbose_name='Предложения')),
+            ],
+            options={
+                'verbose_name': 'Цепочный обмен',
+                'verbose_name_plural': 'Цепочные обмены',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:47
+
+import apps.ads.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0008_trade_cycles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ad',
+            name='wanted_categories',
+            field=models.JSONField(blank=True, default=list, validators=[apps.ads.models.validate_wanted_categories], verbose_name='Нужные категории'),
+        ),
+        migrations.AddField(
+            model_name='ad',
+            name='wanted_keywords',
+            field=models.CharField(blank=True, default='', help_text='Слова через запятую, например: ноутбук, планшет', max_length=200, verbose_name='Что ищу'),
+        ),
+        migrations.CreateModel(
+            name='AdTradeKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner_id', models.PositiveIntegerField(verbose_name='ID владельца')),
+                ('offer', models.CharField(max_length=40, verbose_name='Что предлагает')),
+                ('want', models.CharField(max_length=40, verbose_name='Что хочет')),
+                ('ad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trade_keys', to='ads.ad', verbose_name='Объявление')),
+            ],
+            options={
+                'verbose_name': 'Ключ взаимного обмена',
+                'verbose_name_plural': 'Ключи взаимного обмена',
+                'indexes': [models.Index(fields=['offer', 'want', 'ad', 'owner_id'], name='trade_key_lookup_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0009_ad_wants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarAd',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Близость')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Место')),
+                ('ad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbour_links', to='ads.ad', verbose_name='Объявление')),
+                ('neighbour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbour_of', to='ads.ad', verbose_name='Похожее')),
+            ],
+            options={
+                'verbose_name': 'Похожее объявление',
+                'verbose_name_plural': 'Похожие объявления',
+                'indexes': [models.Index(fields=['ad', 'rank'], name='similar_ad_rank_idx')],
+            },
+        ),
+    ]
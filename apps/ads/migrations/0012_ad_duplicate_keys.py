@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0011_ad_active_user_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdDuplicateKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner_id', models.PositiveIntegerField(verbose_name='ID владельца')),
+                ('band', models.PositiveSmallIntegerField(verbose_name='Полоса')),
+                ('bucket', models.BigIntegerField(verbose_name='Хэш полосы')),
+                ('ad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duplicate_keys', to='ads.ad', verbose_name='Объявление')),
+            ],
+            options={
+                'verbose_name': 'Ключ поиска дубликатов',
+                'verbose_name_plural': 'Ключи поиска дубликатов',
+                'indexes': [models.Index(fields=['band', 'bucket', 'owner_id', 'ad'], name='duplicate_key_lookup_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ads', '0012_ad_duplicate_keys'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ad',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ads', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AlterField(
+            model_name='exchangeproposal',
+            name='ad_sender',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='sent_proposals', to='ads.ad', verbose_name='Объявление отправителя'),
+        ),
+        migrations.AlterField(
+            model_name='exchangeproposal',
+            name='receiver',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='received_proposals', to=settings.AUTH_USER_MODEL, verbose_name='Получатель'),
+        ),
+        migrations.AlterField(
+            model_name='exchangeproposal',
+            name='sender',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='sent_proposals', to=settings.AUTH_USER_MODEL, verbose_name='Отправитель'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-18 08:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0013_drop_redundant_fk_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdSearchEntry',
+            fields=[
+                ('ad', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='ads.ad')),
+            ],
+            options={
+                'db_table': 'ads_ad_fts',
+                'managed': False,
+            },
+        ),
+    ]
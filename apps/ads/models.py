@@ -1,9 +1,20 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.utils import timezone
 import os
 
+from apps.users.counters import CounterChanges, adjust_counters
+
+from .cache import invalidate_ad_details, invalidate_ad_lists
+from .images import generate_image_variants
+from .search import FTS_TABLE
+from . import tasks
+
 
 def ad_image_upload_path(instance, filename):
     """Путь для загрузки изображений объявлений"""
@@ -14,6 +25,25 @@ def ad_image_upload_path(instance, filename):
     return os.path.join('ads', filename)
 
 
+# Поле не загружено (only()/defer()), его изменение не отслеживаем
+DEFERRED = object()
+
+
+def validate_wanted_categories(value):
+    """Нужные категории - список кодов категорий объявлений"""
+    codes = {code for code, _ in Ad.CATEGORY_CHOICES}
+    if not isinstance(value, list) or not all(isinstance(code, str) and code in codes for code in value):
+        raise ValidationError('Укажите список категорий из допустимых')
+
+
+# Поля объявления, из которых строятся ключи взаимного обмена
+TRADE_SOURCE_FIELDS = ('title', 'category', 'wanted_categories', 'wanted_keywords', 'is_active')
+# Поля объявления, из которых строятся ключи поиска дубликатов
+DUPLICATE_SOURCE_FIELDS = ('title', 'description', 'is_active')
+# Поля автора, которые показываются вместе с объявлением (карточки, страницы, API)
+AUTHOR_FIELDS = ('username', 'email')
+
+
 class Ad(models.Model):
     """Модель объявления для обмена"""
     
@@ -38,7 +68,10 @@ class Ad(models.Model):
     
     # id как автоинкрементное поле
     id = models.AutoField(primary_key=True)
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ads', verbose_name='Пользователь')
+    # Отдельный индекс не нужен: user_id - первая колонка ad_user_created_idx
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='ads', verbose_name='Пользователь', db_index=False,
+    )
     title = models.CharField(max_length=200, verbose_name='Заголовок')
     description = models.TextField(verbose_name='Описание')
     # Добавляем поле для загрузки изображений
@@ -50,16 +83,107 @@ class Ad(models.Model):
         help_text='Загрузите изображение товара (максимум 5MB)'
     )
     image_url = models.URLField(blank=True, null=True, verbose_name='URL изображения')
+    # Уменьшенные копии загруженного изображения: {размер: путь в хранилище}
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name='Варианты изображения')
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, verbose_name='Категория')
     condition = models.CharField(max_length=20, choices=CONDITION_CHOICES, verbose_name='Состояние')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
     is_active = models.BooleanField(default=True, verbose_name='Активно')
+    # Что владелец хочет получить взамен: категории и слова (apps/ads/wants.py)
+    wanted_categories = models.JSONField(
+        default=list, blank=True, validators=[validate_wanted_categories], verbose_name='Нужные категории',
+    )
+    wanted_keywords = models.CharField(
+        max_length=200, blank=True, default='', verbose_name='Что ищу',
+        help_text='Слова через запятую, например: ноутбук, планшет',
+    )
     
     class Meta:
         verbose_name = 'Объявление'
         verbose_name_plural = 'Объявления'
         ordering = ['-created_at']
+        indexes = [
+            # Лента активных объявлений и keyset-пагинация по (created_at, id)
+            models.Index(
+                fields=['-created_at', '-id'],
+                name='ad_active_created_idx',
+                condition=models.Q(is_active=True),
+            ),
+            # Фильтры ленты по категории и состоянию
+            models.Index(
+                fields=['category', '-created_at', '-id'],
+                name='ad_active_category_idx',
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                fields=['condition', '-created_at', '-id'],
+                name='ad_active_condition_idx',
+                condition=models.Q(is_active=True),
+            ),
+            # Валидаторы ETag/Last-Modified для ленты: max(updated_at) и количество
+            # (apps/ads/conditional.py) считаются по индексу, без чтения таблицы
+            models.Index(
+                fields=['updated_at'],
+                name='ad_active_updated_idx',
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                fields=['category', 'updated_at'],
+                name='ad_active_category_upd_idx',
+                condition=models.Q(is_active=True),
+            ),
+            # Синхронизация (?since=): изменения после курсора, включая неактивные
+            models.Index(fields=['updated_at', 'id'], name='ad_updated_idx'),
+            # Объявления пользователя: "Мои объявления", профиль, страница объявления.
+            # Фильтр is_active проверяется по строкам одного пользователя
+            models.Index(fields=['user', '-created_at'], name='ad_user_created_idx'),
+            # Случайные объявления пользователя (apps/ads/sampling.py): ближайший id без сортировки
+            models.Index(
+                fields=['user', 'id'],
+                name='ad_active_user_idx',
+                condition=models.Q(is_active=True),
+            ),
+        ]
+    
+    # Изображение, активность, категория и поля ключей обмена на момент загрузки из базы (у новых объявлений - нет)
+    _loaded_image = None
+    _loaded_is_active = None
+    _loaded_category = None
+    _loaded_trade_source = None
+    _loaded_duplicate_source = None
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем исходное изображение, чтобы при сохранении понять, заменено ли оно
+        instance._loaded_image = instance._image_name() if 'image' in field_names else DEFERRED
+        # и активность - для счетчика активных объявлений в профиле
+        instance._loaded_is_active = instance.is_active if 'is_active' in field_names else DEFERRED
+        # и категорию - для сброса кэша списков прежней категории
+        instance._loaded_category = instance.category if 'category' in field_names else DEFERRED
+        # и поля, из которых строятся ключи взаимного обмена
+        instance._loaded_trade_source = (
+            instance.trade_source() if all(name in field_names for name in TRADE_SOURCE_FIELDS) else DEFERRED
+        )
+        # и ключей поиска дубликатов
+        instance._loaded_duplicate_source = (
+            instance.duplicate_source() if all(name in field_names for name in DUPLICATE_SOURCE_FIELDS) else DEFERRED
+        )
+        return instance
+    
+    def trade_source(self):
+        """Значения полей, от которых зависят ключи взаимного обмена (apps/ads/wants.py)"""
+        return (self.title, self.category, tuple(self.wanted_categories or ()), self.wanted_keywords, self.is_active)
+    
+    def duplicate_source(self):
+        """Значения полей, от которых зависят ключи поиска дубликатов (apps/ads/duplicates.py)"""
+        return (self.title, self.description, self.is_active)
+    
+    def get_wanted_categories_display(self):
+        """Названия нужных категорий через запятую"""
+        labels = dict(self.CATEGORY_CHOICES)
+        return ', '.join(labels.get(code, code) for code in self.wanted_categories or ())
     
     def __str__(self):
         return self.title
@@ -67,14 +191,60 @@ class Ad(models.Model):
     def get_absolute_url(self):
         return reverse('ads:ad_detail', kwargs={'pk': self.pk})
     
-    def get_image_url(self):
-        """Получить URL изображения (приоритет: загруженное изображение, затем URL)"""
+    def get_image_url(self, size=None):
+        """
+        Получить URL изображения (приоритет: загруженное изображение, затем URL).
+        
+        size - имя варианта из IMAGE_VARIANTS ('card', 'detail', 'admin');
+        если вариант еще не готов, возвращается оригинал.
+        """
         if self.image:
+            if size and size in self.image_variants:
+                return self.image.storage.url(self.image_variants[size])
             return self.image.url
         elif self.image_url:
             return self.image_url
         return None
     
+    def _image_name(self):
+        value = self.__dict__.get('image')
+        return getattr(value, 'name', value) or None
+    
+    def save(self, *args, **kwargs):
+        """Сохранение с пересозданием вариантов изображения при его замене"""
+        image_changed = (
+            self._loaded_image is not DEFERRED
+            and self._image_name() != self._loaded_image
+        )
+        # Старый оригинал и его варианты больше не нужны
+        old_files = [self._loaded_image, *self.image_variants.values()] if image_changed else []
+        if image_changed:
+            self.image_variants = {}
+        
+        super().save(*args, **kwargs)
+        
+        if image_changed:
+            self._loaded_image = self._image_name()
+            old_files = [name for name in old_files if name and name != self._loaded_image]
+            if old_files:
+                tasks.delete_files.delay(old_files)
+            if self.image:
+                # Варианты генерируются в фоне, до готовности показывается оригинал
+                tasks.process_ad_image.delay(self.pk, self.image.name)
+    
+    def process_image(self):
+        """Сгенерировать варианты изображения и сохранить их пути"""
+        self.image_variants = generate_image_variants(self.image)
+        self.updated_at = timezone.now()
+        # update() вместо save(): не трогаем остальные поля и не запускаем обработку повторно
+        Ad.objects.filter(pk=self.pk).update(
+            image_variants=self.image_variants,
+            updated_at=self.updated_at,
+        )
+        # В карточках списка показывается уменьшенная копия
+        invalidate_ad_lists(self.category)
+        invalidate_ad_details(self.pk)
+    
     def can_edit(self, user):
         """Проверка прав на редактирование"""
         return self.user == user
@@ -85,11 +255,16 @@ class Ad(models.Model):
     
     def delete(self, *args, **kwargs):
         """Переопределяем удаление для удаления файла изображения"""
-        if self.image:
-            # Удаляем файл изображения при удалении объявления
-            if os.path.isfile(self.image.path):
-                os.remove(self.image.path)
-        super().delete(*args, **kwargs)
+        files = [self.image.name, *self.image_variants.values()] if self.image else []
+        result = super().delete(*args, **kwargs)
+        if files:
+            # Удаляем файл изображения и его варианты после удаления объявления
+            tasks.delete_files.delay(files)
+        return result
+
+
+class ProposalConflict(Exception):
+    """Предложение нельзя принять или отклонить: оно уже обработано или объявление недоступно"""
 
 
 class ExchangeProposal(models.Model):
@@ -103,10 +278,18 @@ class ExchangeProposal(models.Model):
     
     # id как автоинкрементное поле
     id = models.AutoField(primary_key=True)
-    ad_sender = models.ForeignKey(Ad, on_delete=models.CASCADE, related_name='sent_proposals', verbose_name='Объявление отправителя')
+    # Отдельный индекс не нужен: ad_sender_id - первая колонка уникального индекса (ad_sender, ad_receiver)
+    ad_sender = models.ForeignKey(
+        Ad, on_delete=models.CASCADE, related_name='sent_proposals', verbose_name='Объявление отправителя', db_index=False,
+    )
     ad_receiver = models.ForeignKey(Ad, on_delete=models.CASCADE, related_name='received_proposals', verbose_name='Объявление получателя')
-    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_proposals', verbose_name='Отправитель')
-    receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_proposals', verbose_name='Получатель')
+    # Отдельные индексы пользователей не нужны: они первые колонки индексов по статусу
+    sender = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='sent_proposals', verbose_name='Отправитель', db_index=False,
+    )
+    receiver = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='received_proposals', verbose_name='Получатель', db_index=False,
+    )
     comment = models.TextField(verbose_name='Комментарий')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='Статус')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
@@ -117,6 +300,35 @@ class ExchangeProposal(models.Model):
         verbose_name_plural = 'Предложения обмена'
         ordering = ['-created_at']
         unique_together = ['ad_sender', 'ad_receiver']
+        indexes = [
+            # Отправленные и полученные предложения с фильтром по статусу
+            models.Index(fields=['sender', 'status', '-created_at'], name='proposal_sender_status_idx'),
+            models.Index(fields=['receiver', 'status', '-created_at'], name='proposal_receiver_status_idx'),
+            # Синхронизация предложений пользователя (?since=)
+            models.Index(fields=['sender', 'updated_at'], name='proposal_sender_updated_idx'),
+            models.Index(fields=['receiver', 'updated_at'], name='proposal_receiver_updated_idx'),
+            # Ожидающие предложения по объявлению: конкурирующие предложения при обмене
+            models.Index(
+                fields=['ad_sender'],
+                name='proposal_pending_ad_sender_idx',
+                condition=models.Q(status='pending'),
+            ),
+            models.Index(
+                fields=['ad_receiver'],
+                name='proposal_pending_ad_recv_idx',
+                condition=models.Q(status='pending'),
+            ),
+        ]
+    
+    # Статус на момент загрузки из базы (у новых предложений - нет)
+    _loaded_status = None
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем статус для счетчиков предложений в профилях участников
+        instance._loaded_status = instance.status if 'status' in field_names else DEFERRED
+        return instance
     
     def __str__(self):
         return f'Обмен: {self.ad_sender.title} на {self.ad_receiver.title}'
@@ -130,16 +342,458 @@ class ExchangeProposal(models.Model):
         return self.receiver == user and self.status == 'pending'
     
     def accept(self):
-        """Принять предложение"""
-        self.status = 'accepted'
-        self.save()
-        # Деактивировать объявления после успешного обмена
-        self.ad_sender.is_active = False
-        self.ad_sender.save()
-        self.ad_receiver.is_active = False
-        self.ad_receiver.save()
+        """
+        Принять предложение.
+        
+        В одной транзакции блокирует оба объявления, деактивирует их и отклоняет
+        остальные ожидающие предложения с этими объявлениями. Возвращает количество
+        отклоненных конкурирующих предложений.
+        """
+        ad_ids = sorted([self.ad_sender_id, self.ad_receiver_id])
+        now = timezone.now()
+        counters = CounterChanges()
+        with transaction.atomic():
+            # Блокируем объявления в порядке id, чтобы встречные обмены не взаимоблокировались
+            locked = list(
+                Ad.objects.select_for_update()
+                .filter(pk__in=ad_ids, is_active=True)
+                .order_by('pk')
+                .values_list('pk', 'user_id', 'category')
+            )
+            if len(locked) != len(ad_ids):
+                raise ProposalConflict('Объявление уже недоступно для обмена')
+            
+            # Условный UPDATE: из параллельных принятий пройдет только одно
+            if not ExchangeProposal.objects.filter(pk=self.pk, status='pending').update(
+                status='accepted', updated_at=now
+            ):
+                raise ProposalConflict('Предложение уже обработано')
+            counters.change_proposal_status('pending', 'accepted', self.sender_id, self.receiver_id)
+            
+            # Деактивировать объявления после успешного обмена
+            Ad.objects.filter(pk__in=ad_ids).update(is_active=False, updated_at=now)
+            AdTradeKey.objects.filter(ad__in=ad_ids).delete()
+            AdDuplicateKey.objects.filter(ad__in=ad_ids).delete()
+            for _, owner_id, _ in locked:
+                counters.add(owner_id, 'active_ads_count', -1)
+            invalidate_ad_lists(*(category for _, _, category in locked))
+            invalidate_ad_details(*ad_ids)
+            
+            # Конкурирующие предложения блокируем, чтобы списать их со счетчиков участников
+            competing = list(
+                ExchangeProposal.objects.select_for_update()
+                .filter(Q(ad_sender__in=ad_ids) | Q(ad_receiver__in=ad_ids), status='pending')
+                .values_list('pk', 'sender_id', 'receiver_id')
+            )
+            rejected = ExchangeProposal.objects.filter(
+                pk__in=[pk for pk, _, _ in competing]
+            ).update(status='rejected', updated_at=now)
+            for _, sender_id, receiver_id in competing:
+                counters.change_proposal_status('pending', 'rejected', sender_id, receiver_id)
+            counters.apply()
+        
+        self.status = self._loaded_status = 'accepted'
+        self.updated_at = now
+        for ad in (self.ad_sender, self.ad_receiver):
+            ad.is_active = ad._loaded_is_active = False
+            ad.updated_at = now
+        self.notify_sender()
+        return rejected
     
     def reject(self):
         """Отклонить предложение"""
-        self.status = 'rejected'
-        self.save()
\ No newline at end of file
+        now = timezone.now()
+        counters = CounterChanges()
+        with transaction.atomic():
+            if not ExchangeProposal.objects.filter(pk=self.pk, status='pending').update(
+                status='rejected', updated_at=now
+            ):
+                raise ProposalConflict('Предложение уже обработано')
+            counters.change_proposal_status('pending', 'rejected', self.sender_id, self.receiver_id)
+            counters.apply()
+        self.status = self._loaded_status = 'rejected'
+        self.updated_at = now
+        self.notify_sender()
+    
+    def sender_notification(self):
+        """Уведомление отправителю о решении: (user_id, тема, текст)"""
+        return (
+            self.sender_id,
+            f'Предложение обмена {self.get_status_display().lower()}',
+            f'Ваше предложение обменять «{self.ad_sender.title}» на «{self.ad_receiver.title}» '
+            f'{self.get_status_display().lower()}.',
+        )
+    
+    def notify_sender(self):
+        """Уведомить отправителя о решении по предложению"""
+        tasks.send_notification.delay(*self.sender_notification())
+
+
+class Tombstone(models.Model):
+    """
+    Запись об удалении объявления или предложения.
+    
+    Нужна синхронизации (apps/ads/sync.py): клиент узнает об удалении объекта,
+    которого в базе уже нет. Записи старше SYNC_TOMBSTONE_DAYS удаляет команда
+    prune_tombstones.
+    """
+    
+    KIND_AD = 'ad'
+    KIND_PROPOSAL = 'proposal'
+    KIND_CHOICES = [
+        (KIND_AD, 'Объявление'),
+        (KIND_PROPOSAL, 'Предложение обмена'),
+    ]
+    
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name='Тип объекта')
+    object_id = models.PositiveIntegerField(verbose_name='ID объекта')
+    # Участники удаленного предложения: удаление видно только им
+    sender_id = models.PositiveIntegerField(null=True, blank=True, verbose_name='ID отправителя')
+    receiver_id = models.PositiveIntegerField(null=True, blank=True, verbose_name='ID получателя')
+    deleted_at = models.DateTimeField(default=timezone.now, verbose_name='Дата удаления')
+    
+    class Meta:
+        verbose_name = 'Запись об удалении'
+        verbose_name_plural = 'Записи об удалении'
+        indexes = [
+            models.Index(fields=['kind', 'deleted_at', 'id'], name='tombstone_kind_deleted_idx'),
+        ]
+    
+    def __str__(self):
+        return f'{self.get_kind_display()} #{self.object_id}, удалено {self.deleted_at:%d.%m.%Y %H:%M}'
+
+
+class AdTradeKey(models.Model):
+    """
+    Ключ взаимного обмена: активное объявление предлагает offer и хочет want.
+    
+    Термы - категории ('c:books') и слова ('w:ноутбу'), см. apps/ads/wants.py.
+    Объявления X и Y подходят друг другу, если у X есть ключ (a, b), а у Y -
+    (b, a): поиск пары - выборка по индексу (offer, want).
+    """
+    
+    ad = models.ForeignKey(Ad, on_delete=models.CASCADE, related_name='trade_keys', verbose_name='Объявление')
+    # Владелец объявления: свои объявления в подборку не попадают
+    owner_id = models.PositiveIntegerField(verbose_name='ID владельца')
+    offer = models.CharField(max_length=40, verbose_name='Что предлагает')
+    want = models.CharField(max_length=40, verbose_name='Что хочет')
+    
+    class Meta:
+        verbose_name = 'Ключ взаимного обмена'
+        verbose_name_plural = 'Ключи взаимного обмена'
+        indexes = [
+            # owner_id в индексе: подборка читает только индекс, без строк таблицы
+            models.Index(fields=['offer', 'want', 'ad', 'owner_id'], name='trade_key_lookup_idx'),
+        ]
+    
+    def __str__(self):
+        return f'#{self.ad_id}: {self.offer} -> {self.want}'
+
+
+class AdDuplicateKey(models.Model):
+    """
+    Ключ поиска дубликатов: полоса MinHash-подписи текста активного объявления.
+    
+    Подпись считает apps/ads/duplicates.py. Объявления с почти одинаковым текстом
+    с высокой вероятностью совпадают хотя бы в одной полосе: кандидаты в
+    дубликаты - выборка по индексу (band, bucket).
+    """
+    
+    ad = models.ForeignKey(Ad, on_delete=models.CASCADE, related_name='duplicate_keys', verbose_name='Объявление')
+    # Владелец объявления: форма и API ищут дубликаты среди объявлений автора
+    owner_id = models.PositiveIntegerField(verbose_name='ID владельца')
+    band = models.PositiveSmallIntegerField(verbose_name='Полоса')
+    bucket = models.BigIntegerField(verbose_name='Хэш полосы')
+    
+    class Meta:
+        verbose_name = 'Ключ поиска дубликатов'
+        verbose_name_plural = 'Ключи поиска дубликатов'
+        indexes = [
+            models.Index(fields=['band', 'bucket', 'owner_id', 'ad'], name='duplicate_key_lookup_idx'),
+        ]
+    
+    def __str__(self):
+        return f'#{self.ad_id}: {self.band}/{self.bucket}'
+
+
+class AdSearchEntry(models.Model):
+    """
+    Строка полнотекстового индекса SQLite (виртуальная таблица FTS5, apps/ads/search.py).
+
+    Таблицу создает и поддерживает SQLiteSearchBackend, модель нужна только для
+    соединения с объявлениями в ранжированном поиске: MATCH и bm25 вычисляются
+    по строке соединения, а не подзапросом на каждое объявление. В других СУБД
+    таблицы нет, и модель не используется.
+    """
+    
+    ad = models.OneToOneField(
+        Ad, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid', db_constraint=False,
+        related_name='search_entry',
+    )
+    
+    class Meta:
+        managed = False
+        db_table = FTS_TABLE
+
+
+class SimilarAd(models.Model):
+    """
+    Похожее объявление: сосед ad по тексту заголовка и описания.
+    
+    Соседей считает apps/ads/similar.py (TF-IDF, косинусная близость) - пакетно
+    командой rebuild_similar_ads и фоновой задачей для новых объявлений.
+    Страница объявления читает готовый список по индексу (ad, rank).
+    """
+    
+    ad = models.ForeignKey(Ad, on_delete=models.CASCADE, related_name='neighbour_links', verbose_name='Объявление')
+    neighbour = models.ForeignKey(Ad, on_delete=models.CASCADE, related_name='neighbour_of', verbose_name='Похожее')
+    score = models.FloatField(verbose_name='Близость')
+    # Место в списке соседей: 0 - самое похожее
+    rank = models.PositiveSmallIntegerField(verbose_name='Место')
+    
+    class Meta:
+        verbose_name = 'Похожее объявление'
+        verbose_name_plural = 'Похожие объявления'
+        indexes = [
+            models.Index(fields=['ad', 'rank'], name='similar_ad_rank_idx'),
+        ]
+    
+    def __str__(self):
+        return f'#{self.ad_id} ~ #{self.neighbour_id} ({self.score:.2f})'
+
+
+class TradeCycle(models.Model):
+    """
+    Найденный цепочный обмен: ожидающие предложения, замкнутые в цикл.
+    
+    Каждый участник отдает объявление, предложенное им, и получает то, которое
+    просил: A предлагает свое за объявление B, B - свое за объявление C, C - за
+    объявление A. Циклы ищет apps/ads/cycles.py; цикл перестает показываться,
+    как только одно из его предложений обработано или объявление неактивно.
+    """
+    
+    # id предложений цикла по возрастанию через '-': один цикл хранится один раз
+    signature = models.CharField(max_length=255, unique=True, verbose_name='Подпись цикла')
+    length = models.PositiveSmallIntegerField(verbose_name='Число участников')
+    proposals = models.ManyToManyField(ExchangeProposal, related_name='trade_cycles', verbose_name='Предложения')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата обнаружения')
+    
+    class Meta:
+        verbose_name = 'Цепочный обмен'
+        verbose_name_plural = 'Цепочные обмены'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f'Цепочный обмен #{self.pk}, участников: {self.length}'
+    
+    def ordered_proposals(self):
+        """Предложения в порядке цикла: объявление, которое просят в одном, предлагают в следующем"""
+        proposals = list(self.proposals.all())
+        if not proposals:
+            return []
+        by_sender_ad = {proposal.ad_sender_id: proposal for proposal in proposals}
+        current = min(proposals, key=lambda proposal: proposal.pk)
+        ordered = [current]
+        while len(ordered) < len(proposals):
+            current = by_sender_ad.get(current.ad_receiver_id)
+            if current is None or current is ordered[0]:
+                break
+            ordered.append(current)
+        return ordered
+
+
+@receiver(post_save, sender=ExchangeProposal)
+def notify_proposal_receiver(sender, instance, created, **kwargs):
+    """Уведомить получателя о новом предложении обмена"""
+    if created:
+        tasks.send_notification.delay(
+            instance.receiver_id,
+            'Новое предложение обмена',
+            f'Пользователь {instance.sender.username} предлагает обменять '
+            f'«{instance.ad_sender.title}» на ваше объявление «{instance.ad_receiver.title}».',
+        )
+
+@receiver(post_save, sender=Ad)
+def update_active_ads_counter(sender, instance, created, **kwargs):
+    """Счетчик активных объявлений при создании, деактивации и повторной активации"""
+    was_active = False if created else instance._loaded_is_active
+    if was_active is DEFERRED:
+        return
+    if instance.is_active != was_active:
+        adjust_counters(instance.user_id, active_ads_count=1 if instance.is_active else -1)
+    instance._loaded_is_active = instance.is_active
+
+
+@receiver(post_save, sender=Ad)
+def update_trade_keys(sender, instance, created, **kwargs):
+    """Пересобрать ключи взаимного обмена, если изменились их поля"""
+    from .wants import refresh_trade_keys
+    
+    source = instance.trade_source()
+    if created:
+        # Объявлению без пожеланий ключи не нужны
+        changed = bool(instance.wanted_categories or instance.wanted_keywords)
+    else:
+        changed = instance._loaded_trade_source not in (DEFERRED, source)
+    if changed:
+        refresh_trade_keys([instance], replace=not created)
+    instance._loaded_trade_source = source
+
+
+@receiver(post_save, sender=Ad)
+def update_duplicate_keys(sender, instance, created, **kwargs):
+    """Пересобрать ключи поиска дубликатов, если изменился текст или активность"""
+    from .duplicates import refresh_duplicate_keys
+    
+    source = instance.duplicate_source()
+    if created:
+        changed = instance.is_active
+    else:
+        changed = instance._loaded_duplicate_source not in (DEFERRED, source)
+    if changed:
+        refresh_duplicate_keys([instance], replace=not created)
+    instance._loaded_duplicate_source = source
+
+
+@receiver(post_save, sender=Ad)
+def find_similar_ads(sender, instance, created, **kwargs):
+    """Новое объявление получает похожие и само попадает в списки похожих"""
+    if created and instance.is_active:
+        tasks.update_similar_ads.delay([instance.pk])
+
+
+@receiver(post_save, sender=Ad)
+def invalidate_ad_cache(sender, instance, created, **kwargs):
+    """Сбросить карточку и кэш списков категории объявления (и прежней категории при ее смене)"""
+    invalidate_ad_details(instance.pk)
+    if instance._loaded_category is DEFERRED:
+        invalidate_ad_lists()
+    else:
+        invalidate_ad_lists(instance.category, instance._loaded_category)
+    instance._loaded_category = instance.__dict__.get('category', DEFERRED)
+
+
+@receiver(post_delete, sender=Ad)
+def invalidate_deleted_ad_cache(sender, instance, **kwargs):
+    """Удаленное объявление пропадает из кэша карточек и списков своей категории"""
+    invalidate_ad_details(instance.pk)
+    category = instance.__dict__.get('category')
+    invalidate_ad_lists(*([category] if category else []))
+
+
+@receiver(post_init, sender=User)
+def remember_author_fields(sender, instance, **kwargs):
+    """Поля автора на момент загрузки: при сохранении видно, изменились ли они"""
+    instance._loaded_author = tuple(instance.__dict__.get(name, DEFERRED) for name in AUTHOR_FIELDS)
+
+
+@receiver(post_save, sender=User)
+def touch_author_ads(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Смена имени или email автора меняет все его объявления.
+
+    updated_at объявлений сдвигается одним UPDATE: от него зависят фрагменты
+    карточек, ETag/Last-Modified и лента изменений; кэш списков и карточек
+    сбрасывается после коммита.
+    """
+    if update_fields is not None and not set(AUTHOR_FIELDS) & set(update_fields):
+        return
+    author = tuple(getattr(instance, name) for name in AUTHOR_FIELDS)
+    if not created and instance._loaded_author != author:
+        ads = Ad.objects.filter(user=instance)
+        pks = list(ads.values_list('pk', flat=True))
+        if pks:
+            ads.update(updated_at=timezone.now())
+            invalidate_ad_lists()
+            invalidate_ad_details(*pks)
+    instance._loaded_author = author
+
+
+@receiver(post_delete, sender=Ad)
+def release_active_ads_counter(sender, instance, **kwargs):
+    """Счетчик активных объявлений при удалении объявления"""
+    if instance._loaded_is_active is True:
+        adjust_counters(instance.user_id, active_ads_count=-1)
+
+
+@receiver(post_save, sender=ExchangeProposal)
+def match_trade_cycles(sender, instance, created, **kwargs):
+    """Новое предложение может замкнуть цикл обменов - ищем циклы через него"""
+    if created and instance.status == 'pending':
+        tasks.match_trade_cycles.delay(instance.pk, instance.ad_sender_id, instance.ad_receiver_id)
+
+
+@receiver(post_save, sender=ExchangeProposal)
+def update_proposal_counters(sender, instance, created, **kwargs):
+    """Счетчики предложений при создании и смене статуса через save()"""
+    old_status = None if created else instance._loaded_status
+    if old_status is DEFERRED:
+        return
+    counters = CounterChanges()
+    counters.change_proposal_status(old_status, instance.status, instance.sender_id, instance.receiver_id)
+    counters.apply()
+    instance._loaded_status = instance.status
+
+
+@receiver(pre_delete, sender=Ad)
+def release_ad_proposal_counters(sender, instance, origin=None, **kwargs):
+    """Счетчики предложений объявления, которые будут удалены каскадно, - одним пересчетом"""
+    if origin is not instance:
+        return
+    counters = CounterChanges()
+    proposals = ExchangeProposal.objects.filter(
+        Q(ad_sender=instance) | Q(ad_receiver=instance)
+    ).values_list('status', 'sender_id', 'receiver_id')
+    for status, sender_id, receiver_id in proposals:
+        counters.add_proposal(status, sender_id, receiver_id, -1)
+    counters.apply()
+
+
+@receiver(post_delete, sender=ExchangeProposal)
+def release_proposal_counters(sender, instance, origin=None, **kwargs):
+    """Счетчики предложений при удалении (в том числе каскадном)"""
+    if instance._loaded_status in (None, DEFERRED):
+        return
+    # Предложения удаляемого объявления уже списаны в release_ad_proposal_counters
+    if isinstance(origin, Ad):
+        return
+    counters = CounterChanges()
+    counters.add_proposal(instance._loaded_status, instance.sender_id, instance.receiver_id, -1)
+    counters.apply()
+
+
+@receiver(pre_delete, sender=Ad)
+def record_ad_tombstones(sender, instance, origin=None, **kwargs):
+    """Удаление объявления и его предложений (каскадных) - в журнал одной вставкой"""
+    if origin is not instance:
+        return
+    proposals = ExchangeProposal.objects.filter(
+        Q(ad_sender=instance) | Q(ad_receiver=instance)
+    ).values_list('pk', 'sender_id', 'receiver_id')
+    Tombstone.objects.bulk_create([
+        Tombstone(kind=Tombstone.KIND_AD, object_id=instance.pk),
+        *(
+            Tombstone(kind=Tombstone.KIND_PROPOSAL, object_id=pk, sender_id=sender_id, receiver_id=receiver_id)
+            for pk, sender_id, receiver_id in proposals
+        ),
+    ])
+
+
+@receiver(post_delete, sender=Ad)
+def record_ad_tombstone(sender, instance, origin=None, **kwargs):
+    """Удаление объявления в составе QuerySet.delete() попадает в журнал"""
+    # Удаление самого объявления уже записано в record_ad_tombstones
+    if origin is not instance:
+        Tombstone.objects.create(kind=Tombstone.KIND_AD, object_id=instance.pk)
+
+
+@receiver(post_delete, sender=ExchangeProposal)
+def record_proposal_tombstone(sender, instance, origin=None, **kwargs):
+    """Удаление предложения попадает в журнал"""
+    # Предложения удаляемого объявления уже записаны в record_ad_tombstones
+    if isinstance(origin, Ad):
+        return
+    Tombstone.objects.create(
+        kind=Tombstone.KIND_PROPOSAL, object_id=instance.pk,
+        sender_id=instance.sender_id, receiver_id=instance.receiver_id,
+    )
@@ -0,0 +1,176 @@
+"""
+Keyset-пагинация по паре (created_at, id).
+
+В отличие от LIMIT/OFFSET не требует COUNT(*) и не просматривает пропущенные
+строки, поэтому время получения страницы не зависит от ее номера.
+
+Курсор - позиция в порядке (created_at, id), поэтому queryset должен быть
+отсортирован по created_at в любую сторону. Другая сортировка (по updated_at,
+по релевантности поиска) дает KeysetOrderingError: молча заменить ее на
+created_at значило бы отдать не тот порядок, который просил клиент.
+"""
+import base64
+import binascii
+
+from django.utils.dateparse import parse_datetime
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+CURSOR_PARAM = 'cursor'
+# Поля, которые могут идти в сортировке после created_at: порядок между
+# объявлениями с одинаковым created_at курсор все равно задает по id
+TIEBREAK_FIELDS = {'id', '-id', 'pk', '-pk'}
+
+
+class KeysetOrderingError(ValueError):
+    """Сортировка queryset несовместима с keyset-пагинацией"""
+
+
+def encode_cursor(created_at, pk):
+    """Закодировать позицию (created_at, id) в строку курсора"""
+    raw = f'{created_at.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(value):
+    """Раскодировать курсор; ValueError при некорректном значении"""
+    try:
+        padded = value + '=' * (-len(value) % 4)
+        created_at, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        created_at = parse_datetime(created_at)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise ValueError('Некорректный курсор')
+    if created_at is None:
+        raise ValueError('Некорректный курсор')
+    return created_at, pk
+
+
+def is_descending(queryset):
+    """Направление сортировки по created_at (без сортировки - новые сначала)"""
+    ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+    if not ordering:
+        return True
+    first, rest = ordering[0], ordering[1:]
+    if first not in ('created_at', '-created_at') or not set(rest) <= TIEBREAK_FIELDS:
+        raise KeysetOrderingError('Курсор работает только с сортировкой по дате создания (ordering=created_at или -created_at)')
+    return first == '-created_at'
+
+
+def row_position(row):
+    """Позиция строки: поддерживаются и объекты моделей, и словари из values()"""
+    if isinstance(row, dict):
+        return row['created_at'], row['id']
+    return row.created_at, row.pk
+
+
+def keyset_page(queryset, cursor, page_size, descending=None):
+    """
+    Получить страницу после курсора.
+
+    Возвращает (список объектов, курсор следующей страницы или None).
+    """
+    if descending is None:
+        descending = is_descending(queryset)
+
+    if descending:
+        queryset = queryset.order_by('-created_at', '-id')
+    else:
+        queryset = queryset.order_by('created_at', 'id')
+
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        if descending:
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            )
+        else:
+            queryset = queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+            )
+
+    # Лишняя строка показывает, есть ли следующая страница, без COUNT(*)
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(*row_position(rows[-1]))
+    return rows, next_cursor
+
+
+class KeysetPagination(BasePagination):
+    """Keyset-пагинация для API: только ссылка на следующую страницу, без общего количества"""
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = CURSOR_PARAM
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+            if size > 0:
+                return min(size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        cursor = request.query_params.get(self.cursor_query_param)
+        try:
+            rows, self.next_cursor = keyset_page(queryset, cursor, self.get_page_size(request))
+        except KeysetOrderingError as error:
+            raise ValidationError({self.cursor_query_param: str(error)})
+        except ValueError:
+            raise NotFound('Некорректный курсор')
+        return rows
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class StandardPagination(PageNumberPagination):
+    """
+    Постраничная пагинация с опциональным keyset-режимом.
+
+    По умолчанию работает как PageNumberPagination (?page=N). Если в запросе
+    есть параметр cursor (в том числе пустой, для первой страницы), используется
+    KeysetPagination.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if CURSOR_PARAM in request.query_params:
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.keyset = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
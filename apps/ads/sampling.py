@@ -0,0 +1,107 @@
+"""
+Случайная выборка строк без order_by('?').
+
+order_by('?') вычисляет случайное число для каждой подходящей строки и сортирует
+их все, поэтому время растет с размером выборки. random_sample обходится обычно
+двумя запросами при любом размере:
+
+1. первые FULL_SCAN_LIMIT id выборки и последний id - по индексу. Если строк не
+   больше FULL_SCAN_LIMIT, это все id: нужные выбираются равномерно в Python;
+2. иначе между первым и последним id берутся случайные точки, и для каждой -
+   ближайшая строка: половина вверх (первая с id >= точки), половина вниз
+   (последняя с id <= точки). Все точки - подзапросы с LIMIT 1 в одном запросе.
+
+Точки могут попасть в одну и ту же строку. Если строк вышло меньше size,
+недостающие добираются новыми точками без уже найденных строк (до TOP_UP_ROUNDS
+запросов), а в крайнем случае - первыми по id, так что меньше size объектов
+бывает, только если столько строк нет.
+
+Во втором случае выборка не строго равномерная: строка после большого пропуска
+id выпадает чаще - для витрин и блоков "другие объявления" этого достаточно.
+Подзапросы быстрые, только если у фильтров выборки есть индекс, заканчивающийся
+на id (как ad_active_user_idx для объявлений пользователя); иначе база сортирует
+все подходящие строки на каждую точку.
+"""
+import random
+import time
+
+from django.db.models import Q
+
+# До стольких строк id читаются целиком и выборка точная
+FULL_SCAN_LIMIT = 500
+# Точек на каждый нужный объект: совпавшие строки отбрасываются
+OVERSAMPLE = 2
+# Сколько раз добирать точки, если их строки совпали и объектов меньше size
+TOP_UP_ROUNDS = 3
+# Размер витрины случайных объявлений на главной
+SHOWCASE_SIZE = 6
+# Как долго витрина отдается из кэша без пересчета, с
+SHOWCASE_TTL = 60
+
+
+def random_sample(queryset, size, rng=random):
+    """size (или меньше, если строк меньше size) случайных объектов queryset в случайном порядке"""
+    if size <= 0:
+        return []
+    ids = queryset.values('pk')
+    # Фильтры queryset уже внутри подзапросов. Внешние запросы - только по pk:
+    # с фильтром (например, user=) база может выбрать его индекс и пройти все строки
+    rows = queryset.model._default_manager.all()
+    rows.query.select_related = queryset.query.select_related
+    rows.query.deferred_loading = queryset.query.deferred_loading
+    up, down = ids.order_by('pk'), ids.order_by('-pk')
+    head = sorted(rows.filter(
+        Q(pk__in=up[:FULL_SCAN_LIMIT]) | Q(pk__in=down[:1])
+    ).values_list('pk', flat=True))
+    if len(head) <= FULL_SCAN_LIMIT:
+        objects = list(rows.filter(pk__in=rng.sample(head, min(size, len(head)))))
+        rng.shuffle(objects)
+        return objects
+
+    objects = {}
+    for _ in range(TOP_UP_ROUNDS):
+        missing = size - len(objects)
+        if not missing:
+            break
+        # Найденные строки исключаются из подзапросов: повторная точка дает новую строку
+        rest_up, rest_down = up.exclude(pk__in=list(objects)), down.exclude(pk__in=list(objects))
+        condition = Q()
+        for i in range(missing * OVERSAMPLE):
+            pivot = rng.randint(head[0], head[-1])
+            if i % 2:
+                condition |= Q(pk__in=rest_down.filter(pk__lte=pivot)[:1])
+            else:
+                condition |= Q(pk__in=rest_up.filter(pk__gte=pivot)[:1])
+        found = list(rows.filter(condition))
+        rng.shuffle(found)
+        objects.update((obj.pk, obj) for obj in found[:missing])
+    missing = size - len(objects)
+    if missing:
+        # Точки все время попадали в уже найденные строки - добираем первыми по id
+        objects.update((obj.pk, obj) for obj in rows.filter(pk__in=ids.exclude(pk__in=list(objects))[:missing]))
+    objects = list(objects.values())
+    rng.shuffle(objects)
+    return objects
+
+
+def random_active_ads(size=SHOWCASE_SIZE, rng=random):
+    """Случайные активные объявления для витрины (хранится в кэше, см. cacheable_ads)"""
+    from .cache import cacheable_ads
+    from .models import Ad
+
+    return random_sample(cacheable_ads(Ad.objects.filter(is_active=True)), size, rng)
+
+
+def benchmark_sampling(queryset, size, repeats=20, seed=0):
+    """Среднее время random_sample и order_by('?') на queryset, мс"""
+    rng = random.Random(seed)
+    timings = {}
+    for name, pick in (
+        ('random_sample', lambda: random_sample(queryset, size, rng)),
+        ('order_by_random', lambda: list(queryset.order_by('?')[:size])),
+    ):
+        started = time.perf_counter()
+        for _ in range(repeats):
+            pick()
+        timings[name] = (time.perf_counter() - started) * 1000 / repeats
+    return timings
@@ -0,0 +1,241 @@
+"""
+Полнотекстовый поиск по объявлениям.
+
+Единый интерфейс для веб-представлений и API. Реализация выбирается по
+типу базы данных: FTS5 в SQLite (разработка), tsvector + GIN в PostgreSQL
+(продакшн). Для остальных СУБД используется простой поиск через icontains.
+
+Индексы создаются миграцией 0003_ad_search_index и синхронизируются самой
+базой данных (триггеры в SQLite, генерируемая колонка в PostgreSQL), поэтому
+в индекс попадают изменения, сделанные и через save(), и через bulk_create/update.
+SQLite удаляет триггеры при пересоздании таблицы в миграциях, поэтому после
+каждого migrate вызывается install(), который восстанавливает недостающее.
+"""
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+# Максимальное количество слов в поисковом запросе
+MAX_QUERY_TERMS = 10
+
+FTS_TABLE = 'ads_ad_fts'
+
+
+def tokenize_query(query):
+    """Разбить поисковый запрос на слова (без операторов и спецсимволов)"""
+    terms = re.findall(r'\w+', (query or '').lower())
+    return terms[:MAX_QUERY_TERMS]
+
+
+class BaseSearchBackend:
+    """Базовый класс поискового бэкенда"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def search(self, queryset, query, ranked=True):
+        """Отфильтровать queryset по запросу; при ranked=True - сортировка по релевантности"""
+        raise NotImplementedError
+
+    def install(self):
+        """Создать недостающие объекты индекса; вернуть True, если что-то создано"""
+        return False
+
+    def uninstall(self):
+        """Удалить объекты индекса"""
+
+    def rebuild(self):
+        """Полностью перестроить поисковый индекс"""
+        raise NotImplementedError
+
+    def column(self, name):
+        """Полное имя колонки таблицы объявлений"""
+        from .models import Ad
+        qn = self.connection.ops.quote_name
+        return f'{qn(Ad._meta.db_table)}.{qn(name)}'
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """Поиск через icontains (для СУБД без полнотекстового индекса)"""
+
+    def search(self, queryset, query, ranked=True):
+        for term in tokenize_query(query):
+            queryset = queryset.filter(Q(title__icontains=term) | Q(description__icontains=term))
+        return queryset
+
+    def rebuild(self):
+        return 0
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """Поиск через виртуальную таблицу FTS5 (external content)"""
+
+    # Вес совпадений в заголовке и в описании для bm25
+    TITLE_WEIGHT = 10.0
+    DESCRIPTION_WEIGHT = 1.0
+
+    # В индексе хранятся только активные объявления
+    TRIGGERS = {
+        'ads_ad_fts_insert': """
+            CREATE TRIGGER IF NOT EXISTS ads_ad_fts_insert AFTER INSERT ON ads_ad WHEN new.is_active BEGIN
+                INSERT INTO ads_ad_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+            END
+        """,
+        'ads_ad_fts_delete': """
+            CREATE TRIGGER IF NOT EXISTS ads_ad_fts_delete AFTER DELETE ON ads_ad WHEN old.is_active BEGIN
+                INSERT INTO ads_ad_fts(ads_ad_fts, rowid, title, description)
+                VALUES ('delete', old.id, old.title, old.description);
+            END
+        """,
+        'ads_ad_fts_update': """
+            CREATE TRIGGER IF NOT EXISTS ads_ad_fts_update AFTER UPDATE OF title, description, is_active ON ads_ad BEGIN
+                INSERT INTO ads_ad_fts(ads_ad_fts, rowid, title, description)
+                SELECT 'delete', old.id, old.title, old.description WHERE old.is_active;
+                INSERT INTO ads_ad_fts(rowid, title, description)
+                SELECT new.id, new.title, new.description WHERE new.is_active;
+            END
+        """,
+    }
+
+    def existing_objects(self, cursor):
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name = %s OR (type = 'trigger' AND name IN (%s, %s, %s))",
+            [FTS_TABLE, *self.TRIGGERS],
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            existing = self.existing_objects(cursor)
+            missing = {FTS_TABLE, *self.TRIGGERS} - existing
+            if not missing:
+                return False
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                "title, description, content='ads_ad', content_rowid='id', "
+                "tokenize='unicode61 remove_diacritics 2')"
+            )
+            for sql in self.TRIGGERS.values():
+                cursor.execute(sql)
+        # Пока триггеров не было, индекс мог разойтись с таблицей
+        self.rebuild()
+        return True
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            for name in self.TRIGGERS:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+    def match_expression(self, query):
+        """Запрос FTS5: каждое слово как префикс, слова объединяются через AND"""
+        return ' '.join(f'"{term}"*' for term in tokenize_query(query))
+
+    def search(self, queryset, query, ranked=True):
+        match = self.match_expression(query)
+        if not match:
+            return queryset
+        if not ranked:
+            return queryset.filter(
+                pk__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+            )
+        # Соединение с таблицей индекса (модель AdSearchEntry): MATCH выполняется один
+        # раз, и bm25 берется из той же строки результата. Подзапрос с MATCH в
+        # аннотации (pk__in + bm25 по rowid) выполняет поиск заново на каждое объявление.
+        # bm25 возвращает отрицательные значения: чем меньше, тем релевантнее
+        qn = self.connection.ops.quote_name
+        return queryset.filter(
+            RawSQL(f'{qn(FTS_TABLE)} MATCH %s', [match], output_field=BooleanField()),
+            search_entry__isnull=False,
+        ).annotate(search_rank=RawSQL(
+            f'bm25({qn(FTS_TABLE)}, {self.TITLE_WEIGHT}, {self.DESCRIPTION_WEIGHT})', [], output_field=FloatField()
+        )).order_by('search_rank', '-created_at')
+
+    def rebuild(self):
+        from .models import Ad
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')")
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE}(rowid, title, description) '
+                f'SELECT id, title, description FROM {Ad._meta.db_table} WHERE is_active'
+            )
+            return cursor.rowcount
+
+
+class PostgreSQLSearchBackend(BaseSearchBackend):
+    """Поиск через генерируемую колонку tsvector с GIN-индексом"""
+
+    CONFIG = 'russian'
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_indexes WHERE indexname = 'ads_ad_search_vector_gin'"
+            )
+            if cursor.fetchone():
+                return False
+            cursor.execute(
+                f"""
+                ALTER TABLE ads_ad ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+                    setweight(to_tsvector('{self.CONFIG}', coalesce(title, '')), 'A') ||
+                    setweight(to_tsvector('{self.CONFIG}', coalesce(description, '')), 'B')
+                ) STORED
+                """
+            )
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS ads_ad_search_vector_gin '
+                'ON ads_ad USING GIN (search_vector) WHERE is_active'
+            )
+        return True
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DROP INDEX IF EXISTS ads_ad_search_vector_gin')
+            cursor.execute('ALTER TABLE ads_ad DROP COLUMN IF EXISTS search_vector')
+
+    def tsquery(self, query):
+        """Запрос tsquery: каждое слово как префикс, слова объединяются через &"""
+        return ' & '.join(f'{term}:*' for term in tokenize_query(query))
+
+    def search(self, queryset, query, ranked=True):
+        tsquery = self.tsquery(query)
+        if not tsquery:
+            return queryset
+        vector = self.column('search_vector')
+        queryset = queryset.filter(
+            RawSQL(f"{vector} @@ to_tsquery('{self.CONFIG}', %s)", [tsquery], output_field=BooleanField())
+        )
+        if ranked:
+            rank = RawSQL(
+                f"ts_rank_cd({vector}, to_tsquery('{self.CONFIG}', %s))",
+                [tsquery],
+                output_field=FloatField(),
+            )
+            queryset = queryset.annotate(search_rank=rank).order_by('-search_rank', '-created_at')
+        return queryset
+
+    def rebuild(self):
+        # Колонка search_vector генерируется самой СУБД, перестраиваем только индекс
+        with self.connection.cursor() as cursor:
+            cursor.execute('REINDEX INDEX ads_ad_search_vector_gin')
+        return 0
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgreSQLSearchBackend,
+}
+
+
+def get_search_backend(using='default'):
+    """Получить поисковый бэкенд для подключения к базе данных"""
+    connection = connections[using]
+    backend_class = BACKENDS.get(connection.vendor, SimpleSearchBackend)
+    return backend_class(connection)
+
+
+def search_ads(queryset, query, ranked=True):
+    """Полнотекстовый поиск объявлений по заголовку и описанию"""
+    return get_search_backend(queryset.db).search(queryset, query, ranked=ranked)
@@ -1,6 +1,13 @@
+import operator
+
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Ad, ExchangeProposal
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import filepath_to_uri
+from django.utils.functional import cached_property
+from .duplicates import duplicate_message, own_duplicate
+from .models import Ad, ExchangeProposal, TradeCycle
+from .sparse import AD_FIELD_SOURCES, SparseFieldsMixin, ad_sources
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -11,32 +18,49 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'username', 'email']
 
 
-class AdSerializer(serializers.ModelSerializer):
+class AdSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериализатор объявления"""
     user = UserSerializer(read_only=True)
     category_display = serializers.CharField(source='get_category_display', read_only=True)
     condition_display = serializers.CharField(source='get_condition_display', read_only=True)
-    # Поле для получения URL изображения
+    # Поля для получения URL изображения: размер для страницы и миниатюра для списков
     display_image_url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+    # Что владелец хочет взамен: коды категорий
+    wanted_categories = serializers.ListField(
+        child=serializers.ChoiceField(choices=Ad.CATEGORY_CHOICES), required=False, max_length=len(Ad.CATEGORY_CHOICES),
+    )
     
     class Meta:
         model = Ad
         fields = [
             'id', 'user', 'title', 'description', 'image', 'image_url',
-            'display_image_url', 'category', 'category_display', 
-            'condition', 'condition_display', 'created_at', 'updated_at', 'is_active'
+            'display_image_url', 'thumbnail_url', 'category', 'category_display', 
+            'condition', 'condition_display', 'created_at', 'updated_at', 'is_active',
+            'wanted_categories', 'wanted_keywords',
         ]
-        read_only_fields = ['id', 'user', 'created_at', 'updated_at', 'display_image_url']
+        read_only_fields = ['id', 'user', 'created_at', 'updated_at', 'display_image_url', 'thumbnail_url']
     
-    def get_display_image_url(self, obj):
-        """Получить URL изображения для отображения"""
+    # Массовые операции (apps/ads/bulk.py) проверяют дубликаты сразу для всего пакета
+    check_duplicates = True
+    
+    def build_image_url(self, obj, size):
+        """URL варианта изображения (абсолютный для загруженных файлов)"""
         request = self.context.get('request')
         if obj.image and request:
-            return request.build_absolute_uri(obj.image.url)
+            return request.build_absolute_uri(obj.get_image_url(size))
         elif obj.image_url:
             return obj.image_url
         return None
     
+    def get_display_image_url(self, obj):
+        """Получить URL изображения для отображения"""
+        return self.build_image_url(obj, 'detail')
+    
+    def get_thumbnail_url(self, obj):
+        """Получить URL миниатюры для карточек в списках"""
+        return self.build_image_url(obj, 'card')
+    
     def validate_title(self, value):
         """Валидация заголовка"""
         if len(value) < 5:
@@ -63,13 +87,129 @@ class AdSerializer(serializers.ModelSerializer):
         if not attrs.get('image') and not attrs.get('image_url') and not self.instance:
             # Для новых объявлений изображение необязательно
             pass
+        if self.check_duplicates:
+            # Повторная публикация того же объявления тем же автором
+            request = self.context.get('request')
+            duplicate = own_duplicate(
+                getattr(request, 'user', None),
+                attrs.get('title', getattr(self.instance, 'title', '')),
+                attrs.get('description', getattr(self.instance, 'description', '')),
+                self.instance,
+                attrs.get('is_active'),
+            )
+            if duplicate is not None:
+                raise serializers.ValidationError(duplicate_message(duplicate))
         return attrs
 
 
-class ExchangeProposalSerializer(serializers.ModelSerializer):
-    """Сериализатор предложения обмена"""
-    ad_sender = AdSerializer(read_only=True)
-    ad_receiver = AdSerializer(read_only=True)
+class MediaURLs:
+    """
+    Абсолютные URL файлов хранилища для одного запроса.
+
+    Для локального хранилища абсолютный префикс MEDIA_URL считается один раз,
+    а не через build_absolute_uri для каждого файла; результат тот же.
+    """
+    
+    def __init__(self, storage, request=None):
+        self.storage = storage
+        self.request = request
+    
+    @cached_property
+    def prefix(self):
+        if self.request and isinstance(self.storage, FileSystemStorage) and self.storage.base_url.startswith('/'):
+            return self.request.build_absolute_uri(self.storage.base_url)
+        return None
+    
+    def url(self, name):
+        """URL файла; без запроса - относительный, как у ImageField в DRF"""
+        if self.prefix is not None:
+            return self.prefix + filepath_to_uri(name).lstrip('/')
+        if self.request is None:
+            return self.storage.url(name)
+        return self.request.build_absolute_uri(self.storage.url(name))
+
+
+class AdReadSerializer:
+    """
+    Сериализация объявлений только для чтения - в том же формате, что и AdSerializer.
+    
+    Работает со строками queryset.values(*AdReadSerializer.values_fields(fields)):
+    без создания моделей и вызова полей DRF на каждую строку. Подписи категорий и
+    состояний берутся из готовых словарей. context['fields'] ограничивает поля
+    ответа (?fields=), как у AdSerializer.
+    """
+    category_labels = dict(Ad.CATEGORY_CHOICES)
+    condition_labels = dict(Ad.CONDITION_CHOICES)
+    datetime_field = serializers.DateTimeField()
+    
+    def __init__(self, rows, many=False, context=None):
+        self.rows = rows
+        self.many = many
+        context = context or {}
+        self.media = MediaURLs(Ad._meta.get_field('image').storage, context.get('request'))
+        fields = context.get('fields')
+        names = AD_FIELD_SOURCES if fields is None else [name for name in AD_FIELD_SOURCES if name in fields]
+        self.getters = [
+            (name, getattr(self, f'get_{name}', None) or operator.itemgetter(name)) for name in names
+        ]
+    
+    @staticmethod
+    def values_fields(fields=None):
+        """Колонки для values(); id и created_at нужны keyset-пагинации всегда"""
+        return [*ad_sources(fields), 'created_at']
+    
+    @property
+    def data(self):
+        if self.many:
+            return [self.to_representation(row) for row in self.rows]
+        return self.to_representation(self.rows)
+    
+    def to_representation(self, row):
+        return {name: getter(row) for name, getter in self.getters}
+    
+    def get_user(self, row):
+        return {'id': row['user_id'], 'username': row['user__username'], 'email': row['user__email']}
+    
+    def get_image(self, row):
+        return self.media.url(row['image']) if row['image'] else None
+    
+    def variant_url(self, row, size):
+        """URL варианта изображения (как AdSerializer.build_image_url)"""
+        if row['image'] and self.media.request is not None:
+            return self.media.url((row['image_variants'] or {}).get(size) or row['image'])
+        return row['image_url'] or None
+    
+    def get_display_image_url(self, row):
+        return self.variant_url(row, 'detail')
+    
+    def get_thumbnail_url(self, row):
+        return self.variant_url(row, 'card')
+    
+    def get_category_display(self, row):
+        return self.category_labels.get(row['category'], row['category'])
+    
+    def get_condition_display(self, row):
+        return self.condition_labels.get(row['condition'], row['condition'])
+    
+    def get_created_at(self, row):
+        return self.datetime_field.to_representation(row['created_at'])
+    
+    def get_updated_at(self, row):
+        return self.datetime_field.to_representation(row['updated_at'])
+
+
+class AdSummarySerializer(serializers.ModelSerializer):
+    """Краткое представление объявления во вложенных объектах"""
+    class Meta:
+        model = Ad
+        fields = ['id', 'title']
+        read_only_fields = fields
+
+
+class ExchangeProposalSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Сериализатор предложения обмена (объявления - кратко, полностью через ?expand=)"""
+    ad_sender = AdSummarySerializer(read_only=True)
+    ad_receiver = AdSummarySerializer(read_only=True)
     sender = UserSerializer(read_only=True)
     receiver = UserSerializer(read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
@@ -78,6 +218,8 @@ class ExchangeProposalSerializer(serializers.ModelSerializer):
     ad_sender_id = serializers.IntegerField(write_only=True)
     ad_receiver_id = serializers.IntegerField(write_only=True)
     
+    expandable_fields = {'ad_sender': AdSerializer, 'ad_receiver': AdSerializer}
+    
     class Meta:
         model = ExchangeProposal
         fields = [
@@ -134,6 +276,28 @@ class ExchangeProposalSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class TradeCycleStepSerializer(serializers.ModelSerializer):
+    """Шаг цепочного обмена: кто что отдает и что получает (без контактов участников)"""
+    proposal_id = serializers.IntegerField(source='pk', read_only=True)
+    username = serializers.CharField(source='sender.username', read_only=True)
+    gives = AdSummarySerializer(source='ad_sender', read_only=True)
+    gets = AdSummarySerializer(source='ad_receiver', read_only=True)
+    
+    class Meta:
+        model = ExchangeProposal
+        fields = ['proposal_id', 'username', 'gives', 'gets']
+
+
+class TradeCycleSerializer(serializers.ModelSerializer):
+    """Сериализатор цепочного обмена: шаги в порядке цикла"""
+    steps = TradeCycleStepSerializer(source='ordered_proposals', many=True, read_only=True)
+    
+    class Meta:
+        model = TradeCycle
+        fields = ['id', 'length', 'created_at', 'steps']
+        read_only_fields = fields
+
+
 class ProposalStatusSerializer(serializers.Serializer):
     """Сериализатор для обновления статуса предложения"""
     status = serializers.ChoiceField(choices=['accepted', 'rejected'])
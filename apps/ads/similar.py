@@ -0,0 +1,303 @@
+"""
+Похожие объявления: соседи по тексту заголовка и описания.
+
+Текст разбивается на слова, слова сводятся к термам по первым TERM_LENGTH
+буквам, как в wants.py ('ноутбуки' и 'ноутбук' совпадают); слова заголовка
+весят вдвое больше. Объявление - вектор TF-IDF (разреженная матрица SciPy,
+строки нормированы), близость - косинус, то есть скалярное произведение строк.
+
+Пакетный расчет (rebuild_similar, команда rebuild_similar_ads) перемножает
+матрицу на себя блоками по BATCH_SIZE строк и сохраняет TOP_K соседей каждого
+активного объявления в таблицу SimilarAd, а модель (словарь, IDF и матрицу) - в
+файл SIMILAR_ADS_MODEL_PATH. Новые объявления обрабатывает задача
+update_similar_ads: вектор строится по сохраненному словарю и сравнивается с
+матрицей и с объявлениями, созданными после расчета; новое объявление попадает и
+в списки своих соседей. Измененные тексты учитываются при следующем пересчете.
+
+Страница и API читают готовый список одним запросом по индексу (ad, rank);
+страница еще и кэширует его (cached_similar_ads).
+"""
+import logging
+import os
+import re
+import time
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from scipy import sparse
+
+from .cache import get_or_refresh, invalidate_similar, similar_cache_key
+from .models import Ad, SimilarAd
+from .wants import STOP_WORDS as WANT_STOP_WORDS, TERM_LENGTH
+
+logger = logging.getLogger(__name__)
+
+# Сколько соседей хранится у объявления
+TOP_K = 8
+# Соседи с меньшей близостью не сохраняются
+MIN_SCORE = 0.1
+# Термы, которые встречаются в большей доле объявлений, не различают их и выбрасываются
+MAX_DF = 0.05
+# Порог MAX_DF действует начиная с такого числа объявлений: в маленькой базе 5% -
+# одно-два объявления, и отбрасывались бы все общие термы
+MAX_DF_MIN_ADS = 1000
+# Вес слов заголовка относительно слов описания
+TITLE_WEIGHT = 2
+# Строк матрицы в одном блоке пакетного расчета
+BATCH_SIZE = 1000
+# Сколько объявлений, созданных после расчета, сравнивается с новым
+MAX_FRESH_ADS = 5000
+
+STOP_WORDS = WANT_STOP_WORDS | {
+    'все', 'это', 'как', 'так', 'что', 'где', 'его', 'она', 'они', 'есть', 'был', 'была',
+    'только', 'очень', 'можно', 'если', 'уже', 'еще', 'обмен', 'обменяю', 'меняю',
+}
+
+WORD_RE = re.compile(r'[^\W\d_]+')
+
+
+def text_terms(text):
+    """Термы слов текста: буквы, не короче 3, без служебных слов"""
+    return [
+        word[:TERM_LENGTH]
+        for word in WORD_RE.findall((text or '').lower().replace('ё', 'е'))
+        if len(word) >= 3 and word not in STOP_WORDS
+    ]
+
+
+def ad_terms(title, description):
+    return text_terms(title) * TITLE_WEIGHT + text_terms(description)
+
+
+def count_matrix(docs, vocabulary, grow=False):
+    """
+    Матрица числа вхождений термов: строка - документ, столбец - терм словаря.
+
+    grow=True добавляет новые термы в словарь, иначе они пропускаются.
+    """
+    data, indices, indptr = [], [], [0]
+    for title, description in docs:
+        counts = Counter()
+        for term in ad_terms(title, description):
+            column = vocabulary.setdefault(term, len(vocabulary)) if grow else vocabulary.get(term)
+            if column is not None:
+                counts[column] += 1
+        indices += counts.keys()
+        data += counts.values()
+        indptr.append(len(indices))
+    return sparse.csr_matrix(
+        (np.array(data, dtype=np.float32), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+        shape=(len(indptr) - 1, len(vocabulary)),
+    )
+
+
+def weigh(counts, idf):
+    """TF-IDF с логарифмом частоты и нормированием строк"""
+    matrix = counts.copy()
+    matrix.data = 1 + np.log(matrix.data)
+    matrix = sparse.csr_matrix(matrix.multiply(idf.reshape(1, -1)), dtype=np.float32)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms).dot(matrix).tocsr().astype(np.float32)
+
+
+class TextModel:
+    """Словарь, IDF и матрица векторов объявлений (ids - id строк матрицы по возрастанию)"""
+
+    def __init__(self, terms, idf, ids, matrix):
+        self.terms = terms
+        self.vocabulary = {term: column for column, term in enumerate(terms)}
+        self.idf = idf
+        self.ids = ids
+        self.matrix = matrix
+
+    @classmethod
+    def fit(cls, rows, max_df=MAX_DF, max_df_min_ads=MAX_DF_MIN_ADS):
+        """Модель по строкам (id, заголовок, описание), упорядоченным по id"""
+        ids, docs = [], []
+        for pk, title, description in rows:
+            ids.append(pk)
+            docs.append((title, description))
+        vocabulary = {}
+        counts = count_matrix(docs, vocabulary, grow=True)
+        df = np.bincount(counts.indices, minlength=len(vocabulary))
+        # Терм из одного объявления никого не сближает, слишком частый - сближает всех
+        keep = df >= 2
+        if len(ids) >= max_df_min_ads:
+            keep &= df <= max_df * len(ids)
+        counts = counts[:, keep]
+        idf = (np.log((1 + len(ids)) / (1 + df[keep])) + 1).astype(np.float32)
+        terms = [term for term, kept in zip(vocabulary, keep) if kept]
+        return cls(terms, idf, np.array(ids, dtype=np.int64), weigh(counts, idf))
+
+    def transform(self, docs):
+        """Векторы новых текстов по словарю модели"""
+        return weigh(count_matrix(docs, self.vocabulary), self.idf)
+
+    @property
+    def max_id(self):
+        return int(self.ids[-1]) if len(self.ids) else 0
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Запись через временный файл: задачи не прочитают недописанную модель
+        temporary = f'{path}.tmp.npz'
+        np.savez(
+            temporary, terms=np.array(self.terms, dtype=str), idf=self.idf, ids=self.ids,
+            data=self.matrix.data, indices=self.matrix.indices, indptr=self.matrix.indptr,
+            shape=np.array(self.matrix.shape),
+        )
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as stored:
+            matrix = sparse.csr_matrix(
+                (stored['data'], stored['indices'], stored['indptr']), shape=tuple(stored['shape'])
+            )
+            return cls(stored['terms'].tolist(), stored['idf'], stored['ids'], matrix)
+
+
+# Загруженная модель процесса: (путь, время изменения файла, модель)
+_loaded_model = None
+
+
+def load_model():
+    """Сохраненная модель (перечитывается после пересчета) или None"""
+    global _loaded_model
+    path = str(settings.SIMILAR_ADS_MODEL_PATH)
+    try:
+        modified = os.path.getmtime(path)
+    except OSError:
+        # Пересчета не было или файл модели недоступен этому процессу (путь не общий
+        # с командой); предупреждение - один раз на процесс, а не на каждое объявление
+        if _loaded_model != (path, None, None):
+            logger.warning('Модель похожих объявлений не найдена: %s', path)
+            _loaded_model = (path, None, None)
+        return None
+    if _loaded_model is None or _loaded_model[:2] != (path, modified):
+        _loaded_model = (path, modified, TextModel.load(path))
+    return _loaded_model[2]
+
+
+def top_neighbours(scores, row_ids, column_ids, k=TOP_K, min_score=MIN_SCORE):
+    """Строки матрицы близостей -> {id: [(id соседа, близость), ...]} по убыванию близости"""
+    scores = scores.tocsr()
+    result = {}
+    for row, ad_id in enumerate(row_ids):
+        start, end = scores.indptr[row], scores.indptr[row + 1]
+        neighbours = column_ids[scores.indices[start:end]]
+        values = scores.data[start:end]
+        mask = (neighbours != ad_id) & (values >= min_score)
+        neighbours, values = neighbours[mask], values[mask]
+        if len(values) > k:
+            best = np.argpartition(-values, k)[:k]
+            neighbours, values = neighbours[best], values[best]
+        order = np.argsort(-values, kind='stable')
+        result[int(ad_id)] = [(int(neighbours[i]), float(values[i])) for i in order]
+    return result
+
+
+def link_objects(neighbours):
+    return [
+        SimilarAd(ad_id=ad_id, neighbour_id=neighbour_id, score=score, rank=rank)
+        for ad_id, items in neighbours.items()
+        for rank, (neighbour_id, score) in enumerate(items)
+    ]
+
+
+def rebuild_similar(k=TOP_K, batch_size=BATCH_SIZE, log=None):
+    """
+    Пересчитать соседей всех активных объявлений и сохранить модель.
+
+    Возвращает словарь: ads, terms, links, seconds.
+    """
+    log = log or (lambda message: None)
+    started = time.perf_counter()
+    rows = Ad.objects.filter(is_active=True).order_by('pk').values_list('pk', 'title', 'description')
+    model = TextModel.fit(rows.iterator(chunk_size=10000))
+    log(f'объявлений: {len(model.ids)}, термов: {len(model.terms)}')
+    transposed = model.matrix.T.tocsr()
+    links = 0
+    with transaction.atomic():
+        SimilarAd.objects.all().delete()
+        for start in range(0, len(model.ids), batch_size):
+            block = model.matrix[start:start + batch_size].dot(transposed)
+            neighbours = top_neighbours(block, model.ids[start:start + batch_size], model.ids, k)
+            objects = link_objects(neighbours)
+            SimilarAd.objects.bulk_create(objects, batch_size=5000)
+            links += len(objects)
+            log(f'обработано: {min(start + batch_size, len(model.ids))}/{len(model.ids)}')
+    # Новые объявления сравниваются с той же матрицей, по которой посчитаны соседи
+    model.save(str(settings.SIMILAR_ADS_MODEL_PATH))
+    invalidate_similar()
+    return {
+        'ads': len(model.ids),
+        'terms': len(model.terms),
+        'links': links,
+        'seconds': time.perf_counter() - started,
+    }
+
+
+def update_similar(ad_ids, k=TOP_K):
+    """
+    Соседи новых объявлений по сохраненной модели; возвращает число обработанных.
+
+    Без модели (пересчета еще не было) ничего не делает, только предупреждает в логе.
+    """
+    model = load_model()
+    if model is None:
+        return 0
+    rows = list(Ad.objects.filter(pk__in=ad_ids, is_active=True).values_list('pk', 'title', 'description'))
+    if not rows:
+        return 0
+    # Объявления после расчета в матрице нет - сравниваем и с ними (с новыми в том числе)
+    fresh = list(
+        Ad.objects.filter(is_active=True, pk__gt=model.max_id)
+        .order_by('-pk').values_list('pk', 'title', 'description')[:MAX_FRESH_ADS]
+    )
+    vectors = model.transform([(title, description) for _, title, description in rows])
+    fresh_vectors = model.transform([(title, description) for _, title, description in fresh])
+    scores = sparse.hstack([vectors.dot(model.matrix.T), vectors.dot(fresh_vectors.T)])
+    column_ids = np.concatenate([model.ids, np.array([pk for pk, _, _ in fresh], dtype=np.int64)])
+    # С запасом: объявления из матрицы могли снять или удалить после расчета
+    found = top_neighbours(scores, np.array([pk for pk, _, _ in rows], dtype=np.int64), column_ids, 2 * k)
+    live = set(Ad.objects.filter(
+        pk__in={pk for items in found.values() for pk, _ in items}, is_active=True
+    ).values_list('pk', flat=True))
+    neighbours = {ad_id: [item for item in items if item[0] in live][:k] for ad_id, items in found.items()}
+
+    # Новое объявление - кандидат в соседи к каждому своему соседу
+    candidates = {}
+    for ad_id, items in neighbours.items():
+        for neighbour_id, score in items:
+            if neighbour_id not in neighbours:
+                candidates.setdefault(neighbour_id, []).append((ad_id, score))
+    current = {}
+    for ad_id, neighbour_id, score in SimilarAd.objects.filter(ad__in=candidates).values_list(
+        'ad_id', 'neighbour_id', 'score'
+    ):
+        current.setdefault(ad_id, []).append((neighbour_id, score))
+    changed = {}
+    for ad_id, items in candidates.items():
+        merged = sorted([*current.get(ad_id, []), *items], key=lambda item: -item[1])[:k]
+        if any(item in merged for item in items):
+            changed[ad_id] = merged
+
+    with transaction.atomic():
+        SimilarAd.objects.filter(ad__in=[*neighbours, *changed]).delete()
+        SimilarAd.objects.bulk_create(link_objects({**changed, **neighbours}))
+        invalidate_similar(*neighbours, *changed)
+    return len(neighbours)
+
+
+def similar_ads(ad_id, limit=TOP_K):
+    """Активные похожие объявления по готовому списку (по убыванию близости)"""
+    return Ad.objects.filter(neighbour_of__ad=ad_id, is_active=True).order_by('neighbour_of__rank')[:limit]
+
+
+def cached_similar_ads(ad_id):
+    """Список похожих объявлений для страницы: из кэша, сбрасывается при пересчете"""
+    return get_or_refresh(similar_cache_key(ad_id), lambda: list(similar_ads(ad_id)))
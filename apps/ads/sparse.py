@@ -0,0 +1,106 @@
+"""
+Выбор полей ответа API (?fields=) и раскрытие вложенных объектов (?expand=).
+
+?fields=id,title,category - в ответе только перечисленные поля; неизвестные
+имена пропускаются. ?expand=ad_sender,ad_receiver - вложенные объекты в полном
+виде вместо краткого (id и заголовок). Представления выбирают из базы только
+нужные колонки (only() и values()) и не делают JOIN ради полей, которых нет в
+ответе. Поля выбираются только в запросах на чтение: при записи сериализатору
+нужны все поля.
+"""
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+# Поле ответа объявления -> колонки модели (пути для only()/values()), из которых оно строится
+AD_FIELD_SOURCES = {
+    'id': ('id',),
+    'user': ('user_id', 'user__username', 'user__email'),
+    'title': ('title',),
+    'description': ('description',),
+    'image': ('image',),
+    'image_url': ('image_url',),
+    'display_image_url': ('image', 'image_variants', 'image_url'),
+    'thumbnail_url': ('image', 'image_variants', 'image_url'),
+    'category': ('category',),
+    'category_display': ('category',),
+    'condition': ('condition',),
+    'condition_display': ('condition',),
+    'created_at': ('created_at',),
+    'updated_at': ('updated_at',),
+    'is_active': ('is_active',),
+    'wanted_categories': ('wanted_categories',),
+    'wanted_keywords': ('wanted_keywords',),
+}
+
+USER_FIELD_SOURCES = ('id', 'username', 'email')
+
+
+def parse_field_list(value):
+    """'a, b,,c' -> ['a', 'b', 'c']; None - параметра нет"""
+    if value is None:
+        return None
+    return [name for name in (part.strip() for part in value.split(',')) if name]
+
+
+def ad_sources(fields=None, prefix=''):
+    """Колонки объявления для полей ответа fields (None - все поля)"""
+    names = AD_FIELD_SOURCES if fields is None else [name for name in fields if name in AD_FIELD_SOURCES]
+    sources = {'id': None}
+    for name in names:
+        sources.update(dict.fromkeys(AD_FIELD_SOURCES[name]))
+    return [prefix + source for source in sources]
+
+
+def only_path(source):
+    # only() принимает внешний ключ по имени поля, а не колонки
+    return source[:-3] if source.endswith('_id') and '__' not in source else source
+
+
+class SparseFieldsMixin:
+    """
+    Сериализатор с выбором полей и раскрываемыми вложенными объектами.
+
+    Списки берутся из context['fields'] и context['expand'] (их заполняет
+    SparseFieldsViewMixin). expandable_fields - {поле: сериализатор полного
+    представления}; без expand поле остается в том виде, как объявлено.
+    """
+    expandable_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Вложенные сериализаторы создаются без контекста и не затрагиваются
+        for name in self.context.get('expand') or ():
+            if name in self.expandable_fields:
+                self.fields[name] = self.expandable_fields[name](read_only=True)
+        fields = self.context.get('fields')
+        if fields is not None:
+            for name in list(self.fields):
+                if name not in fields:
+                    self.fields.pop(name)
+
+
+class SparseFieldsViewMixin:
+    """Передает ?fields= и ?expand= сериализатору и выбору колонок"""
+
+    @property
+    def requested_fields(self):
+        """Поля ответа из ?fields= (None - все); только для запросов на чтение"""
+        if self.request.method not in SAFE_METHODS:
+            return None
+        return parse_field_list(self.request.query_params.get(FIELDS_PARAM))
+
+    @property
+    def requested_expand(self):
+        return parse_field_list(self.request.query_params.get(EXPAND_PARAM)) or []
+
+    def wants(self, name):
+        fields = self.requested_fields
+        return fields is None or name in fields
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.requested_fields
+        context['expand'] = self.requested_expand
+        return context
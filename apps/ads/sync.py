@@ -0,0 +1,137 @@
+"""
+Синхронизация изменений для мобильных клиентов (?since=<курсор>).
+
+Ответ содержит объекты, измененные после курсора, id удаленных (и для ленты
+объявлений - деактивированных) объектов и новый курсор. Изменения читаются по
+индексу (updated_at, id), удаления - из журнала Tombstone по (deleted_at, id),
+поэтому объем работы зависит от числа изменений, а не от размера базы.
+
+Курсор хранит позицию в обоих потоках. Строки моложе SYNC_SETTLE_SECONDS не
+читаются: updated_at присваивается до коммита, и транзакция, закоммиченная чуть
+позже соседней, иначе осталась бы за курсором. Без ?since= отдается полный
+снимок (только активные объекты). Если курсор старше срока хранения журнала
+удалений (SYNC_TOMBSTONE_DAYS), клиент получает reset: true и снимок заново.
+"""
+import base64
+import binascii
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+SINCE_PARAM = 'since'
+LIMIT_PARAM = 'page_size'
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+
+def get_limit(request):
+    """Размер страницы синхронизации из ?page_size="""
+    try:
+        limit = int(request.query_params[LIMIT_PARAM])
+        if limit > 0:
+            return min(limit, MAX_LIMIT)
+    except (KeyError, ValueError):
+        pass
+    return DEFAULT_LIMIT
+
+
+def encode_sync_cursor(changes, deletions):
+    """Курсор из позиций потоков изменений и удалений: (время, id или None)"""
+    payload = json.dumps([[position[0].isoformat(), position[1]] for position in (changes, deletions)])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_sync_cursor(value):
+    try:
+        padded = value + '=' * (-len(value) % 4)
+        positions = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        changes, deletions = [(parse_datetime(moment), pk) for moment, pk in positions]
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise ValueError('Некорректный курсор синхронизации')
+    for moment, pk in (changes, deletions):
+        if moment is None or timezone.is_naive(moment) or not (pk is None or isinstance(pk, int)):
+            raise ValueError('Некорректный курсор синхронизации')
+    return changes, deletions
+
+
+def read_stream(queryset, field, position, horizon, limit):
+    """
+    Строки после позиции и не позже horizon в порядке (field, id).
+
+    Возвращает (строки, новая позиция, есть ли еще строки). Позиция (время, None)
+    означает, что прочитано все до этого времени включительно.
+    """
+    queryset = queryset.filter(**{f'{field}__lte': horizon})
+    if position is not None:
+        moment, pk = position
+        after = Q(**{f'{field}__gt': moment})
+        if pk is not None:
+            after |= Q(**{field: moment, 'pk__gt': pk})
+        queryset = queryset.filter(after)
+    rows = list(queryset.order_by(field, 'pk')[:limit + 1])
+    if len(rows) <= limit:
+        return rows, (horizon, None), False
+    rows = rows[:limit]
+    last = rows[-1]
+    if isinstance(last, dict):
+        return rows, (last[field], last['id']), True
+    return rows, (getattr(last, field), last.pk), True
+
+
+def sync_changes(since, changes, tombstones, limit, initial=None):
+    """
+    Изменения после курсора since (None - полный снимок).
+
+    changes - queryset объектов с полем updated_at, initial - он же для снимка
+    (например, только активные объявления), tombstones - записи журнала удалений.
+    Возвращает словарь: rows, deleted (id), cursor, has_more, reset.
+    """
+    now = timezone.now()
+    horizon = now - timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+    reset = False
+    if since is not None:
+        changes_position, deletions_position = decode_sync_cursor(since)
+        if deletions_position[0] < now - timedelta(days=settings.SYNC_TOMBSTONE_DAYS):
+            # Журнал удалений за этот период уже очищен - нужен полный снимок
+            since, reset = None, True
+
+    if since is None:
+        rows, changes_position, has_more = read_stream(
+            changes if initial is None else initial, 'updated_at', None, horizon, limit
+        )
+        # Снимок не содержит удаленных объектов, журнал читается с текущего момента
+        deleted, deletions_position, more_deleted = [], (horizon, None), False
+    else:
+        rows, changes_position, has_more = read_stream(changes, 'updated_at', changes_position, horizon, limit)
+        tombstones, deletions_position, more_deleted = read_stream(
+            tombstones.only('id', 'object_id', 'deleted_at'), 'deleted_at', deletions_position, horizon, limit
+        )
+        deleted = [tombstone.object_id for tombstone in tombstones]
+
+    return {
+        'rows': rows,
+        'deleted': deleted,
+        'cursor': encode_sync_cursor(changes_position, deletions_position),
+        'has_more': has_more or more_deleted,
+        'reset': reset,
+    }
+
+
+class SyncViewMixin:
+    """Действие синхронизации ViewSet'а: курсор и размер страницы из запроса"""
+
+    def sync_changes(self, changes, tombstones, initial=None):
+        """Ответ синхронизации без results: их сериализует представление из rows"""
+        try:
+            result = sync_changes(
+                self.request.query_params.get(SINCE_PARAM), changes, tombstones,
+                get_limit(self.request), initial=initial,
+            )
+        except ValueError as exc:
+            raise ValidationError({SINCE_PARAM: [str(exc)]})
+        return result
@@ -0,0 +1,79 @@
+"""
+Фоновые задачи объявлений: обработка изображений, удаление файлов, уведомления.
+"""
+import logging
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.mail import send_mail
+
+from barter_platform.tasks import task
+
+logger = logging.getLogger(__name__)
+
+
+@task()
+def process_ad_image(ad_id, image_name):
+    """Сгенерировать варианты изображения объявления"""
+    from .models import Ad
+
+    ad = Ad.objects.filter(pk=ad_id).only('id', 'image', 'image_variants', 'category').first()
+    # Объявление удалено или изображение успели заменить - обработает следующая задача
+    if ad is None or ad.image.name != image_name:
+        return
+    ad.process_image()
+
+
+@task()
+def delete_files(names):
+    """Удалить файлы из хранилища (оригиналы и варианты изображений)"""
+    from .images import delete_files as delete_storage_files
+
+    delete_storage_files(default_storage, names)
+
+
+@task()
+def send_notification(user_id, subject, message):
+    """Отправить пользователю уведомление по email"""
+    from django.contrib.auth.models import User
+
+    user = User.objects.filter(pk=user_id).only('email').first()
+    if user is None or not user.email:
+        logger.info('Уведомление "%s" не отправлено: нет email у пользователя %s', subject, user_id)
+        return
+    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email])
+
+
+@task()
+def send_notifications(notifications):
+    """Отправить пачку уведомлений [(user_id, subject, message), ...]: адреса - одним запросом"""
+    from django.contrib.auth.models import User
+    from django.core.mail import send_mass_mail
+
+    emails = dict(
+        User.objects.filter(pk__in={user_id for user_id, _, _ in notifications}).values_list('pk', 'email')
+    )
+    batch = []
+    for user_id, subject, message in notifications:
+        if emails.get(user_id):
+            batch.append((subject, message, settings.DEFAULT_FROM_EMAIL, [emails[user_id]]))
+        else:
+            logger.info('Уведомление "%s" не отправлено: нет email у пользователя %s', subject, user_id)
+    if batch:
+        send_mass_mail(batch)
+
+
+@task()
+def match_trade_cycles(proposal_id, ad_sender_id, ad_receiver_id):
+    """Найти и сохранить цепочные обмены, которые замыкает новое предложение"""
+    from .cycles import match_proposal
+
+    match_proposal(proposal_id, ad_sender_id, ad_receiver_id)
+
+
+@task()
+def update_similar_ads(ad_ids):
+    """Найти похожие для новых объявлений и добавить их в списки соседей"""
+    from .similar import update_similar
+
+    update_similar(ad_ids)
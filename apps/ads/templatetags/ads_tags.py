@@ -0,0 +1,66 @@
+"""
+Теги шаблонов объявлений.
+
+Фрагменты с объявлением (карточка в списке, блок описания на странице
+объявления, строка в "Моих объявлениях") кэшируются по ad.pk и ad.updated_at:
+любое изменение объявления, в том числе через update() (обмен, готовые копии
+изображения), меняет updated_at, и фрагмент перерисовывается сам. Ключи
+совместимы с тегом {% cache %} (make_template_fragment_key).
+"""
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+
+@register.filter
+def image_url(ad, size):
+    """URL варианта изображения объявления: {{ ad|image_url:'card' }}"""
+    return ad.get_image_url(size)
+
+
+def fragment_key(template_name, ad):
+    return make_template_fragment_key(template_name, [ad.pk, ad.updated_at.isoformat()])
+
+
+def render_fragments(template_name, ads):
+    """Отрисовать фрагмент для каждого объявления; готовые берутся из кэша одним запросом"""
+    keys = [fragment_key(template_name, ad) for ad in ads]
+    cached = cache.get_many(keys)
+    missing = {}
+    fragments = []
+    for key, ad in zip(keys, ads):
+        if key not in cached:
+            cached[key] = missing[key] = render_to_string(template_name, {'ad': ad})
+        fragments.append(cached[key])
+    if missing:
+        cache.set_many(missing, settings.ADS_FRAGMENT_CACHE_TTL)
+    return fragments
+
+
+@register.simple_tag
+def ad_fragment(template_name, ad):
+    """Кэшированный фрагмент шаблона с объявлением: {% ad_fragment 'ads/ad_summary.html' ad %}"""
+    return mark_safe(render_fragments(template_name, [ad])[0])
+
+
+@register.simple_tag
+def ad_fragments(template_name, ads):
+    """Кэшированные фрагменты для списка объявлений: {% ad_fragments 'ads/my_ad_row.html' ads %}"""
+    return mark_safe('\n'.join(render_fragments(template_name, list(ads))))
+
+
+@register.simple_tag
+def ad_card(ad):
+    """Карточка объявления: {% ad_card ad %}"""
+    return ad_fragment('ads/ad_card.html', ad)
+
+
+@register.simple_tag
+def ad_cards(ads):
+    """Карточки списка объявлений: {% ad_cards ads %}"""
+    return ad_fragments('ads/ad_card.html', ads)
@@ -1,18 +1,33 @@
+import importlib.util
 import os
 import tempfile
+from unittest import skipUnless
+from urllib.parse import urlencode
 from decimal import Decimal
-from django.test import TestCase, Client, override_settings
+from django.test import TestCase, TransactionTestCase, Client, override_settings
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
 from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.db.models import F, Q
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from PIL import Image
 import io
 
-from .models import Ad, ExchangeProposal
+from .models import Ad, ExchangeProposal, ProposalConflict
 from .forms import AdForm, ExchangeProposalForm, SearchForm
+from .search import search_ads, get_search_backend
+from barter_platform.tasks import ThreadPoolBackend, task
+from barter_platform.querybudget import QueryBudgetExceeded, assert_query_budget, get_budget, normalize_sql
+import threading
+import time
 
 
 class AdModelTest(TestCase):
@@ -203,6 +218,59 @@ class ExchangeProposalModelTest(TestCase):
         self.assertTrue(self.ad1.is_active)
         self.assertTrue(self.ad2.is_active)
     
+    def test_accept_rejects_competing_proposals(self):
+        """Тест отклонения конкурирующих предложений при принятии"""
+        user3 = User.objects.create_user(username='user3', password='pass123')
+        ad3 = Ad.objects.create(
+            user=user3, title='Наушники', description='Беспроводные наушники',
+            category='electronics', condition='new'
+        )
+        ad4 = Ad.objects.create(
+            user=user3, title='Рюкзак', description='Городской рюкзак',
+            category='sports', condition='good'
+        )
+        proposal = ExchangeProposal.objects.create(
+            ad_sender=self.ad1, ad_receiver=self.ad2,
+            sender=self.user1, receiver=self.user2, comment='Основное предложение'
+        )
+        competing = [
+            ExchangeProposal.objects.create(
+                ad_sender=ad3, ad_receiver=self.ad2,
+                sender=user3, receiver=self.user2, comment='Конкурирующее предложение'
+            ),
+            ExchangeProposal.objects.create(
+                ad_sender=self.ad1, ad_receiver=ad3,
+                sender=self.user1, receiver=user3, comment='Встречное предложение'
+            ),
+        ]
+        unrelated = ExchangeProposal.objects.create(
+            ad_sender=ad4, ad_receiver=ad3,
+            sender=user3, receiver=user3, comment='Не связано с обменом'
+        )
+        
+        self.assertEqual(proposal.accept(), 2)
+        for other in competing:
+            other.refresh_from_db()
+            self.assertEqual(other.status, 'rejected')
+        unrelated.refresh_from_db()
+        self.assertEqual(unrelated.status, 'pending')
+    
+    def test_processed_proposal_cannot_be_accepted_or_rejected(self):
+        """Тест повторной обработки предложения"""
+        proposal = ExchangeProposal.objects.create(
+            ad_sender=self.ad1, ad_receiver=self.ad2,
+            sender=self.user1, receiver=self.user2, comment='Предложение'
+        )
+        stale = ExchangeProposal.objects.get(pk=proposal.pk)
+        proposal.reject()
+        
+        with self.assertRaises(ProposalConflict):
+            stale.accept()
+        with self.assertRaises(ProposalConflict):
+            stale.reject()
+        self.ad1.refresh_from_db()
+        self.assertTrue(self.ad1.is_active)
+    
     def test_proposal_str_method(self):
         """Тест строкового представления предложения"""
         proposal = ExchangeProposal.objects.create(
@@ -373,6 +441,88 @@ class AdViewsTest(TestCase):
         self.assertContains(response, 'electronics')
 
 
+class AdSearchTest(TestCase):
+    """Тесты полнотекстового поиска"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='searchuser', password='pass123')
+        self.title_match = Ad.objects.create(
+            user=self.user,
+            title='Ноутбук Lenovo ThinkPad',
+            description='Рабочий инструмент в отличном состоянии, зарядка в комплекте',
+            category='electronics',
+            condition='good'
+        )
+        self.description_match = Ad.objects.create(
+            user=self.user,
+            title='Сумка для техники',
+            description='Подойдет для ноутбука диагональю до 15 дюймов',
+            category='other',
+            condition='like_new'
+        )
+        self.other = Ad.objects.create(
+            user=self.user,
+            title='Велосипед городской',
+            description='Три скорости, корзина и фонарь в комплекте',
+            category='sports',
+            condition='fair'
+        )
+    
+    def search(self, query):
+        return list(search_ads(Ad.objects.filter(is_active=True), query))
+    
+    def test_search_is_case_insensitive_for_cyrillic(self):
+        """Тест поиска без учета регистра кириллицы"""
+        self.assertIn(self.title_match, self.search('НОУТБУК'))
+        self.assertNotIn(self.other, self.search('НОУТБУК'))
+    
+    def test_search_matches_word_prefix(self):
+        """Тест поиска по началу слова"""
+        self.assertEqual(self.search('велосип'), [self.other])
+    
+    def test_search_ranks_title_matches_first(self):
+        """Тест сортировки по релевантности: совпадение в заголовке выше"""
+        self.assertEqual(self.search('ноутбук'), [self.title_match, self.description_match])
+        ranked = search_ads(Ad.objects.filter(is_active=True), 'ноутбук')
+        # Ранжирование - соединением с индексом, без QuerySet.extra()
+        self.assertFalse(ranked.query.extra or ranked.query.extra_tables)
+    
+    def test_search_requires_all_terms(self):
+        """Тест, что результат содержит все слова запроса"""
+        self.assertEqual(self.search('ноутбук lenovo'), [self.title_match])
+    
+    def test_index_follows_edit_and_deactivation(self):
+        """Тест синхронизации индекса при редактировании и деактивации"""
+        self.other.title = 'Самокат электрический'
+        self.other.save()
+        self.assertEqual(self.search('самокат'), [self.other])
+        self.assertEqual(self.search('велосипед'), [])
+        
+        self.other.is_active = False
+        self.other.save()
+        self.assertEqual(list(search_ads(Ad.objects.all(), 'самокат')), [])
+        
+        self.other.is_active = True
+        self.other.save()
+        self.assertEqual(self.search('самокат'), [self.other])
+    
+    def test_index_follows_delete(self):
+        """Тест удаления объявления из индекса"""
+        self.other.delete()
+        self.assertEqual(list(search_ads(Ad.objects.all(), 'велосипед')), [])
+    
+    def test_query_special_characters_are_ignored(self):
+        """Тест, что спецсимволы запроса не ломают поиск"""
+        self.assertEqual(self.search('"велосипед* OR (NEAR'), [])
+        self.assertEqual(self.search('велосипед"*'), [self.other])
+    
+    def test_rebuild_index(self):
+        """Тест полного перестроения индекса"""
+        backend = get_search_backend()
+        backend.rebuild()
+        self.assertEqual(self.search('ноутбук'), [self.title_match, self.description_match])
+
+
 class ExchangeProposalViewsTest(TestCase):
     """Тесты представлений предложений обмена"""
     
@@ -492,6 +642,95 @@ class ImageUploadTest(TestCase):
         ad = Ad.objects.get(title='Объявление с изображением')
         self.assertTrue(ad.image)
         self.assertIsNotNone(ad.get_image_url())
+    
+    def create_ad_with_image(self, image_file):
+        ad = Ad.objects.create(
+            user=self.user,
+            title='Объявление с фотографией',
+            description='Описание объявления с загруженной фотографией',
+            category='electronics',
+            condition='new',
+            image=image_file
+        )
+        # Варианты сохраняет фоновая задача
+        ad.refresh_from_db()
+        return ad
+    
+    def open_variant(self, ad, size):
+        with ad.image.storage.open(ad.image_variants[size]) as f:
+            image = Image.open(f)
+            image.load()
+        return image
+    
+    def test_variants_generated_on_upload(self):
+        """Тест генерации уменьшенных копий при загрузке"""
+        image = Image.new('RGB', (2000, 1000), color='blue')
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+        ad = self.create_ad_with_image(SimpleUploadedFile('big.png', buffer.getvalue(), content_type='image/png'))
+        
+        ad.refresh_from_db()
+        self.assertEqual(set(ad.image_variants), {'card', 'detail', 'admin'})
+        self.assertEqual(self.open_variant(ad, 'card').size, (600, 400))
+        self.assertEqual(self.open_variant(ad, 'detail').size, (1200, 600))
+        self.assertEqual(self.open_variant(ad, 'admin').size, (50, 50))
+        self.assertEqual(self.open_variant(ad, 'card').format, 'JPEG')
+        self.assertTrue(ad.get_image_url('card').endswith('_card.jpg'))
+        self.assertEqual(ad.get_image_url(), ad.image.url)
+    
+    def test_variants_fix_orientation_and_strip_exif(self):
+        """Тест исправления ориентации и удаления EXIF"""
+        image = Image.new('RGB', (200, 100), color='green')
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: поворот на 90 градусов
+        exif[0x010F] = 'TestCamera'  # Make
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', exif=exif)
+        ad = self.create_ad_with_image(SimpleUploadedFile('rotated.jpg', buffer.getvalue(), content_type='image/jpeg'))
+        
+        detail = self.open_variant(ad, 'detail')
+        self.assertEqual(detail.size, (100, 200))
+        self.assertEqual(len(detail.getexif()), 0)
+    
+    def test_replacing_and_deleting_image_removes_variants(self):
+        """Тест удаления старых вариантов при замене изображения и удалении объявления"""
+        ad = self.create_ad_with_image(self.create_test_image())
+        storage = ad.image.storage
+        old_files = [ad.image.name, *ad.image_variants.values()]
+        
+        ad.image = self.create_test_image()
+        ad.save()
+        ad.refresh_from_db()
+        self.assertTrue(all(not storage.exists(name) for name in old_files))
+        self.assertEqual(len(ad.image_variants), 3)
+        self.assertTrue(all(storage.exists(name) for name in ad.image_variants.values()))
+        
+        new_files = [ad.image.name, *ad.image_variants.values()]
+        ad.delete()
+        self.assertTrue(all(not storage.exists(name) for name in new_files))
+    
+    def test_broken_image_falls_back_to_original(self):
+        """Тест, что при ошибке обработки используется оригинал"""
+        ad = self.create_ad_with_image(SimpleUploadedFile('broken.jpg', b'not an image', content_type='image/jpeg'))
+        self.assertEqual(ad.image_variants, {})
+        self.assertEqual(ad.get_image_url('card'), ad.image.url)
+    
+    def test_backfill_command(self):
+        """Тест команды генерации вариантов для существующих объявлений"""
+        ad = self.create_ad_with_image(self.create_test_image())
+        Ad.objects.filter(pk=ad.pk).update(image_variants={})
+        
+        call_command('generate_image_variants', stdout=io.StringIO())
+        ad.refresh_from_db()
+        self.assertEqual(set(ad.image_variants), {'card', 'detail', 'admin'})
+    
+    def test_api_returns_variant_urls(self):
+        """Тест URL вариантов изображения в API"""
+        ad = self.create_ad_with_image(self.create_test_image())
+        response = self.client.get(f'/api/ads/{ad.pk}/')
+        self.assertTrue(response.data['thumbnail_url'].startswith('http://testserver/'))
+        self.assertTrue(response.data['thumbnail_url'].endswith('_card.jpg'))
+        self.assertTrue(response.data['display_image_url'].endswith('_detail.jpg'))
 
 
 class APITestCase(APITestCase):
@@ -594,4 +833,2021 @@ class APITestCase(APITestCase):
         # Фильтрация по категории
         response = self.client.get(url, {'category': 'books'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data['results']), 1)
\ No newline at end of file
+        self.assertEqual(len(response.data['results']), 1)
+
+
+class KeysetPaginationTest(TestCase):
+    """Тесты keyset-пагинации"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='pageuser', password='pass123')
+        self.other = User.objects.create_user(username='pageother', password='pass123')
+        self.ads = [
+            Ad.objects.create(
+                user=self.user,
+                title=f'Объявление номер {i}',
+                description='Описание объявления для проверки пагинации',
+                category='books',
+                condition='good'
+            )
+            for i in range(7)
+        ]
+        # Одинаковое время создания у нескольких объявлений: порядок решает id
+        same_time = timezone.now()
+        Ad.objects.filter(pk__in=[ad.pk for ad in self.ads[2:5]]).update(created_at=same_time)
+    
+    def expected_order(self):
+        ads = Ad.objects.filter(user=self.user).order_by('-created_at', '-id')
+        return list(ads.values_list('id', flat=True))
+    
+    def collect_pages(self, url):
+        ids = []
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertFalse(any('COUNT(' in q['sql'] for q in ctx.captured_queries))
+            self.assertNotIn('count', response.data)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return ids
+    
+    def test_api_keyset_pages_cover_all_ads(self):
+        """Тест обхода всех страниц API по курсору без пропусков и повторов"""
+        ids = self.collect_pages('/api/ads/?cursor=&page_size=2')
+        self.assertEqual(ids, self.expected_order())
+    
+    def test_api_keyset_respects_ascending_ordering(self):
+        """Тест keyset-пагинации с сортировкой по возрастанию"""
+        ids = self.collect_pages('/api/ads/?cursor=&page_size=3&ordering=created_at')
+        self.assertEqual(ids, list(reversed(self.expected_order())))
+    
+    def test_api_keyset_rejects_other_orderings(self):
+        """Тест 400 для курсора с сортировкой не по created_at вместо подмены порядка"""
+        for params in ({'ordering': 'updated_at'}, {'ordering': '-updated_at'}, {'search': 'Объявление'}):
+            response = self.client.get('/api/ads/', {'cursor': '', **params})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+            self.assertIn('cursor', response.data)
+        # Поиск с явной сортировкой по дате листается курсором
+        query = urlencode({'cursor': '', 'page_size': 3, 'search': 'Объявление', 'ordering': '-created_at'})
+        ids = self.collect_pages(f'/api/ads/?{query}')
+        self.assertEqual(ids, self.expected_order())
+    
+    def test_api_page_number_mode_is_default(self):
+        """Тест, что без курсора используется постраничная пагинация"""
+        response = self.client.get('/api/ads/', {'page_size': 2})
+        self.assertEqual(response.data['count'], 7)
+        self.assertEqual(len(response.data['results']), 2)
+    
+    def test_api_invalid_cursor(self):
+        """Тест некорректного курсора"""
+        response = self.client.get('/api/ads/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_api_keyset_for_proposals_actions(self):
+        """Тест keyset-пагинации в списках предложений"""
+        other_ad = Ad.objects.create(
+            user=self.other,
+            title='Чужое объявление',
+            description='Описание чужого объявления для предложений',
+            category='toys',
+            condition='new'
+        )
+        for ad in self.ads:
+            ExchangeProposal.objects.create(
+                ad_sender=other_ad, ad_receiver=ad,
+                sender=self.other, receiver=self.user,
+                comment='Предложение для проверки пагинации'
+            )
+        self.client.force_authenticate(user=self.user)
+        ids = self.collect_pages('/api/proposals/received/?cursor=&page_size=3')
+        self.assertEqual(
+            ids,
+            list(ExchangeProposal.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        )
+        my_ads = self.collect_pages('/api/ads/my_ads/?cursor=&page_size=4')
+        self.assertEqual(my_ads, self.expected_order())
+    
+    def test_web_next_page_mode(self):
+        """Тест режима "следующая страница" в веб-списке без COUNT(*)"""
+        ids = []
+        url = reverse('ads:ad_list') + '?cursor='
+        pages = 0
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(any('COUNT(' in q['sql'] for q in ctx.captured_queries))
+            ids.extend(ad.pk for ad in response.context['ads'])
+            query = response.context.get('next_page_query')
+            url = reverse('ads:ad_list') + '?' + query if query else None
+            pages += 1
+        
+        self.assertEqual(ids, self.expected_order())
+        self.assertEqual(pages, 1)
+        
+        Ad.objects.bulk_create([
+            Ad(user=self.user, title=f'Дополнительное {i}', description='Описание дополнительного объявления',
+               category='home', condition='new')
+            for i in range(10)
+        ])
+        response = self.client.get(reverse('ads:ad_list'), {'cursor': ''})
+        self.assertEqual(len(response.context['ads']), 12)
+        self.assertContains(response, 'Следующая')
+        
+        # Результаты поиска упорядочены по релевантности - листаются по номерам страниц
+        response = self.client.get(reverse('ads:ad_list'), {'cursor': '', 'query': 'дополнительное'})
+        self.assertFalse(response.context['cursor_mode'])
+        self.assertEqual(response.context['paginator'].count, 10)
+
+
+class QueryPlanTest(TestCase):
+    """Проверка через EXPLAIN, что основные запросы используют составные индексы"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='planuser', password='pass123')
+        if connection.vendor == 'postgresql':
+            # На маленьких таблицах PostgreSQL предпочитает последовательное чтение
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+    
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, f'{index_name} не используется:\n{queryset.query}\n{plan}')
+    
+    def test_active_feed_uses_partial_index(self):
+        """Лента активных объявлений"""
+        feed = Ad.objects.filter(is_active=True)
+        self.assertUsesIndex(feed, 'ad_active_created_idx')
+        self.assertUsesIndex(feed.order_by('-created_at', '-id')[:13], 'ad_active_created_idx')
+    
+    def test_feed_filters_use_partial_indexes(self):
+        """Лента с фильтрами по категории и состоянию"""
+        self.assertUsesIndex(Ad.objects.filter(is_active=True, category='books'), 'ad_active_category_idx')
+        self.assertUsesIndex(Ad.objects.filter(is_active=True, condition='new'), 'ad_active_condition_idx')
+    
+    def test_user_ads_use_composite_index(self):
+        """Объявления пользователя"""
+        self.assertUsesIndex(Ad.objects.filter(user=self.user), 'ad_user_created_idx')
+        self.assertUsesIndex(Ad.objects.filter(user=self.user, is_active=True), 'ad_user_created_idx')
+    
+    def test_proposals_by_user_and_status_use_composite_indexes(self):
+        """Предложения по отправителю/получателю и статусу"""
+        self.assertUsesIndex(
+            ExchangeProposal.objects.filter(sender=self.user, status='pending'),
+            'proposal_sender_status_idx'
+        )
+        self.assertUsesIndex(
+            ExchangeProposal.objects.filter(receiver=self.user, status='pending'),
+            'proposal_receiver_status_idx'
+        )
+        completed = ExchangeProposal.objects.filter(status='accepted').filter(
+            Q(sender=self.user) | Q(receiver=self.user)
+        )
+        self.assertUsesIndex(completed, 'proposal_sender_status_idx')
+        self.assertUsesIndex(completed, 'proposal_receiver_status_idx')
+    
+    def test_competing_pending_proposals_use_partial_indexes(self):
+        """Ожидающие предложения по объявлениям"""
+        competing = ExchangeProposal.objects.filter(status='pending').filter(
+            Q(ad_sender__in=[1, 2]) | Q(ad_receiver__in=[1, 2])
+        )
+        self.assertUsesIndex(competing, 'proposal_pending_ad_sender_idx')
+        self.assertUsesIndex(competing, 'proposal_pending_ad_recv_idx')
+    
+    def test_foreign_keys_use_composite_indexes(self):
+        """Поиск по внешним ключам без своих индексов (удаление пользователя и объявления)"""
+        self.assertUsesIndex(Ad.objects.filter(user=self.user).values('pk'), 'ad_user_created_idx')
+        self.assertUsesIndex(ExchangeProposal.objects.filter(sender=self.user), 'proposal_sender_')
+        self.assertUsesIndex(ExchangeProposal.objects.filter(receiver=self.user), 'proposal_receiver_')
+        self.assertUsesIndex(ExchangeProposal.objects.filter(ad_sender=1), 'ad_sender_id_ad_receiver_id')
+        names = {index.name for index in Ad._meta.indexes}
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(cursor, Ad._meta.db_table)
+        self.assertFalse([
+            name for name, info in indexes.items()
+            if info['index'] and info['columns'] == ['user_id'] and name not in names
+        ])
+
+
+class BackgroundTasksTest(TestCase):
+    """Тесты фоновых задач"""
+    
+    def setUp(self):
+        self.sender = User.objects.create_user(username='sender', email='sender@example.com', password='pass123')
+        self.receiver = User.objects.create_user(username='receiver', email='receiver@example.com', password='pass123')
+        self.ad_sender = Ad.objects.create(
+            user=self.sender, title='Велосипед', description='Горный велосипед',
+            category='sports', condition='good'
+        )
+        self.ad_receiver = Ad.objects.create(
+            user=self.receiver, title='Палатка', description='Туристическая палатка',
+            category='sports', condition='like_new'
+        )
+    
+    def create_flaky_task(self, failures, max_retries=3):
+        calls = []
+        
+        @task(name='tests.flaky', max_retries=max_retries, retry_delay=0)
+        def flaky():
+            calls.append(1)
+            if len(calls) <= failures:
+                raise RuntimeError('Временная ошибка')
+        
+        return flaky, calls
+    
+    def test_immediate_backend_retries_failed_task(self):
+        """Тест повторных попыток при ошибке"""
+        flaky, calls = self.create_flaky_task(failures=2)
+        flaky.delay()
+        self.assertEqual(len(calls), 3)
+    
+    def test_immediate_backend_raises_after_retries(self):
+        """Тест ошибки после исчерпания попыток"""
+        flaky, calls = self.create_flaky_task(failures=5, max_retries=2)
+        with self.assertRaises(RuntimeError):
+            flaky.delay()
+        self.assertEqual(len(calls), 3)
+    
+    def test_thread_pool_backend_runs_after_commit(self):
+        """Тест пула потоков: запуск после фиксации транзакции, повторы и статистика"""
+        flaky, calls = self.create_flaky_task(failures=1)
+        backend = ThreadPoolBackend()
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            backend.enqueue(flaky, (), {})
+            self.assertEqual(calls, [])
+        
+        for _ in range(50):
+            if backend.inspect()['stats'].get('succeeded'):
+                break
+            time.sleep(0.1)
+        backend.executor.shutdown(wait=True)
+        state = backend.inspect()
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(state['stats'], {'queued': 1, 'retried': 1, 'succeeded': 1})
+        self.assertEqual(state['pending'], {})
+    
+    def test_thread_pool_backend_ignores_rolled_back_tasks(self):
+        """Тест, что задача из откаченной транзакции не остается в счетчике ожидающих"""
+        flaky, calls = self.create_flaky_task(failures=0)
+        backend = ThreadPoolBackend()
+        with self.captureOnCommitCallbacks(execute=False):
+            backend.enqueue(flaky, (), {})
+        backend.executor.shutdown(wait=True)
+        self.assertEqual(calls, [])
+        self.assertEqual(backend.inspect()['pending'], {})
+        self.assertEqual(backend.inspect()['stats'], {})
+    
+    def test_task_queue_state(self):
+        """Тест состояния очереди: API сервера для staff и предупреждение команды для пула потоков"""
+        api = APIClient()
+        api.force_authenticate(user=self.sender)
+        self.assertEqual(api.get('/api/tasks/').status_code, 403)
+        self.sender.is_staff = True
+        with assert_query_budget(view_name='api_ads:task-queue'):
+            response = api.get('/api/tasks/')
+        self.assertEqual(response.data['backend'], 'ImmediateBackend')
+        self.assertIn('apps.ads.tasks.send_notification', response.data['registered'])
+        
+        out = io.StringIO()
+        call_command('task_queue', stdout=out)
+        self.assertIn('GET /api/tasks/', out.getvalue())
+    
+    def test_new_proposal_notifies_receiver(self):
+        """Тест уведомления получателя о новом предложении"""
+        ExchangeProposal.objects.create(
+            ad_sender=self.ad_sender, ad_receiver=self.ad_receiver,
+            sender=self.sender, receiver=self.receiver, comment='Меняемся?'
+        )
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['receiver@example.com'])
+        self.assertIn('Велосипед', mail.outbox[0].body)
+    
+    def test_accept_and_reject_notify_sender(self):
+        """Тест уведомления отправителя о решении"""
+        proposal = ExchangeProposal.objects.create(
+            ad_sender=self.ad_sender, ad_receiver=self.ad_receiver,
+            sender=self.sender, receiver=self.receiver, comment='Меняемся?'
+        )
+        proposal.reject()
+        self.assertEqual(mail.outbox[-1].to, ['sender@example.com'])
+        self.assertEqual(mail.outbox[-1].subject, 'Предложение обмена отклонено')
+        
+        proposal.delete()
+        proposal = ExchangeProposal.objects.create(
+            ad_sender=self.ad_sender, ad_receiver=self.ad_receiver,
+            sender=self.sender, receiver=self.receiver, comment='Может, все-таки?'
+        )
+        proposal.accept()
+        self.assertEqual(mail.outbox[-1].to, ['sender@example.com'])
+        self.assertEqual(mail.outbox[-1].subject, 'Предложение обмена принято')
+    
+    def test_notification_skipped_without_email(self):
+        """Тест пропуска уведомления пользователю без email"""
+        self.receiver.email = ''
+        self.receiver.save()
+        ExchangeProposal.objects.create(
+            ad_sender=self.ad_sender, ad_receiver=self.ad_receiver,
+            sender=self.sender, receiver=self.receiver, comment='Меняемся?'
+        )
+        self.assertEqual(mail.outbox, [])
+
+
+class ProposalConcurrencyTest(TransactionTestCase):
+    """Параллельное принятие предложений на одно объявление"""
+    
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', password='pass123')
+        self.ad = Ad.objects.create(
+            user=self.owner, title='Гитара', description='Акустическая гитара',
+            category='other', condition='good'
+        )
+        self.proposals = []
+        for i in range(4):
+            user = User.objects.create_user(username=f'bidder{i}', password='pass123')
+            ad = Ad.objects.create(
+                user=user, title=f'Предмет {i}', description='Предмет для обмена',
+                category='other', condition='good'
+            )
+            self.proposals.append(ExchangeProposal.objects.create(
+                ad_sender=ad, ad_receiver=self.ad,
+                sender=user, receiver=self.owner, comment='Меняемся'
+            ))
+    
+    def test_parallel_accepts_only_one_succeeds(self):
+        """Тест, что из параллельных принятий успешно только одно"""
+        barrier = threading.Barrier(len(self.proposals))
+        results = []
+        lock = threading.Lock()
+        
+        def accept(pk):
+            proposal = ExchangeProposal.objects.get(pk=pk)
+            barrier.wait()
+            try:
+                # SQLite допускает одного писателя: ждем освобождения базы
+                for attempt in range(50):
+                    try:
+                        proposal.accept()
+                        outcome = 'accepted'
+                        break
+                    except OperationalError:
+                        time.sleep(0.05)
+                else:
+                    outcome = 'locked'
+            except ProposalConflict:
+                outcome = 'conflict'
+            finally:
+                connection.close()
+            with lock:
+                results.append(outcome)
+        
+        threads = [threading.Thread(target=accept, args=(p.pk,)) for p in self.proposals]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(sorted(results), ['accepted', 'conflict', 'conflict', 'conflict'])
+        statuses = list(ExchangeProposal.objects.values_list('status', flat=True))
+        self.assertEqual(statuses.count('accepted'), 1)
+        self.assertEqual(statuses.count('rejected'), 3)
+        self.assertEqual(Ad.objects.filter(is_active=False).count(), 2)
+
+
+class QueryBudgetTest(TestCase):
+    """Бюджеты запросов маршрутов объявлений и API при нескольких объектах на странице"""
+    
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'budget{i}', email=f'budget{i}@example.com', password='pass123')
+            for i in range(3)
+        ]
+        self.me, self.other, self.third = self.users
+        self.ads = {
+            user.pk: [
+                Ad.objects.create(
+                    user=user, title=f'Объявление {i} пользователя {user.username}',
+                    description='Описание объявления для проверки бюджета', category='other', condition='good'
+                )
+                for i in range(5)
+            ]
+            for user in self.users
+        }
+        self.received = [
+            ExchangeProposal.objects.create(
+                ad_sender=self.ads[self.other.pk][i], ad_receiver=self.ads[self.me.pk][i],
+                sender=self.other, receiver=self.me, comment='Входящее предложение'
+            )
+            for i in range(4)
+        ]
+        for i in range(4):
+            ExchangeProposal.objects.create(
+                ad_sender=self.ads[self.me.pk][i], ad_receiver=self.ads[self.third.pk][i],
+                sender=self.me, receiver=self.third, comment='Исходящее предложение'
+            )
+        self.client.login(username='budget0', password='pass123')
+        self.api = APIClient()
+        self.api.force_authenticate(user=self.me)
+    
+    def check(self, view_name, client, method, url, data=None, status_code=None):
+        with assert_query_budget(view_name=view_name, method=method):
+            response = getattr(client, method)(url, data or {})
+        if status_code is not None:
+            self.assertEqual(response.status_code, status_code)
+        return response
+    
+    def test_normalize_sql_and_duplicate_detection(self):
+        """Тест нормализации запросов и поиска N+1"""
+        self.assertEqual(
+            normalize_sql("SELECT * FROM t WHERE id = 15 AND name = 'x' AND pk IN (%s, %s, %s)"),
+            'SELECT * FROM t WHERE id = ? AND name = ? AND pk IN (...)'
+        )
+        with self.assertRaises(QueryBudgetExceeded):
+            with assert_query_budget():
+                for ad in Ad.objects.all()[:3]:
+                    ad.user.username
+        with self.assertRaises(QueryBudgetExceeded):
+            with assert_query_budget(budget=1):
+                list(Ad.objects.all())
+                list(User.objects.all())
+        # Команды транзакций (BEGIN вне тестов, SAVEPOINT в тестах) в бюджет не входят
+        from barter_platform.querybudget import QueryRecorder
+        with QueryRecorder() as recorder:
+            with connection.cursor() as cursor:
+                cursor.execute('SAVEPOINT budget_test')
+                cursor.execute('RELEASE SAVEPOINT budget_test')
+            list(User.objects.all())
+        self.assertEqual(len(recorder), 1)
+        recorder = QueryRecorder()
+        recorder(lambda *args: None, 'BEGIN', None, False, {'connection': connection})
+        self.assertEqual(len(recorder), 0)
+    
+    @override_settings(QUERY_BUDGETS={('api_ads:ad-detail', 'GET'): 4, ('api_ads:ad-detail', 'DELETE'): 17, 'ads:proposal_accept': 17})
+    def test_budget_per_method(self):
+        """Тест, что бюджет чтения не наследует бюджет изменения того же маршрута"""
+        self.assertEqual(get_budget('api_ads:ad-detail', 'get'), 4)
+        self.assertEqual(get_budget('api_ads:ad-detail', 'DELETE'), 17)
+        self.assertIsNone(get_budget('api_ads:ad-detail', 'PATCH'))
+        self.assertEqual(get_budget('ads:proposal_accept', 'POST'), 17)
+        with self.assertRaises(QueryBudgetExceeded):
+            with assert_query_budget(view_name='api_ads:ad-detail', method='GET', threshold=10):
+                for _ in range(5):
+                    list(User.objects.filter(pk=self.me.pk).values('pk'))
+    
+    @override_settings(QUERY_BUDGETS={'ads:ad_list': 1})
+    def test_middleware_modes(self):
+        """Тест режимов middleware: исключение, запись в лог, отключение"""
+        with self.assertRaises(QueryBudgetExceeded), self.assertLogs('django.request', 'ERROR'):
+            self.client.get(reverse('ads:ad_list'))
+        with override_settings(QUERY_BUDGET_MODE='log'):
+            with self.assertLogs('barter_platform.querybudget', 'WARNING'):
+                response = self.client.get(reverse('ads:ad_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('X-Query-Count', response)
+        with override_settings(QUERY_BUDGET_MODE='off'):
+            self.assertNotIn('X-Query-Count', self.client.get(reverse('ads:ad_list')))
+    
+    def test_web_ad_routes(self):
+        """Тест маршрутов объявлений (apps/ads/urls.py)"""
+        mine = self.ads[self.me.pk][4]
+        self.check('ads:ad_list', self.client, 'get', reverse('ads:ad_list'), status_code=200)
+        self.check('ads:ad_list', self.client, 'get', reverse('ads:ad_list'), {'cursor': '', 'search': 'Объявление'})
+        self.check('ads:ad_create', self.client, 'get', reverse('ads:ad_create'), status_code=200)
+        self.check('ads:ad_create', self.client, 'post', reverse('ads:ad_create'), {
+            'title': 'Новое объявление', 'description': 'Описание нового объявления',
+            'category': 'other', 'condition': 'new',
+        }, status_code=302)
+        self.check('ads:ad_detail', self.client, 'get', reverse('ads:ad_detail', args=[self.ads[self.third.pk][0].pk]), status_code=200)
+        self.check('ads:ad_detail', self.client, 'get', reverse('ads:ad_detail', args=[mine.pk]), status_code=200)
+        self.check('ads:ad_edit', self.client, 'get', reverse('ads:ad_edit', args=[mine.pk]), status_code=200)
+        self.check('ads:ad_edit', self.client, 'post', reverse('ads:ad_edit', args=[mine.pk]), {
+            'title': 'Измененное объявление', 'description': 'Измененное описание объявления',
+            'category': 'other', 'condition': 'new',
+        }, status_code=302)
+        self.check('ads:my_ads', self.client, 'get', reverse('ads:my_ads'), status_code=200)
+        self.check('ads:ad_delete', self.client, 'get', reverse('ads:ad_delete', args=[self.ads[self.me.pk][3].pk]), status_code=200)
+        self.check('ads:ad_delete', self.client, 'post', reverse('ads:ad_delete', args=[self.ads[self.me.pk][3].pk]), status_code=302)
+    
+    def test_web_proposal_routes(self):
+        """Тест маршрутов предложений обмена (apps/ads/urls.py)"""
+        target = self.ads[self.third.pk][4]
+        self.check('ads:proposal_list', self.client, 'get', reverse('ads:proposal_list'), status_code=200)
+        self.check('ads:proposal_create', self.client, 'get', reverse('ads:proposal_create', args=[target.pk]), status_code=200)
+        self.check('ads:proposal_create', self.client, 'post', reverse('ads:proposal_create', args=[target.pk]), {
+            'ad_sender': self.ads[self.me.pk][4].pk, 'comment': 'Давайте меняться',
+        }, status_code=302)
+        self.check('ads:proposal_reject', self.client, 'get', reverse('ads:proposal_reject', args=[self.received[1].pk]), status_code=302)
+        self.check('ads:proposal_resolve', self.client, 'post', reverse('ads:proposal_resolve'), {
+            'reject': [self.received[2].pk, self.received[3].pk],
+        }, status_code=302)
+        self.check('ads:proposal_accept', self.client, 'get', reverse('ads:proposal_accept', args=[self.received[0].pk]), status_code=302)
+        self.received[0].refresh_from_db()
+        self.assertEqual(self.received[0].status, 'accepted')
+    
+    def test_api_ad_routes(self):
+        """Тест маршрутов API объявлений (apps/ads/api_urls.py)"""
+        mine = self.ads[self.me.pk][4]
+        self.check('api_ads:api-root', self.api, 'get', '/api/', status_code=200)
+        self.check('api_ads:ad-list', self.api, 'get', '/api/ads/', status_code=200)
+        self.check('api_ads:ad-list', self.api, 'get', '/api/ads/', {
+            'cursor': '', 'search': 'Объявление', 'ordering': '-created_at',
+        }, status_code=200)
+        self.check('api_ads:ad-list', self.api, 'post', '/api/ads/', {
+            'title': 'Новое объявление', 'description': 'Описание нового объявления',
+            'category': 'other', 'condition': 'new',
+        }, status_code=201)
+        self.check('api_ads:ad-detail', self.api, 'get', f'/api/ads/{mine.pk}/', status_code=200)
+        self.check('api_ads:ad-detail', self.api, 'patch', f'/api/ads/{mine.pk}/', {'title': 'Новый заголовок'}, status_code=200)
+        self.check('api_ads:ad-my-ads', self.api, 'get', '/api/ads/my_ads/', status_code=200)
+        self.check('api_ads:ad-deactivate', self.api, 'post', f'/api/ads/{mine.pk}/deactivate/', status_code=200)
+        self.check('api_ads:ad-detail', self.api, 'delete', f'/api/ads/{self.ads[self.me.pk][0].pk}/', status_code=204)
+    
+    def test_api_proposal_routes(self):
+        """Тест маршрутов API предложений обмена (apps/ads/api_urls.py)"""
+        self.check('api_ads:proposal-list', self.api, 'get', '/api/proposals/', status_code=200)
+        self.check('api_ads:proposal-detail', self.api, 'get', f'/api/proposals/{self.received[2].pk}/', status_code=200)
+        self.check('api_ads:proposal-sent', self.api, 'get', '/api/proposals/sent/', status_code=200)
+        self.check('api_ads:proposal-received', self.api, 'get', '/api/proposals/received/', status_code=200)
+        self.check('api_ads:proposal-list', self.api, 'post', '/api/proposals/', {
+            'ad_sender_id': self.ads[self.me.pk][4].pk, 'ad_receiver_id': self.ads[self.third.pk][4].pk,
+            'comment': 'Предложение через API',
+        }, status_code=201)
+        self.check('api_ads:proposal-reject', self.api, 'post', f'/api/proposals/{self.received[2].pk}/reject/', status_code=200)
+        self.check('api_ads:proposal-accept', self.api, 'post', f'/api/proposals/{self.received[3].pk}/accept/', status_code=200)
+        self.check('api_ads:proposal-resolve', self.api, 'post', '/api/proposals/resolve/', {
+            'accept': self.received[0].pk, 'reject': [self.received[1].pk],
+        }, status_code=200)
+        self.check('api_ads:trade-cycle-list', self.api, 'get', '/api/trade-cycles/', status_code=200)
+
+
+class BenchmarkTest(TestCase):
+    """Тесты бенчмарка (apps/ads/benchmark.py)"""
+    
+    def test_percentile(self):
+        """Тест перцентилей с интерполяцией"""
+        from .benchmark import percentile
+        self.assertEqual(percentile([3, 1, 2, 4, 5], 50), 3)
+        self.assertEqual(percentile([1, 2], 50), 1.5)
+        self.assertAlmostEqual(percentile(list(range(1, 101)), 95), 95.05)
+        self.assertIsNone(percentile([], 50))
+    
+    def test_run_benchmark(self):
+        """Тест прогона сценариев на небольшом наборе данных"""
+        from .benchmark import SCENARIOS, compare, seed_dataset, run_benchmark
+        seed_dataset(users=5, ads=40, proposals=20, seed=1)
+        self.assertEqual(Ad.objects.count(), 40)
+        self.assertEqual(ExchangeProposal.objects.count(), 20)
+        
+        results = run_benchmark(SCENARIOS, iterations=2, warmup=1, seed=1)
+        self.assertEqual(set(results['scenarios']), {scenario.name for scenario in SCENARIOS})
+        for name, result in results['scenarios'].items():
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+            self.assertGreater(result['queries_median'], 0, name)
+            self.assertTrue(all(code < 500 for code in result['status_codes']), name)
+        self.assertEqual(results['meta']['dataset']['users'], 5)
+        self.assertEqual(results['meta']['cache'], 'off')
+        
+        # Созданные через API объявления активны - как при обычной публикации
+        created = Ad.objects.filter(title__startswith='Новое объявление')
+        self.assertEqual(created.count(), 3)
+        self.assertFalse(created.filter(is_active=False).exists())
+        # Принятые в сценарии предложения действительно приняты
+        self.assertEqual(ExchangeProposal.objects.filter(comment='Бенчмарк', status='accepted').count(), 3)
+        
+        diff = compare(results, results)
+        self.assertEqual(diff['ad_list'], {'p50_change_pct': 0.0, 'p95_change_pct': 0.0, 'queries_change': 0})
+    
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_benchmark_bypasses_cache(self):
+        """Тест, что без cached=True повторные запросы идут в базу, а не в кэш"""
+        from .benchmark import SCENARIOS, seed_dataset, run_benchmark
+        seed_dataset(users=3, ads=10, proposals=2, seed=1)
+        scenarios = [scenario for scenario in SCENARIOS if scenario.name == 'api_ads_list']
+        cold = run_benchmark(scenarios, iterations=3, warmup=1)['scenarios']['api_ads_list']
+        warm = run_benchmark(scenarios, iterations=3, warmup=1, cached=True)['scenarios']['api_ads_list']
+        self.assertGreater(cold['queries_median'], 0)
+        self.assertEqual(warm['queries_median'], 0)
+
+
+class DataGeneratorTest(TestCase):
+    """Тесты генератора синтетических данных (apps/ads/datagen.py)"""
+    
+    def generate(self, **options):
+        from .datagen import generate_data
+        params = {'users': 20, 'ads': 300, 'proposals': 150, 'seed': 7, 'batch_size': 100}
+        params.update(options)
+        return generate_data(**params)
+    
+    def test_counts_and_consistency(self):
+        """Тест количества записей и согласованности статусов с объявлениями"""
+        from apps.users.counters import recount
+        stats = self.generate()
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Ad.objects.count(), 300)
+        self.assertEqual(ExchangeProposal.objects.count(), stats['proposals'])
+        self.assertEqual(stats['proposals'], 150)
+        self.assertTrue(all(stats['statuses'].values()))
+        
+        # Счетчики профилей посчитаны генератором
+        self.assertEqual(recount(), 0)
+        # Ключи взаимного обмена записаны вместе с объявлениями - как после пересборки
+        from .models import AdTradeKey
+        from .wants import rebuild_trade_keys
+        self.assertEqual(AdTradeKey.objects.count(), stats['trade_keys'])
+        self.assertEqual(rebuild_trade_keys(), stats['trade_keys'])
+        # и ключи поиска дубликатов
+        from .duplicates import rebuild_duplicate_keys
+        from .models import AdDuplicateKey
+        self.assertEqual(AdDuplicateKey.objects.count(), stats['duplicate_keys'])
+        self.assertEqual(rebuild_duplicate_keys(), stats['duplicate_keys'])
+        # Участники принятого обмена сняты с публикации, ожидающие - только между активными
+        accepted = ExchangeProposal.objects.filter(status='accepted')
+        self.assertFalse(accepted.filter(Q(ad_sender__is_active=True) | Q(ad_receiver__is_active=True)).exists())
+        pending = ExchangeProposal.objects.filter(status='pending')
+        self.assertFalse(pending.filter(Q(ad_sender__is_active=False) | Q(ad_receiver__is_active=False)).exists())
+        self.assertFalse(ExchangeProposal.objects.filter(sender=F('receiver')).exists())
+        # Предложение создано после обоих объявлений
+        self.assertFalse(ExchangeProposal.objects.filter(
+            Q(created_at__lt=F('ad_sender__created_at')) | Q(created_at__lt=F('ad_receiver__created_at'))
+        ).exists())
+    
+    def test_dates_and_search(self):
+        """Тест распределения дат и индексации текста"""
+        self.generate(days=30)
+        # Даты генератора записаны без отключения auto_now_add у общего для процесса поля
+        self.assertTrue(Ad._meta.get_field('created_at').auto_now_add)
+        oldest = Ad.objects.order_by('created_at').first()
+        self.assertLess(oldest.created_at, timezone.now() - timezone.timedelta(days=29))
+        self.assertIn(oldest, search_ads(Ad.objects.all(), oldest.title.split()[-1]))
+        
+        # Новые объекты после генерации получают следующие id
+        ad = Ad.objects.create(
+            user=User.objects.first(), title='Новое', description='Описание', category='other', condition='new'
+        )
+        self.assertEqual(ad.pk, Ad.objects.exclude(pk=ad.pk).order_by('-pk').first().pk + 1)
+        self.assertGreater(ad.created_at, oldest.created_at)
+    
+    def test_deterministic(self):
+        """Тест повторяемости: одинаковый seed дает одинаковые данные"""
+        def snapshot():
+            return (
+                list(Ad.objects.order_by('pk').values_list(
+                    'title', 'description', 'category', 'is_active', 'created_at', 'updated_at'
+                )),
+                list(ExchangeProposal.objects.order_by('pk').values_list('status', 'comment', 'created_at')),
+            )
+        self.generate()
+        first = snapshot()
+        ExchangeProposal.objects.all().delete()
+        Ad.objects.all().delete()
+        User.objects.all().delete()
+        self.generate()
+        self.assertEqual(snapshot(), first)
+        self.generate(seed=8)
+        self.assertNotEqual(snapshot()[0][300:], first[0])
+    
+    def test_command(self):
+        """Тест команды generate_data"""
+        out = io.StringIO()
+        call_command('generate_data', '--end', '2024-06-01', users=5, ads=30, proposals=10, seed=1, stdout=out)
+        self.assertEqual(Ad.objects.count(), 30)
+        end = timezone.make_aware(timezone.datetime(2024, 6, 1))
+        self.assertLessEqual(Ad.objects.latest('updated_at').updated_at, end)
+        with self.assertRaises(CommandError):
+            call_command('generate_data', '--end', 'вчера', stdout=out)
+        self.assertIn('Создано', out.getvalue())
+    
+    def test_copy_format(self):
+        """Тест формата COPY и выбора способа записи"""
+        from .datagen import CopyWriter, RawInsertWriter, get_writer
+        self.assertEqual(CopyWriter.format_value(None), '\\N')
+        self.assertEqual(CopyWriter.format_value(True), 't')
+        self.assertEqual(CopyWriter.format_value('а\tб\nв\\'), 'а\\tб\\nв\\\\')
+        self.assertEqual(CopyWriter.format_value({'a': 'б'}), '{"a": "б"}')
+        with self.assertRaises(CommandError):
+            call_command('generate_data', method='copy', ads=1, stdout=io.StringIO())
+        self.assertNotIsInstance(get_writer('auto'), CopyWriter)
+        self.assertIsInstance(get_writer('insert'), RawInsertWriter)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class AdListCacheTest(TestCase):
+    """Тесты кэша страниц списка объявлений (apps/ads/cache.py)"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='owner', password='testpass123')
+        self.other = User.objects.create_user(username='other', password='testpass123')
+        self.phone = Ad.objects.create(
+            user=self.user, title='Телефон', description='Смартфон в хорошем состоянии',
+            category='electronics', condition='good',
+        )
+        self.book = Ad.objects.create(
+            user=self.other, title='Книга', description='Роман в твердой обложке',
+            category='books', condition='good',
+        )
+    
+    def get(self, **params):
+        return self.client.get(reverse('ads:ad_list'), params)
+    
+    def create_ad(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Ad.objects.create(**{'user': self.user, 'description': 'Описание', 'condition': 'new', **fields})
+    
+    def test_cached_page_served_without_queries(self):
+        """Тест повторного запроса страницы из кэша"""
+        first = self.get()
+        with self.assertNumQueries(0):
+            second = self.get()
+        self.assertEqual([ad.pk for ad in second.context['ads']], [ad.pk for ad in first.context['ads']])
+        self.assertContains(second, 'Телефон')
+        self.assertEqual(second.context['paginator'].count, 2)
+        
+        self.get(cursor='')
+        with self.assertNumQueries(0):
+            self.assertContains(self.get(cursor=''), 'Книга')
+    
+    def test_normalized_parameters(self):
+        """Тест общего ключа для эквивалентных параметров поиска"""
+        self.get(query='Телефон!', category='electronics')
+        with self.assertNumQueries(0):
+            response = self.get(query='  телефон ', category='electronics', page='1')
+        self.assertEqual(list(response.context['ads']), [self.phone])
+        # Некорректные параметры игнорируются, как и без кэша
+        self.get()
+        with self.assertNumQueries(0):
+            self.get(category='unknown')
+    
+    def test_invalidation_by_category(self):
+        """Тест сброса кэша только для категории измененного объявления"""
+        self.get()
+        self.get(category='books')
+        self.get(category='electronics')
+        
+        new = self.create_ad(title='Ноутбук', category='electronics')
+        self.assertContains(self.get(), 'Ноутбук')
+        self.assertContains(self.get(category='electronics'), 'Ноутбук')
+        with self.assertNumQueries(0):
+            self.get(category='books')
+        
+        # Смена категории сбрасывает и прежнюю, и новую
+        with self.captureOnCommitCallbacks(execute=True):
+            new.category = 'books'
+            new.save()
+        self.assertNotContains(self.get(category='electronics'), 'Ноутбук')
+        self.assertContains(self.get(category='books'), 'Ноутбук')
+        
+        # Деактивация и удаление
+        with self.captureOnCommitCallbacks(execute=True):
+            new.is_active = False
+            new.save()
+        self.assertNotContains(self.get(category='books'), 'Ноутбук')
+        self.get(category='electronics')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.phone.delete()
+        self.assertNotContains(self.get(category='electronics'), 'Телефон')
+    
+    def test_invalidation_after_accept(self):
+        """Тест сброса кэша при обмене (объявления деактивируются через update())"""
+        proposal = ExchangeProposal.objects.create(
+            ad_sender=self.phone, ad_receiver=self.book, sender=self.user, receiver=self.other, comment='Обмен',
+        )
+        self.assertEqual(len(self.get().context['ads']), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            proposal.accept()
+        self.assertEqual(len(self.get().context['ads']), 0)
+    
+    def test_versions(self):
+        """Тест версий категорий: изменения откладываются до коммита"""
+        from .cache import get_list_version, invalidate_ad_lists
+        books, electronics, common = get_list_version('books'), get_list_version('electronics'), get_list_version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            invalidate_ad_lists('books')
+            self.assertEqual(get_list_version('books'), books)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(get_list_version('books'), books + 1)
+        self.assertEqual(get_list_version(), common + 1)
+        self.assertEqual(get_list_version('electronics'), electronics)
+        # Вытесненная версия создается заново, а не начинается с нуля
+        cache.delete('ads:list:version:books')
+        self.assertGreater(get_list_version('books'), books + 1)
+    
+    def test_detail_and_api_list_cached(self):
+        """Тест кэша карточки объявления и списка в API"""
+        url = reverse('ads:ad_detail', args=[self.phone.pk])
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(url), 'Телефон')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.phone.title = 'Телефон с чехлом'
+            self.phone.save()
+        self.assertContains(self.client.get(url), 'Телефон с чехлом')
+        self.assertEqual(self.client.get(reverse('ads:ad_detail', args=[9999])).status_code, 404)
+        
+        api = APIClient()
+        first = api.get('/api/ads/', {'category': 'electronics'})
+        with self.assertNumQueries(0):
+            second = api.get('/api/ads/', {'category': 'electronics'})
+        self.assertEqual(second.json(), first.json())
+        self.create_ad(title='Ноутбук', category='electronics')
+        self.assertEqual(api.get('/api/ads/', {'category': 'electronics'}).json()['count'], 2)
+    
+    def test_cached_ads_without_private_author_fields(self):
+        """Тест кэша страниц: у автора объявлений только id и имя, без хэша пароля"""
+        import pickle
+        self.get()
+        self.get(cursor='')
+        self.client.get(reverse('ads:ad_detail', args=[self.phone.pk]))
+        entries = {key: pickle.loads(value) for key, value in cache._cache.items()}
+        pages = [value[1] for key, value in entries.items() if ':list:page:' in key]
+        self.assertEqual(len(pages), 2)
+        detail = next(value[1] for key, value in entries.items() if ':detail:' in key)
+        showcase = next(value[1] for key, value in entries.items() if ':list:showcase:' in key)
+        for ad in [*pages[0]['ads'], *pages[1]['ads'], detail, *showcase]:
+            self.assertTrue({'password', 'email', 'is_staff', 'is_superuser'} <= ad.user.get_deferred_fields())
+            self.assertIn(ad.user.username, ('owner', 'other'))
+        self.assertFalse(any(self.user.password.encode() in value for value in cache._cache.values()))
+    
+    def test_invalidation_by_author_change(self):
+        """Тест сброса списков, карточек и фрагментов при смене имени или email автора"""
+        api = APIClient()
+        detail = reverse('ads:ad_detail', args=[self.phone.pk])
+        self.get()
+        self.client.get(detail)
+        api.get('/api/ads/')
+        updated_at = self.phone.updated_at
+        
+        # Вход меняет только last_login - кэш остается
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.login(username='owner', password='testpass123')
+            self.client.logout()
+        with self.assertNumQueries(0):
+            self.get()
+        
+        user = User.objects.get(pk=self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.username = 'renamed'
+            user.email = 'renamed@example.com'
+            user.save()
+        self.phone.refresh_from_db()
+        self.assertGreater(self.phone.updated_at, updated_at)
+        self.assertContains(self.get(), 'renamed')
+        self.assertContains(self.client.get(detail), 'renamed')
+        owners = {ad['user']['email'] for ad in api.get('/api/ads/').json()['results']}
+        self.assertIn('renamed@example.com', owners)
+    
+    def test_fragment_cache(self):
+        """Тест кэша фрагментов: ключ по ad.pk и ad.updated_at"""
+        from django.template import Context, Template
+        template = Template('{% load ads_tags %}{% ad_card ad %}')
+        self.assertIn('Телефон', template.render(Context({'ad': self.phone})))
+        # Без изменения updated_at используется закэшированный фрагмент
+        self.phone.title = 'Не сохранено'
+        self.assertNotIn('Не сохранено', template.render(Context({'ad': self.phone})))
+        self.phone.title = 'Телефон в чехле'
+        self.phone.save()
+        html = Template('{% load ads_tags %}{% ad_cards ads %}').render(Context({'ads': [self.phone, self.book]}))
+        self.assertIn('Телефон в чехле', html)
+        self.assertIn('Книга', html)
+        self.assertEqual(html.count('class="card h-100"'), 2)
+        
+        # Страница объявления и "Мои объявления" используют те же фрагменты
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(reverse('ads:ad_detail', args=[self.phone.pk])), 'Смартфон в хорошем состоянии')
+        response = self.client.get(reverse('ads:my_ads'))
+        self.assertContains(response, 'Телефон в чехле')
+        self.assertContains(response, reverse('ads:ad_edit', args=[self.phone.pk]))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CacheRefreshTest(TestCase):
+    """Тесты мягкого/жесткого срока жизни и единственного пересчета (get_or_refresh)"""
+    
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+    
+    def build(self, value='новое'):
+        self.calls += 1
+        return value
+    
+    def test_fresh_value(self):
+        """Тест свежего значения: пересчета нет"""
+        from .cache import get_or_refresh
+        self.assertEqual(get_or_refresh('key', self.build, soft_ttl=60, hard_ttl=120), 'новое')
+        self.assertEqual(get_or_refresh('key', lambda: self.build('другое'), soft_ttl=60, hard_ttl=120), 'новое')
+        self.assertEqual(self.calls, 1)
+    
+    def test_stale_value_while_refreshing(self):
+        """Тест устаревшего значения: пока другой процесс пересчитывает, отдается прежнее"""
+        from .cache import get_or_refresh
+        get_or_refresh('key', lambda: 'старое', soft_ttl=0, hard_ttl=120)
+        cache.add('key:lock', 'другой процесс')
+        self.assertEqual(get_or_refresh('key', self.build, soft_ttl=0, hard_ttl=120), 'старое')
+        self.assertEqual(self.calls, 0)
+        
+        cache.delete('key:lock')
+        self.assertEqual(get_or_refresh('key', self.build, soft_ttl=60, hard_ttl=120), 'новое')
+        self.assertEqual(self.calls, 1)
+        self.assertIsNone(cache.get('key:lock'))
+    
+    def test_single_flight(self):
+        """Тест одновременных промахов: значение считает один поток"""
+        from .cache import get_or_refresh
+        barrier = threading.Barrier(6)
+        results = []
+        
+        def slow_build():
+            time.sleep(0.2)
+            return self.build()
+        
+        def worker():
+            barrier.wait()
+            results.append(get_or_refresh('hot', slow_build, soft_ttl=60, hard_ttl=120, lock_timeout=5))
+        
+        threads = [threading.Thread(target=worker) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['новое'] * 6)
+        self.assertEqual(self.calls, 1)
+    
+    def test_lock_timeout_and_errors(self):
+        """Тест ожидания зависшей блокировки и ошибки при пересчете"""
+        from .cache import get_or_refresh
+        cache.add('key:lock', 'зависший процесс')
+        self.assertEqual(get_or_refresh('key', self.build, soft_ttl=60, hard_ttl=120, lock_timeout=0.1), 'новое')
+        self.assertEqual(self.calls, 1)
+        
+        def failing():
+            raise ValueError('ошибка')
+        with self.assertRaises(ValueError):
+            get_or_refresh('other', failing)
+        # Блокировка снята, следующий запрос считает сам без ожидания
+        self.assertIsNone(cache.get('other:lock'))
+        self.assertEqual(get_or_refresh('other', self.build), 'новое')
+
+
+class ConditionalRequestTest(TestCase):
+    """Тесты ETag и Last-Modified: 304 без сериализации при неизменных данных"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='etag', password='pass123')
+        self.other = User.objects.create_user(username='etag2', password='pass123')
+        self.ad = Ad.objects.create(
+            user=self.user, title='Велосипед', description='Горный велосипед',
+            category='sports', condition='good'
+        )
+        self.other_ad = Ad.objects.create(
+            user=self.other, title='Книга', description='Роман', category='books', condition='new'
+        )
+        self.proposal = ExchangeProposal.objects.create(
+            ad_sender=self.other_ad, ad_receiver=self.ad, sender=self.other, receiver=self.user
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(user=self.user)
+    
+    def test_api_list_not_modified(self):
+        """Тест 304 для списка по If-None-Match и If-Modified-Since за один запрос"""
+        response = self.api.get('/api/ads/')
+        self.assertEqual(response.status_code, 200)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertIn('no-cache', response['Cache-Control'])
+        
+        with self.assertNumQueries(1):
+            response = self.api.get('/api/ads/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        with self.assertNumQueries(1):
+            response = self.api.get('/api/ads/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        
+        # Другие параметры - другой ETag
+        response = self.api.get('/api/ads/', {'category': 'books'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        # Keyset-страницы без валидаторов
+        self.assertNotIn('ETag', self.api.get('/api/ads/', {'cursor': ''}))
+    
+    def test_api_etag_changes_with_data(self):
+        """Тест нового ETag после изменения и деактивации объявления"""
+        etag = self.api.get('/api/ads/')['ETag']
+        detail_etag = self.api.get(f'/api/ads/{self.ad.pk}/')['ETag']
+        
+        self.ad.title = 'Шоссейный велосипед'
+        self.ad.save()
+        response = self.api.get('/api/ads/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        response = self.api.get(f'/api/ads/{self.ad.pk}/', HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['title'], 'Шоссейный велосипед')
+        
+        etag = self.api.get('/api/ads/')['ETag']
+        Ad.objects.filter(pk=self.other_ad.pk).delete()
+        self.assertEqual(self.api.get('/api/ads/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+    
+    def test_api_etag_changes_with_author(self):
+        """Тест нового ETag после смены email автора: он есть в ответе"""
+        etag = self.api.get('/api/ads/')['ETag']
+        detail_etag = self.api.get(f'/api/ads/{self.ad.pk}/')['ETag']
+        
+        self.user.email = 'new-etag@example.com'
+        self.user.save()
+        response = self.api.get('/api/ads/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('new-etag@example.com', {ad['user']['email'] for ad in response.data['results']})
+        response = self.api.get(f'/api/ads/{self.ad.pk}/', HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user']['email'], 'new-etag@example.com')
+    
+    def test_api_detail_missing(self):
+        """Тест 404 для несуществующего объекта вместо 304"""
+        self.assertEqual(self.api.get('/api/ads/999/', HTTP_IF_NONE_MATCH='*').status_code, 404)
+        self.assertEqual(self.api.get('/api/ads/abc/').status_code, 404)
+        self.assertEqual(self.api.get('/api/proposals/999/').status_code, 404)
+    
+    def test_api_private_validators(self):
+        """Тест ETag предложений: зависит от пользователя и от объявлений в предложении"""
+        response = self.api.get('/api/proposals/received/')
+        self.assertIn('private', response['Cache-Control'])
+        etag = response['ETag']
+        self.assertEqual(self.api.get('/api/proposals/received/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        
+        other_api = APIClient()
+        other_api.force_authenticate(user=self.other)
+        self.assertNotEqual(other_api.get('/api/proposals/received/')['ETag'], etag)
+        
+        # Изменение объявления из предложения меняет ETag предложения
+        detail_etag = self.api.get(f'/api/proposals/{self.proposal.pk}/')['ETag']
+        self.other_ad.title = 'Другая книга'
+        self.other_ad.save()
+        self.assertEqual(self.api.get('/api/proposals/received/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        response = self.api.get(f'/api/proposals/{self.proposal.pk}/', HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, 200)
+        
+        my_ads = self.api.get('/api/ads/my_ads/')
+        self.assertIn('private', my_ads['Cache-Control'])
+        self.assertEqual(self.api.get('/api/ads/my_ads/', HTTP_IF_NONE_MATCH=my_ads['ETag']).status_code, 304)
+    
+    def test_detail_page_not_modified(self):
+        """Тест 304 на странице объявления для гостя и вошедшего пользователя"""
+        url = reverse('ads:ad_detail', kwargs={'pk': self.other_ad.pk})
+        guest = Client()
+        etag = guest.get(url)['ETag']
+        self.assertEqual(guest.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        
+        self.client.login(username='etag', password='pass123')
+        # Первый ответ выставляет CSRF-cookie, от которой зависит форма обмена
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('private', response['Cache-Control'])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        
+        # Новое свое объявление появляется в форме обмена - страница изменилась
+        Ad.objects.create(user=self.user, title='Самокат', description='Детский', category='sports', condition='good')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        self.assertEqual(self.client.get(reverse('ads:ad_detail', kwargs={'pk': 999})).status_code, 404)
+
+
+class FastReadPathTest(TestCase):
+    """Тесты чтения объявлений через values() и рендереров orjson/MessagePack"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', email='reader@example.com', password='pass123')
+        ads = [
+            Ad.objects.create(
+                user=self.user, title=f'Объявление {i}', description='Описание с разделителем',
+                category=category, condition=condition, image_url=image_url,
+            )
+            for i, (category, condition, image_url) in enumerate([
+                ('books', 'new', None),
+                ('sports', 'fair', 'https://example.com/фото.jpg'),
+                ('electronics', 'like_new', ''),
+                ('toys', 'good', None),
+            ])
+        ]
+        # Имена файлов без самих файлов: для URL хранилищу файлы не нужны
+        Ad.objects.filter(pk=ads[0].pk).update(
+            image='ads/2024/01/фото 1.jpg',
+            image_variants={'card': 'ads/variants/1_card.jpg', 'detail': 'ads/variants/1_detail.jpg'},
+        )
+        Ad.objects.filter(pk=ads[3].pk).update(image='ads/2024/01/2.jpg')
+        self.api = APIClient()
+    
+    def expected(self, response, queryset):
+        from rest_framework.renderers import JSONRenderer
+        from .serializers import AdSerializer
+        data = AdSerializer(queryset, many=True, context={'request': response.wsgi_request}).data
+        return JSONRenderer().render(data)
+    
+    def test_list_matches_ad_serializer(self):
+        """Тест совпадения ответа списка с AdSerializer байт в байт"""
+        from barter_platform.renderers import FastJSONRenderer
+        response = self.api.get('/api/ads/', HTTP_HOST='testserver')
+        self.assertEqual(response.status_code, 200)
+        results = FastJSONRenderer().render(response.data['results'])
+        self.assertEqual(results, self.expected(response, Ad.objects.order_by('-created_at')))
+        self.assertIn(b'"image":"http://testserver/media/ads/2024/01/%D1%84%D0%BE%D1%82%D0%BE%201.jpg"', results)
+        self.assertIn('\\u2028'.encode(), response.content)
+        
+        self.api.force_authenticate(user=self.user)
+        response = self.api.get('/api/ads/my_ads/')
+        self.assertEqual(
+            FastJSONRenderer().render(response.data['results']),
+            self.expected(response, Ad.objects.filter(user=self.user).order_by('-created_at')),
+        )
+    
+    def test_renderers(self):
+        """Тест рендерера: тот же JSON, что у DRF"""
+        from decimal import Decimal as D
+        from rest_framework.renderers import JSONRenderer
+        from barter_platform.renderers import FastJSONRenderer
+        data = {
+            'текст': 'Строка ', 'дата': timezone.now(), 'день': timezone.now().date(),
+            'число': D('1.50'), 1: [None, True, 2.5], 'большое': 2 ** 70,
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2'),
+        )
+    
+    @skipUnless(importlib.util.find_spec('msgpack'), 'msgpack не установлен (необязательная зависимость)')
+    def test_msgpack_renderer(self):
+        """Тест MessagePack по заголовку Accept: те же данные, что в JSON"""
+        import json
+        import msgpack
+        response = self.api.get('/api/ads/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), json.loads(self.api.get('/api/ads/').content))
+
+
+class SparseFieldsTest(TestCase):
+    """Тесты ?fields= и ?expand=: лишние поля не попадают ни в ответ, ни в SQL"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='sparse', password='pass123')
+        self.other = User.objects.create_user(username='sparse2', password='pass123')
+        self.ad = Ad.objects.create(
+            user=self.user, title='Палатка', description='Трехместная палатка', category='sports', condition='good'
+        )
+        self.other_ad = Ad.objects.create(
+            user=self.other, title='Спальник', description='Зимний спальник', category='sports', condition='new'
+        )
+        self.proposal = ExchangeProposal.objects.create(
+            ad_sender=self.other_ad, ad_receiver=self.ad, sender=self.other, receiver=self.user
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(user=self.user)
+    
+    def get(self, url, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.api.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return response.data, ' '.join(q['sql'] for q in ctx.captured_queries)
+    
+    def test_proposals_summary_and_expand(self):
+        """Тест предложений: объявления кратко по умолчанию и полностью через expand"""
+        data, sql = self.get('/api/proposals/')
+        result = data['results'][0]
+        self.assertEqual(result['ad_sender'], {'id': self.other_ad.pk, 'title': 'Спальник'})
+        self.assertNotIn('"ads_ad"."description"', sql)
+        
+        data, sql = self.get('/api/proposals/', {'expand': 'ad_sender'})
+        result = data['results'][0]
+        self.assertEqual(result['ad_sender']['description'], 'Зимний спальник')
+        self.assertEqual(result['ad_sender']['user']['username'], 'sparse2')
+        self.assertEqual(set(result['ad_receiver']), {'id', 'title'})
+        self.assertNotIn('password', sql)
+        
+        data, sql = self.get(f'/api/proposals/{self.proposal.pk}/', {'fields': 'id,status'})
+        self.assertEqual(data, {'id': self.proposal.pk, 'status': 'pending'})
+        self.assertNotIn('JOIN', sql)
+    
+    def test_ads_fields(self):
+        """Тест выбора полей объявлений в списке и карточке"""
+        data, sql = self.get('/api/ads/', {'fields': 'id,title,category_display'})
+        self.assertEqual(data['results'][0], {'id': self.other_ad.pk, 'title': 'Спальник', 'category_display': 'Спорт и отдых'})
+        self.assertNotIn('description', sql)
+        self.assertNotIn('auth_user', sql)
+        
+        data, sql = self.get(f'/api/ads/{self.ad.pk}/', {'fields': 'title,user'})
+        self.assertEqual(data, {'title': 'Палатка', 'user': {'id': self.user.pk, 'username': 'sparse', 'email': ''}})
+        self.assertNotIn('description', sql)
+        
+        # Курсорная пагинация работает и без created_at в ответе
+        data, _ = self.get('/api/ads/', {'fields': 'id', 'cursor': '', 'page_size': 1})
+        self.assertEqual(data['results'], [{'id': self.other_ad.pk}])
+        self.assertIsNotNone(data['next'])
+    
+    def test_fields_ignored_on_write(self):
+        """Тест записи: ?fields= не убирает поля, нужные для создания"""
+        response = self.api.post('/api/ads/?fields=id', {
+            'title': 'Котелок походный', 'description': 'Котелок из нержавеющей стали',
+            'category': 'sports', 'condition': 'good',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['title'], 'Котелок походный')
+
+
+@override_settings(SYNC_SETTLE_SECONDS=0)
+class SyncTest(TestCase):
+    """Тесты синхронизации ?since=: изменения, удаления и курсор"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='syncer', password='pass123')
+        self.other = User.objects.create_user(username='syncer2', password='pass123')
+        self.ads = [
+            Ad.objects.create(
+                user=self.user if i % 2 else self.other, title=f'Объявление {i}',
+                description='Описание для синхронизации', category='books', condition='good'
+            )
+            for i in range(4)
+        ]
+        self.proposal = ExchangeProposal.objects.create(
+            ad_sender=self.ads[0], ad_receiver=self.ads[1], sender=self.other, receiver=self.user
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(user=self.user)
+    
+    def sync(self, url, since=None, **params):
+        if since is not None:
+            params['since'] = since
+        response = self.api.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+    
+    def test_ads_changes_and_tombstones(self):
+        """Тест ленты: измененные объявления, удаленные и деактивированные - в deleted"""
+        data = self.sync('/api/ads/sync/')
+        self.assertEqual([ad['id'] for ad in data['results']], [ad.pk for ad in self.ads])
+        self.assertFalse(data['has_more'])
+        with self.assertNumQueries(2):
+            cursor = self.sync('/api/ads/sync/', data['cursor'])['cursor']
+        
+        self.ads[0].title = 'Измененное объявление'
+        self.ads[0].save()
+        self.ads[1].is_active = False
+        self.ads[1].save()
+        deleted_pk = self.ads[2].pk
+        self.ads[2].delete()
+        data = self.sync('/api/ads/sync/', cursor)
+        self.assertEqual([ad['title'] for ad in data['results']], ['Измененное объявление'])
+        self.assertEqual(data['deleted'], [self.ads[1].pk, deleted_pk])
+        
+        data = self.sync('/api/ads/sync/', data['cursor'])
+        self.assertEqual((data['results'], data['deleted']), ([], []))
+    
+    def test_paging_and_settle_window(self):
+        """Тест страниц синхронизации без пропусков и повторов и окна незакоммиченных изменений"""
+        ids, cursor, more = [], None, True
+        while more:
+            data = self.sync('/api/ads/sync/', cursor, page_size=1, fields='id')
+            ids += [ad['id'] for ad in data['results']]
+            cursor, more = data['cursor'], data['has_more']
+        self.assertEqual(ids, [ad.pk for ad in self.ads])
+        self.assertEqual(data['results'][0], {'id': self.ads[-1].pk})
+        
+        with self.settings(SYNC_SETTLE_SECONDS=60):
+            Ad.objects.filter(pk=self.ads[0].pk).update(title='Свежее', updated_at=timezone.now())
+            self.assertEqual(self.sync('/api/ads/sync/', cursor)['results'], [])
+        self.assertEqual(self.sync('/api/ads/sync/', cursor)['results'][0]['title'], 'Свежее')
+        
+        response = self.api.get('/api/ads/sync/', {'since': 'мусор'})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_proposals_tombstones_and_reset(self):
+        """Тест предложений: удаление видно только участникам, старый курсор - полный снимок"""
+        from datetime import timedelta
+        from .models import Tombstone
+        from .sync import encode_sync_cursor
+        cursor = self.sync('/api/proposals/sync/')['cursor']
+        outsider = APIClient()
+        outsider.force_authenticate(user=User.objects.create_user(username='outsider', password='pass123'))
+        outsider_cursor = outsider.get('/api/proposals/sync/').data['cursor']
+        
+        # Предложение удаляется каскадно вместе с объявлением
+        self.ads[0].delete()
+        self.assertEqual(Tombstone.objects.filter(kind='proposal', object_id=self.proposal.pk).count(), 1)
+        data = self.sync('/api/proposals/sync/', cursor)
+        self.assertEqual(data['deleted'], [self.proposal.pk])
+        self.assertEqual(outsider.get('/api/proposals/sync/', {'since': outsider_cursor}).data['deleted'], [])
+        
+        old = timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_DAYS + 1)
+        data = self.sync('/api/proposals/sync/', encode_sync_cursor((old, None), (old, None)))
+        self.assertTrue(data['reset'])
+        self.assertEqual(data['deleted'], [])
+        
+        Tombstone.objects.update(deleted_at=old)
+        call_command('prune_tombstones', stdout=io.StringIO())
+        self.assertFalse(Tombstone.objects.exists())
+
+
+class BulkAdApiTest(TestCase):
+    """Тесты массового создания, изменения и деактивации объявлений"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='shop', password='pass123')
+        self.other = User.objects.create_user(username='shop2', password='pass123')
+        self.api = APIClient()
+        self.api.force_authenticate(user=self.user)
+    
+    def item(self, i, **extra):
+        return {
+            'title': f'Товар магазина {i}', 'description': 'Подробное описание товара магазина',
+            'category': 'electronics', 'condition': 'new', **extra,
+        }
+    
+    def active_ads_count(self):
+        self.user.profile.refresh_from_db()
+        return self.user.profile.active_ads_count
+    
+    def test_bulk_create(self):
+        """Тест создания: ошибки по элементам, одна вставка, счетчик профиля"""
+        with CaptureQueriesContext(connection) as small:
+            self.api.post('/api/ads/bulk_create/', [self.item(0), self.item(1)], format='json')
+        items = [self.item(i) for i in range(2, 22)] + [self.item(22, title='Нет'), 'не объект']
+        with CaptureQueriesContext(connection) as large:
+            response = self.api.post('/api/ads/bulk_create/', items, format='json')
+        self.assertEqual(len(large), len(small))
+        
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual((response.data['succeeded'], response.data['failed']), (20, 2))
+        first, invalid = response.data['results'][0], response.data['results'][20]
+        self.assertEqual(first['status'], 201)
+        self.assertEqual(first['data']['user']['username'], 'shop')
+        self.assertEqual(Ad.objects.get(pk=first['id']).title, 'Товар магазина 2')
+        self.assertEqual((invalid['index'], invalid['status']), (20, 400))
+        self.assertIn('title', invalid['errors'])
+        self.assertEqual(Ad.objects.filter(user=self.user).count(), 22)
+        self.assertEqual(self.active_ads_count(), 22)
+        
+        response = self.api.post('/api/ads/bulk_create/', [{'title': 'Нет'}], format='json')
+        self.assertEqual(response.status_code, 400)
+        with self.settings(ADS_BULK_MAX_ITEMS=2):
+            response = self.api.post('/api/ads/bulk_create/', [self.item(i) for i in range(3)], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.api.post('/api/ads/bulk_create/', {}, format='json').status_code, 400)
+    
+    def test_bulk_update_and_deactivate(self):
+        """Тест изменения и деактивации: проверка владельца, ошибки, счетчики"""
+        mine = [Ad.objects.create(user=self.user, **self.item(i)) for i in range(3)]
+        foreign = Ad.objects.create(user=self.other, **self.item(9))
+        before = mine[0].updated_at
+        
+        response = self.api.patch('/api/ads/bulk_update/', [
+            {'id': mine[0].pk, 'title': 'Новое название товара', 'category': 'books'},
+            {'id': mine[1].pk, 'is_active': False},
+            {'id': mine[2].pk, 'description': 'Коротко'},
+            {'id': foreign.pk, 'title': 'Чужое объявление'},
+            {'id': 999999, 'title': 'Нет такого'},
+            {'title': 'Без id'},
+        ], format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(
+            [item['status'] for item in response.data['results']], [200, 200, 400, 403, 404, 400]
+        )
+        mine[0].refresh_from_db()
+        self.assertEqual((mine[0].title, mine[0].category), ('Новое название товара', 'books'))
+        self.assertGreater(mine[0].updated_at, before)
+        self.assertEqual(Ad.objects.get(pk=foreign.pk).title, 'Товар магазина 9')
+        self.assertEqual(self.active_ads_count(), 2)
+        
+        response = self.api.post(
+            '/api/ads/bulk_deactivate/', {'ids': [mine[0].pk, mine[1].pk, foreign.pk]}, format='json'
+        )
+        self.assertEqual([item['status'] for item in response.data['results']], [200, 200, 403])
+        self.assertFalse(response.data['results'][0]['data']['is_active'])
+        self.assertFalse(Ad.objects.filter(pk__in=[mine[0].pk, mine[1].pk], is_active=True).exists())
+        self.assertTrue(Ad.objects.get(pk=foreign.pk).is_active)
+        self.assertEqual(self.active_ads_count(), 1)
+    
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_bulk_invalidates_cache(self):
+        """Тест сброса кэша списков после массового создания"""
+        cache.clear()
+        self.assertEqual(self.api.get('/api/ads/').data['count'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.api.post('/api/ads/bulk_create/', [self.item(0), self.item(1)], format='json')
+        self.assertEqual(self.api.get('/api/ads/').data['count'], 2)
+
+
+class ProposalResolveTest(TestCase):
+    """Тесты пакетного принятия и отклонения полученных предложений"""
+    
+    def setUp(self):
+        self.me = User.objects.create_user(username='owner', email='owner@example.com', password='pass123')
+        self.senders = [
+            User.objects.create_user(username=f'sender{i}', email=f'sender{i}@example.com', password='pass123')
+            for i in range(4)
+        ]
+        mine = [
+            Ad.objects.create(
+                user=self.me, title=f'Мой товар {i}', description='Описание моего товара',
+                category='other', condition='good'
+            )
+            for i in range(2)
+        ]
+        self.proposals = []
+        for i, sender in enumerate(self.senders):
+            ad = Ad.objects.create(
+                user=sender, title=f'Товар отправителя {i}', description='Описание товара отправителя',
+                category='other', condition='good'
+            )
+            self.proposals.append(ExchangeProposal.objects.create(
+                ad_sender=ad, ad_receiver=mine[i % 2], sender=sender, receiver=self.me, comment='Меняемся?'
+            ))
+        self.api = APIClient()
+        self.api.force_authenticate(user=self.me)
+    
+    def statuses(self):
+        return [proposal.status for proposal in ExchangeProposal.objects.order_by('pk')]
+    
+    def test_api_reject_many(self):
+        """Тест отклонения нескольких предложений: счетчики и уведомления одной пачкой"""
+        ids = [proposal.pk for proposal in self.proposals[:3]]
+        mail.outbox = []
+        response = self.api.post('/api/proposals/resolve/', {'reject': ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'accepted': None, 'rejected': ids, 'competing_rejected': 0})
+        self.assertEqual(self.statuses(), ['rejected', 'rejected', 'rejected', 'pending'])
+        self.me.profile.refresh_from_db()
+        self.assertEqual(self.me.profile.pending_received_count, 1)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [
+            'sender0@example.com', 'sender1@example.com', 'sender2@example.com',
+        ])
+    
+    def test_api_accept_one_reject_rest(self):
+        """Тест принятия одного предложения с отклонением остальных в той же транзакции"""
+        accept, reject = self.proposals[0].pk, [self.proposals[1].pk]
+        response = self.api.post('/api/proposals/resolve/', {'accept': accept, 'reject': reject}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['accepted'], response.data['rejected']), (accept, reject))
+        # Третье предложение - на то же объявление, что и принятое: отклонено как конкурирующее
+        self.assertEqual(response.data['competing_rejected'], 1)
+        self.assertEqual(self.statuses(), ['accepted', 'rejected', 'rejected', 'pending'])
+        self.assertFalse(Ad.objects.get(pk=self.proposals[0].ad_receiver_id).is_active)
+    
+    def test_api_errors_change_nothing(self):
+        """Тест: ошибка в одном предложении - не меняется ни одно"""
+        self.proposals[2].reject()
+        foreign = ExchangeProposal.objects.create(
+            ad_sender=self.proposals[1].ad_receiver, ad_receiver=self.proposals[3].ad_sender,
+            sender=self.me, receiver=self.senders[3], comment='Исходящее'
+        )
+        response = self.api.post('/api/proposals/resolve/', {
+            'accept': self.proposals[0].pk, 'reject': [self.proposals[1].pk, self.proposals[2].pk, foreign.pk, 999999],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data['proposals']), {self.proposals[2].pk, foreign.pk, 999999})
+        self.assertEqual(self.statuses(), ['pending', 'pending', 'rejected', 'pending', 'pending'])
+        
+        for data in ({}, {'reject': 'abc'}, {'reject': [1, 'x']}, {'accept': self.proposals[0].pk, 'reject': [self.proposals[0].pk]}):
+            response = self.api.post('/api/proposals/resolve/', data, format='json')
+            self.assertEqual(response.status_code, 400)
+        
+        self.api.force_authenticate(user=self.senders[0])
+        response = self.api.post('/api/proposals/resolve/', {'reject': [self.proposals[0].pk]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ExchangeProposal.objects.get(pk=self.proposals[0].pk).status, 'pending')
+    
+    def test_conflict_rolls_back(self):
+        """Тест: конфликт при принятии откатывает и отклонение"""
+        Ad.objects.filter(pk=self.proposals[0].ad_sender_id).update(is_active=False)
+        response = self.api.post('/api/proposals/resolve/', {
+            'accept': self.proposals[0].pk, 'reject': [self.proposals[1].pk],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('status', response.data)
+        self.assertEqual(self.statuses(), ['pending'] * 4)
+    
+    def test_web_resolve(self):
+        """Тест веб-формы списка предложений: отклонение отмеченных и принятие одного"""
+        self.client.login(username='owner', password='pass123')
+        response = self.client.get(reverse('ads:proposal_list'))
+        self.assertContains(response, 'name="reject"', count=4)
+        
+        response = self.client.post(reverse('ads:proposal_resolve'), {'reject': [self.proposals[1].pk, self.proposals[3].pk]})
+        self.assertRedirects(response, reverse('ads:proposal_list'))
+        self.assertEqual(self.statuses(), ['pending', 'rejected', 'pending', 'rejected'])
+        
+        response = self.client.post(reverse('ads:proposal_resolve'), {
+            'accept': self.proposals[0].pk, 'reject': [self.proposals[0].pk, self.proposals[2].pk],
+        }, follow=True)
+        self.assertEqual(self.statuses(), ['accepted', 'rejected', 'rejected', 'rejected'])
+        self.assertContains(response, 'Предложение обмена принято!')
+        
+        response = self.client.post(reverse('ads:proposal_resolve'), {'reject': [self.proposals[2].pk]}, follow=True)
+        self.assertContains(response, 'Предложение уже обработано')
+
+
+class ApiBatchTest(TestCase):
+    """Тесты составного запроса /api/batch/"""
+    
+    HOME = ['/api/ads/?page_size=5', '/api/ads/my_ads/', '/api/proposals/sent/', '/api/proposals/received/']
+    
+    def setUp(self):
+        self.me = User.objects.create_user(username='mobile', password='pass123')
+        other = User.objects.create_user(username='mobile2', password='pass123')
+        ads = [
+            Ad.objects.create(
+                user=user, title=f'Объявление {i}', description='Описание объявления для пакета',
+                category='other', condition='good'
+            )
+            for i, user in enumerate([self.me, other, self.me, other])
+        ]
+        ExchangeProposal.objects.create(
+            ad_sender=ads[1], ad_receiver=ads[0], sender=other, receiver=self.me, comment='Входящее'
+        )
+        ExchangeProposal.objects.create(
+            ad_sender=ads[2], ad_receiver=ads[3], sender=self.me, receiver=other, comment='Исходящее'
+        )
+        self.api = APIClient()
+        self.api.login(username='mobile', password='pass123')
+    
+    def batch(self, requests):
+        return self.api.post('/api/batch/', {'requests': requests}, format='json')
+    
+    def test_home_screen_in_one_request(self):
+        """Тест: результаты частей совпадают с отдельными запросами, запросов к базе меньше"""
+        # Бюджеты маршрутов рассчитаны без сессии, которую здесь каждый запрос загружает заново
+        with self.settings(QUERY_BUDGET_MODE='off'), CaptureQueriesContext(connection) as separate:
+            expected = [self.api.get(path).data for path in self.HOME]
+        with CaptureQueriesContext(connection) as combined:
+            response = self.batch([{'id': i, 'path': path} for i, path in enumerate(self.HOME)])
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([part['id'] for part in response.data['responses']], [0, 1, 2, 3])
+        self.assertEqual([part['status'] for part in response.data['responses']], [200] * 4)
+        self.assertEqual([part['body'] for part in response.data['responses']], expected)
+        self.assertEqual(response.data['responses'][3]['body']['count'], 1)
+        # Сессия и пользователь загружаются один раз на пакет
+        self.assertLess(len(combined), len(separate))
+    
+    def test_part_errors(self):
+        """Тест ошибок частей: остальные части выполняются"""
+        response = self.batch([
+            {'path': '/api/ads/999999/'},
+            {'path': '/api/users/me/'},
+            {'path': '/api/batch/'},
+            {'path': '/api/ads/', 'method': 'POST'},
+            {'path': '/api/ads/?page_size=1'},
+        ])
+        self.assertEqual([part['status'] for part in response.data['responses']], [404, 404, 404, 405, 200])
+        self.assertEqual(len(response.data['responses'][4]['body']['results']), 1)
+        
+        self.assertEqual(self.batch([]).status_code, 400)
+        self.assertEqual(self.batch(['/api/ads/']).status_code, 400)
+        with self.settings(API_BATCH_MAX_REQUESTS=2):
+            self.assertEqual(self.batch([{'path': '/api/ads/'}] * 3).status_code, 400)
+    
+    def test_guest_and_query_budget(self):
+        """Тест: гость получает 403 на закрытые части; повторы частей - не N+1"""
+        self.api.logout()
+        response = self.batch([{'path': path} for path in self.HOME])
+        self.assertEqual([part['status'] for part in response.data['responses']], [200, 403, 403, 403])
+        
+        # Одинаковые части: каждая проверяется по бюджету своего маршрута
+        response = self.batch([{'path': f'/api/ads/?page={page}&page_size=1'} for page in (1, 2, 3)])
+        self.assertEqual([part['status'] for part in response.data['responses']], [200] * 3)
+
+
+class TradeCycleTest(TestCase):
+    """Тесты поиска цепочных обменов (apps/ads/cycles.py)"""
+    
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'cycle{i}', password='pass123') for i in range(4)]
+        self.ads = [
+            Ad.objects.create(
+                user=user, title=f'Вещь участника {i}', description='Описание вещи для цепочного обмена',
+                category='other', condition='good'
+            )
+            for i, user in enumerate(self.users)
+        ]
+    
+    def propose(self, i, j):
+        """Участник i предлагает свою вещь за вещь участника j"""
+        return ExchangeProposal.objects.create(
+            ad_sender=self.ads[i], ad_receiver=self.ads[j],
+            sender=self.users[i], receiver=self.users[j], comment='Цепочка'
+        )
+    
+    def test_find_cycles(self):
+        """Тест перебора: каждый цикл один раз, без встречных пар и длиннее предела"""
+        from .cycles import benchmark_cycles, find_cycles
+        edges = [
+            (1, 'a', 'b'), (2, 'b', 'c'), (3, 'c', 'a'),
+            (4, 'c', 'd'), (5, 'd', 'a'),
+            (6, 'a', 'e'), (7, 'e', 'a'),
+        ]
+        self.assertEqual(sorted(map(sorted, find_cycles(edges, 3))), [[1, 2, 3]])
+        self.assertEqual(sorted(map(sorted, find_cycles(edges, 4))), [[1, 2, 3], [1, 2, 4, 5]])
+        self.assertEqual(len(find_cycles(edges, 4, limit=1)), 1)
+        
+        result = benchmark_cycles(nodes=200, edges=800, max_length=4, seed=3)
+        self.assertEqual(result['edges'], 800)
+        self.assertGreater(result['cycles'], 0)
+    
+    def test_incremental_matching_and_api(self):
+        """Тест: предложение, замыкающее цикл, создает цепочный обмен; API видят только участники"""
+        from .models import TradeCycle
+        first, second = self.propose(0, 1), self.propose(1, 2)
+        self.propose(0, 2)
+        self.assertFalse(TradeCycle.objects.exists())
+        third = self.propose(2, 0)
+        
+        cycle = TradeCycle.objects.get()
+        self.assertEqual(cycle.length, 3)
+        self.assertEqual([p.pk for p in cycle.ordered_proposals()], [first.pk, second.pk, third.pk])
+        
+        api = APIClient()
+        api.force_authenticate(user=self.users[1])
+        response = api.get('/api/trade-cycles/')
+        self.assertEqual(response.status_code, 200)
+        steps = response.data['results'][0]['steps']
+        self.assertEqual([step['username'] for step in steps], ['cycle0', 'cycle1', 'cycle2'])
+        self.assertEqual(steps[0]['gives']['title'], 'Вещь участника 0')
+        self.assertEqual(steps[0]['gets']['title'], 'Вещь участника 1')
+        self.assertNotIn('email', str(response.data))
+        
+        with assert_query_budget(view_name='api_ads:trade-cycle-detail'):
+            response = api.get(f'/api/trade-cycles/{cycle.pk}/')
+        self.assertEqual(len(response.data['steps']), 3)
+        
+        api.force_authenticate(user=self.users[3])
+        self.assertEqual(api.get('/api/trade-cycles/').data['count'], 0)
+        self.assertEqual(api.get(f'/api/trade-cycles/{cycle.pk}/').status_code, 404)
+        
+        # Обработанное предложение выводит цикл из выдачи, пересчет его удаляет
+        second.reject()
+        api.force_authenticate(user=self.users[0])
+        self.assertEqual(api.get('/api/trade-cycles/').data['count'], 0)
+        call_command('find_trade_cycles', stdout=io.StringIO())
+        self.assertFalse(TradeCycle.objects.exists())
+    
+    def test_rebuild_command(self):
+        """Тест полного пересчета: циклы длиной до --max-length"""
+        from .models import TradeCycle
+        # Инкрементальный поиск ищет только треугольники - цикл из четырех не найдет
+        with self.settings(TRADE_CYCLE_MAX_LENGTH=3):
+            for i, j in [(0, 1), (1, 2), (2, 3), (3, 0)]:
+                self.propose(i, j)
+        self.assertFalse(TradeCycle.objects.exists())
+        
+        call_command('find_trade_cycles', '--max-length', '3', stdout=io.StringIO())
+        self.assertFalse(TradeCycle.objects.exists())
+        out = io.StringIO()
+        call_command('find_trade_cycles', '--max-length', '4', stdout=out)
+        self.assertIn('найдено циклов: 1', out.getvalue())
+        self.assertEqual(TradeCycle.objects.get().length, 4)
+        with self.assertRaises(CommandError):
+            call_command('find_trade_cycles', '--max-length', '2')
+
+
+class WantsMatchTest(TestCase):
+    """Тесты взаимных предложений (apps/ads/wants.py)"""
+    
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', password='pass123')
+        self.other = User.objects.create_user(username='other', password='pass123')
+        self.laptop = self.create(
+            self.owner, 'Ноутбук Lenovo', 'electronics', wanted_categories=['books'], wanted_keywords='велосипеды'
+        )
+    
+    def create(self, user, title, category, **wants):
+        return Ad.objects.create(
+            user=user, title=title, description='Описание вещи для обмена', category=category,
+            condition='good', **wants
+        )
+    
+    def test_terms(self):
+        """Тест термов: категории, слова по префиксу без служебных слов"""
+        from .wants import offer_terms, want_terms
+        self.assertEqual(offer_terms('Ноутбуки для учебы 15', 'electronics'), ['c:electronics', 'w:ноутбу', 'w:учебы'])
+        self.assertEqual(want_terms(['books'], 'ноутбук, Велосипед'), ['c:books', 'w:ноутбу', 'w:велоси'])
+        self.assertEqual(want_terms([], ''), [])
+    
+    def test_reciprocal_match(self):
+        """Тест: подходят только активные чужие объявления, хотящие это и предлагающие нужное"""
+        from .wants import matching_ads
+        bike = self.create(self.other, 'Велосипед горный', 'sports', wanted_keywords='ноутбук')
+        book = self.create(self.other, 'Сборник рассказов', 'books', wanted_categories=['electronics'])
+        # Предлагает нужное, но ничего не хочет взамен / хочет другое
+        self.create(self.other, 'Велосипед детский', 'sports')
+        self.create(self.other, 'Учебник физики', 'books', wanted_categories=['toys'])
+        # Свое объявление не предлагается
+        self.create(self.owner, 'Велосипед старый', 'sports', wanted_categories=['electronics'])
+        
+        self.assertEqual(list(matching_ads(self.laptop)), [book, bike])
+        self.assertEqual(list(matching_ads(bike)), [self.laptop])
+        
+        # Снятое объявление пропадает из подборки, изменение пожеланий обновляет ключи
+        book.is_active = False
+        book.save()
+        bike.wanted_keywords = 'планшет'
+        bike.save()
+        self.assertEqual(list(matching_ads(self.laptop)), [])
+        bike.wanted_categories = ['electronics']
+        bike.save()
+        self.assertEqual(list(matching_ads(self.laptop)), [bike])
+        
+        # Деактивация в обход save() отсекается при поиске, пересборка индекса удаляет ключи
+        Ad.objects.filter(pk=bike.pk).update(is_active=False)
+        self.assertEqual(list(matching_ads(self.laptop)), [])
+        out = io.StringIO()
+        call_command('rebuild_trade_keys', stdout=out)
+        self.assertIn('ключей: 12', out.getvalue())
+        self.assertFalse(bike.trade_keys.exists())
+    
+    def test_api_and_detail_page(self):
+        """Тест /api/ads/{id}/matches/ и блока на странице своего объявления"""
+        bike = self.create(self.other, 'Велосипед горный', 'sports', wanted_keywords='ноутбук')
+        
+        with assert_query_budget(view_name='api_ads:ad-matches'):
+            response = self.client.get(f'/api/ads/{self.laptop.pk}/matches/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([ad['id'] for ad in response.json()], [bike.pk])
+        self.assertEqual(response.json()[0]['wanted_keywords'], 'ноутбук')
+        
+        api = APIClient()
+        api.force_authenticate(user=self.other)
+        response = api.patch(f'/api/ads/{bike.pk}/', {'wanted_categories': ['cars']}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('wanted_categories', response.data)
+        
+        self.client.login(username='owner', password='pass123')
+        response = self.client.get(reverse('ads:ad_detail', args=[self.laptop.pk]))
+        self.assertContains(response, 'Взаимные предложения')
+        self.assertContains(response, 'Велосипед горный')
+        etag = response['ETag']
+        
+        # Новое подходящее объявление меняет страницу автора
+        self.create(self.other, 'Велосипед шоссейный', 'sports', wanted_categories=['electronics'])
+        response = self.client.get(reverse('ads:ad_detail', args=[self.laptop.pk]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Велосипед шоссейный')
+        
+        # Другим пользователям блок не показывается
+        self.client.login(username='other', password='pass123')
+        response = self.client.get(reverse('ads:ad_detail', args=[self.laptop.pk]))
+        self.assertNotContains(response, 'Взаимные предложения')
+
+
+class SimilarAdsTest(TestCase):
+    """Тесты похожих объявлений (apps/ads/similar.py)"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='seller', password='pass123')
+        texts = [
+            ('Ноутбук Lenovo ThinkPad', 'Рабочий ноутбук, процессор Intel, экран 14 дюймов'),
+            ('Ноутбук Asus VivoBook', 'Легкий ноутбук для учебы, экран 15 дюймов, процессор Ryzen'),
+            ('Детская коляска', 'Прогулочная коляска, складывается книжкой, колеса надувные'),
+            ('Коляска для двойни', 'Коляска для двоих детей, надувные колеса, дождевик'),
+            ('Роман Толстого', 'Война и мир, подарочное издание в твердой обложке'),
+        ]
+        self.ads = [self.create(title, description) for title, description in texts]
+    
+    def create(self, title, description):
+        return Ad.objects.create(
+            user=self.user, title=title, description=description, category='other', condition='good'
+        )
+    
+    def test_terms_and_model(self):
+        """Тест термов и векторов: близкие тексты ближе далеких, модель сохраняется и читается"""
+        from .similar import TextModel, text_terms
+        self.assertEqual(text_terms('Ноутбуки и ноутбук для учёбы 2024'), ['ноутбу', 'ноутбу', 'учебы'])
+        
+        model = TextModel.fit((ad.pk, ad.title, ad.description) for ad in self.ads)
+        scores = (model.matrix @ model.matrix.T).toarray()
+        self.assertGreater(scores[0, 1], scores[0, 2])
+        self.assertAlmostEqual(float(scores[0, 0]), 1, places=5)
+        # В маленькой базе терм трех объявлений из шести не считается слишком частым
+        rows = [(ad.pk, ad.title, ad.description) for ad in self.ads] + [(10 ** 6, 'Ноутбук HP', 'Для работы')]
+        self.assertIn('ноутбу', TextModel.fit(rows).terms)
+        self.assertNotIn('ноутбу', TextModel.fit(rows, max_df_min_ads=len(rows)).terms)
+        
+        path = os.path.join(tempfile.mkdtemp(), 'model.npz')
+        model.save(path)
+        loaded = TextModel.load(path)
+        self.assertEqual(loaded.terms, model.terms)
+        self.assertEqual((loaded.matrix != model.matrix).nnz, 0)
+        self.assertEqual(loaded.max_id, self.ads[-1].pk)
+    
+    def test_rebuild_incremental_and_views(self):
+        """Тест пересчета, обработки нового объявления, страницы и API"""
+        from .models import SimilarAd
+        from .similar import similar_ads, update_similar
+        # Без пересчета модели нет - новые объявления не обрабатываются, в логе предупреждение
+        self.assertFalse(SimilarAd.objects.exists())
+        from . import similar
+        similar._loaded_model = None
+        with self.assertLogs('apps.ads.similar', 'WARNING'):
+            self.assertEqual(update_similar([self.ads[0].pk]), 0)
+        # Предупреждение одно на процесс, а не на каждое объявление
+        with self.assertNoLogs('apps.ads.similar', 'WARNING'):
+            self.assertEqual(update_similar([self.ads[1].pk]), 0)
+        
+        out = io.StringIO()
+        call_command('rebuild_similar_ads', stdout=out)
+        self.assertIn('Объявлений: 5', out.getvalue())
+        laptop, other_laptop, stroller, twin_stroller, novel = self.ads
+        self.assertEqual(list(similar_ads(laptop.pk)), [other_laptop])
+        self.assertEqual(list(similar_ads(stroller.pk)), [twin_stroller])
+        self.assertEqual(list(similar_ads(novel.pk)), [])
+        
+        # Новое объявление сравнивается с матрицей и попадает в списки соседей
+        new_laptop = self.create('Ноутбук HP', 'Ноутбук для работы, процессор Intel, экран 14 дюймов')
+        self.assertEqual(set(similar_ads(new_laptop.pk)), {laptop, other_laptop})
+        self.assertIn(new_laptop, similar_ads(laptop.pk))
+        
+        with assert_query_budget(view_name='api_ads:ad-similar'):
+            response = self.client.get(f'/api/ads/{laptop.pk}/similar/')
+        self.assertEqual({ad['id'] for ad in response.json()}, {new_laptop.pk, other_laptop.pk})
+        self.assertEqual(self.client.get('/api/ads/abc/similar/').status_code, 404)
+        
+        # Снятое объявление пропадает из похожих
+        other_laptop.is_active = False
+        other_laptop.save()
+        response = self.client.get(reverse('ads:ad_detail', args=[laptop.pk]))
+        self.assertContains(response, 'Похожие объявления')
+        self.assertContains(response, 'Ноутбук HP')
+        self.assertNotContains(response, 'Ноутбук Asus')
+        self.assertNotContains(self.client.get(reverse('ads:ad_detail', args=[novel.pk])), 'Похожие объявления')
+
+
+class RandomSampleTest(TestCase):
+    """Случайная выборка по диапазону id вместо order_by('?')"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='testpass123')
+        self.other = User.objects.create_user(username='other', password='testpass123')
+        self.ads = [
+            Ad.objects.create(
+                user=self.user if i % 2 else self.other, title=f'Объявление {i}',
+                description='Описание', category='other', condition='used',
+            )
+            for i in range(10)
+        ]
+    
+    def test_random_sample(self):
+        import random
+        from .sampling import random_sample
+        
+        queryset = Ad.objects.filter(user=self.user)
+        own = set(queryset)
+        with self.assertNumQueries(2):
+            sample = random_sample(queryset, 3)
+        self.assertEqual(len(sample), 3)
+        self.assertEqual(len(set(sample)), 3)
+        self.assertTrue(set(sample) <= own)
+        # Выборка больше таблицы - все строки
+        self.assertEqual(set(random_sample(queryset, 20)), own)
+        self.assertEqual(random_sample(queryset, 0), [])
+        with self.assertNumQueries(1):
+            self.assertEqual(random_sample(Ad.objects.filter(pk=0), 3), [])
+        # Первая и последняя строки тоже выпадают
+        rng = random.Random(0)
+        seen = set()
+        for _ in range(50):
+            seen.update(random_sample(Ad.objects.all(), 1, rng))
+        self.assertEqual(seen, set(self.ads))
+    
+    def test_random_sample_tops_up_colliding_pivots(self):
+        """Тест добора: точки в большом пропуске id попадают в одни и те же строки"""
+        import random
+        from unittest import mock
+        from .sampling import random_sample
+        
+        Ad.objects.create(
+            pk=self.ads[-1].pk + 100000, user=self.user, title='Далекое объявление',
+            description='Описание', category='other', condition='used',
+        )
+        queryset = Ad.objects.all()
+        with mock.patch('apps.ads.sampling.FULL_SCAN_LIMIT', 3):
+            for seed in range(5):
+                sample = random_sample(queryset, 8, random.Random(seed))
+                self.assertEqual(len({ad.pk for ad in sample}), 8)
+            # Меньше size - только когда строк меньше size
+            self.assertEqual(len(random_sample(queryset, 20, random.Random(0))), 11)
+    
+    def test_showcase_and_other_ads(self):
+        response = self.client.get(reverse('ads:ad_list'))
+        self.assertContains(response, 'Случайные объявления')
+        self.assertEqual(len(response.context['showcase_ads']), 6)
+        self.assertNotIn('showcase_ads', self.client.get(reverse('ads:ad_list'), {'page': 2}).context)
+        self.assertNotIn('showcase_ads', self.client.get(reverse('ads:ad_list'), {'category': 'other'}).context)
+        
+        ad = self.ads[1]
+        self.client.login(username='other', password='testpass123')
+        with assert_query_budget(view_name='ads:ad_detail'):
+            response = self.client.get(reverse('ads:ad_detail', args=[ad.pk]))
+        other_ads = response.context['other_ads_from_user']
+        self.assertEqual(len(other_ads), 4)
+        self.assertNotIn(ad, other_ads)
+        self.assertTrue(all(other.user_id == self.user.pk for other in other_ads))
+
+
+class DuplicateAdsTest(TestCase):
+    """Тесты поиска почти одинаковых объявлений (apps/ads/duplicates.py)"""
+    
+    TITLE = 'Ноутбук Asus VivoBook 15'
+    DESCRIPTION = (
+        'Продаю ноутбук Asus в отличном состоянии, 8 ГБ памяти, SSD 256. '
+        'Зарядка в комплекте, коробка есть. Обмен на планшет или телефон.'
+    )
+    
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', password='pass123')
+        self.other = User.objects.create_user(username='other', password='pass123')
+        self.laptop = self.create(self.owner, self.TITLE, self.DESCRIPTION)
+    
+    def create(self, user, title, description, **fields):
+        return Ad.objects.create(
+            user=user, title=title, description=description, category='electronics', condition='good', **fields
+        )
+    
+    def test_find_duplicates(self):
+        """Тест: находятся активные объявления с почти тем же текстом, в том числе чужие"""
+        from .duplicates import find_duplicates, similarity, text_words
+        from .models import AdDuplicateKey
+        edited = self.DESCRIPTION.replace('отличном', 'хорошем')
+        self.assertGreaterEqual(similarity(text_words(self.TITLE, self.DESCRIPTION), text_words(self.TITLE, edited)), 0.8)
+        copy = self.create(self.other, self.TITLE.upper(), edited + ' Срочно!')
+        self.create(self.other, 'Коляска детская Chicco', 'Коляска в хорошем состоянии, после одного ребенка.')
+        self.assertEqual(self.laptop.duplicate_keys.count(), 8)
+        
+        with self.assertNumQueries(1):
+            found = find_duplicates(self.TITLE, edited)
+        # Самые похожие первыми: у копии одно лишнее слово (0.96), у исходного - другое слово (0.91)
+        self.assertEqual([ad for ad, _ in found], [copy, self.laptop])
+        self.assertEqual([ad for ad, _ in find_duplicates(self.TITLE, edited, self.other.pk)], [copy])
+        self.assertEqual(find_duplicates(self.TITLE, edited, exclude=[self.laptop.pk, copy.pk]), [])
+        
+        # Снятое объявление не дубликат; изменение текста пересобирает ключи
+        copy.is_active = False
+        copy.save()
+        self.assertFalse(copy.duplicate_keys.exists())
+        self.laptop.title = 'Велосипед горный Stels'
+        self.laptop.description = 'Велосипед в хорошем состоянии, 21 скорость, алюминиевая рама.'
+        self.laptop.save()
+        self.assertEqual(find_duplicates(self.TITLE, edited), [])
+        
+        out = io.StringIO()
+        call_command('rebuild_duplicate_keys', stdout=out)
+        self.assertEqual(AdDuplicateKey.objects.count(), 16)
+        self.assertIn('ключей: 16', out.getvalue())
+    
+    def test_form_and_api_block_own_duplicates(self):
+        """Тест: автору не дают опубликовать то же объявление еще раз, другим - можно"""
+        data = {'title': self.TITLE, 'description': self.DESCRIPTION + ' Срочно!', 'category': 'books', 'condition': 'new'}
+        self.client.login(username='owner', password='pass123')
+        response = self.client.post(reverse('ads:ad_create'), data)
+        self.assertContains(response, 'У вас уже есть почти такое же объявление')
+        self.assertEqual(Ad.objects.count(), 1)
+        # Свое объявление без изменения текста сохраняется
+        response = self.client.post(reverse('ads:ad_edit', args=[self.laptop.pk]), {
+            'title': self.TITLE, 'description': self.DESCRIPTION, 'category': 'books', 'condition': 'new',
+        })
+        self.assertEqual(response.status_code, 302)
+        
+        api = APIClient()
+        api.force_authenticate(self.owner)
+        response = api.post('/api/ads/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('почти такое же объявление', response.json()['non_field_errors'][0])
+        # Неактивное объявление публикацией не считается
+        self.assertEqual(api.post('/api/ads/', {**data, 'is_active': False}, format='json').status_code, 201)
+        
+        # Пакет: дубликат существующего и повтор внутри пакета
+        other = {'title': 'Сборник рассказов Чехова', 'description': 'Книга в твердой обложке, издание 1985 года.',
+                 'category': 'books', 'condition': 'good'}
+        response = api.post('/api/ads/bulk_create/', [data, other, other], format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([item['status'] for item in response.json()['results']], [400, 201, 400])
+        self.assertIn('элемент 1', response.json()['results'][2]['errors']['non_field_errors'][0])
+        
+        self.client.login(username='other', password='pass123')
+        self.client.post(reverse('ads:ad_create'), data)
+        self.assertTrue(Ad.objects.filter(user=self.other, title=self.TITLE).exists())
+    
+    def test_admin_report(self):
+        """Тест отчета о дубликатах в админке"""
+        copy = self.create(self.other, self.TITLE, self.DESCRIPTION + ' Срочно!')
+        self.create(self.other, 'Коляска детская Chicco', 'Коляска в хорошем состоянии, после одного ребенка.')
+        from .duplicates import duplicate_groups
+        self.assertEqual(duplicate_groups(), [[copy, self.laptop]])
+        
+        User.objects.create_superuser(username='admin', password='pass123', email='admin@example.com')
+        self.client.login(username='admin', password='pass123')
+        self.assertContains(self.client.get(reverse('admin:ads_ad_changelist')), reverse('admin:ads_ad_duplicates'))
+        response = self.client.get(reverse('admin:ads_ad_duplicates'))
+        self.assertContains(response, 'авторов: 2')
+        self.assertContains(response, reverse('admin:ads_ad_change', args=[copy.pk]))
+        self.assertNotContains(response, 'Коляска')
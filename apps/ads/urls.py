@@ -15,6 +15,7 @@ urlpatterns = [
     # Предложения обмена
     path('proposals/', views.proposal_list_view, name='proposal_list'),
     path('proposals/create/<int:ad_id>/', views.create_proposal_view, name='proposal_create'),
+    path('proposals/resolve/', views.resolve_proposals_view, name='proposal_resolve'),
     path('proposals/<int:pk>/accept/', views.accept_proposal_view, name='proposal_accept'),
     path('proposals/<int:pk>/reject/', views.reject_proposal_view, name='proposal_reject'),
 ]
\ No newline at end of file
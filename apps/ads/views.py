@@ -1,8 +1,11 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.conf import settings
 from django.core.paginator import Paginator
-from django.db.models import Q
+from django.utils.functional import cached_property
+from django.http import Http404
+from django.db.models import Count, Max, OuterRef, Prefetch, Q, Subquery
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.urls import reverse_lazy
@@ -10,26 +13,61 @@ from django.urls import reverse_lazy
 # REST Framework imports
 from rest_framework import generics, status, filters, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from django_filters.rest_framework import DjangoFilterBackend
 
-from .models import Ad, ExchangeProposal
+from barter_platform.tasks import get_backend as get_task_backend, registry as task_registry
+
+from .models import Ad, ExchangeProposal, ProposalConflict, Tombstone
+from apps.users.models import UserProfile
 from .forms import AdForm, ExchangeProposalForm, SearchForm
-from .serializers import AdSerializer, ExchangeProposalSerializer, ProposalStatusSerializer
+from .serializers import (
+    AdReadSerializer, AdSerializer, ExchangeProposalSerializer, ProposalStatusSerializer, TradeCycleSerializer,
+)
 from .permissions import IsOwnerOrReadOnly
+from .sampling import SHOWCASE_SIZE, SHOWCASE_TTL, random_active_ads, random_sample
+from .search import search_ads, tokenize_query
+from .batch import run_batch
+from .bulk import (
+    bulk_create_ads, bulk_deactivate_ads, bulk_update_ads, parse_id, parse_resolve_request, resolve_proposals,
+)
+from .cache import cacheable_ads, detail_cache_key, get_or_refresh, list_cache_key
+from .conditional import ConditionalMixin, conditional_response, grouped_aggregate, make_etag
+from .cycles import user_cycles
+from .pagination import CURSOR_PARAM, StandardPagination, keyset_page
+from .sparse import USER_FIELD_SOURCES, SparseFieldsViewMixin, ad_sources, only_path
+from .sync import SyncViewMixin
+from .similar import cached_similar_ads, similar_ads
+from .wants import matching_ads
 
 
 # ============= API VIEWS =============
 
-class AdViewSet(viewsets.ModelViewSet):
-    """API для работы с объявлениями"""
-    queryset = Ad.objects.filter(is_active=True)
+class AdSearchFilter(filters.SearchFilter):
+    """Полнотекстовый поиск по параметру search с сортировкой по релевантности"""
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return queryset
+        # Явно заданная сортировка (?ordering=) имеет приоритет над релевантностью
+        ranked = not request.query_params.get('ordering')
+        return search_ads(queryset, ' '.join(search_terms), ranked=ranked)
+
+
+class AdViewSet(SparseFieldsViewMixin, ConditionalMixin, SyncViewMixin, viewsets.ModelViewSet):
+    """API для работы с объявлениями (чтение - с ETag/Last-Modified, apps/ads/conditional.py)"""
+    queryset = Ad.objects.filter(is_active=True).select_related('user')
     serializer_class = AdSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
     parser_classes = [MultiPartParser, FormParser, JSONParser]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = StandardPagination
+    # Поиск идет после сортировки, чтобы упорядочить результаты по релевантности
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, AdSearchFilter]
     filterset_fields = ['category', 'condition', 'user']
     search_fields = ['title', 'description']
     ordering_fields = ['created_at', 'updated_at']
@@ -41,28 +79,99 @@ class AdViewSet(viewsets.ModelViewSet):
             return [IsOwnerOrReadOnly()]
         return super().get_permissions()
     
+    def get_queryset(self):
+        """Для чтения с ?fields= - только колонки запрошенных полей"""
+        queryset = super().get_queryset()
+        fields = self.requested_fields
+        if fields is None:
+            return queryset
+        if 'user' not in fields:
+            queryset = queryset.select_related(None)
+        return queryset.only(*(only_path(source) for source in ad_sources(fields)))
+    
+    def list(self, request, *args, **kwargs):
+        """Список объявлений; ответ кэшируется по параметрам запроса (apps/ads/cache.py)"""
+        # Ссылки в ответе абсолютные, поэтому адрес сайта входит в ключ
+        category = request.query_params.get('category')
+        params = (request.build_absolute_uri(request.path), sorted(request.query_params.lists()))
+        key = list_cache_key('api', category, *params)
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.conditional(
+            request,
+            queryset,
+            lambda: Response(get_or_refresh(key, lambda: self.read_response(queryset).data)),
+            cache_key=list_cache_key('api-validators', category, *params),
+        )
+    
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_retrieve(request, lambda: super(AdViewSet, self).retrieve(request, *args, **kwargs))
+    
     def perform_create(self, serializer):
         """Автоматическое присвоение пользователя при создании"""
         serializer.save(user=self.request.user)
     
-    def perform_update(self, serializer):
-        """Обработка обновления с удалением старого изображения"""
-        instance = self.get_object()
-        # Если загружается новое изображение, удаляем старое
-        if 'image' in self.request.FILES and instance.image:
-            instance.image.delete(save=False)
-        serializer.save()
-    
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def my_ads(self, request):
         """Получить объявления текущего пользователя"""
         ads = Ad.objects.filter(user=request.user)
-        page = self.paginate_queryset(ads)
+        return self.conditional(request, ads, lambda: self.read_response(ads), private=True)
+    
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def bulk_create(self, request):
+        """Создать пакет объявлений: список объектов, результат по каждому (apps/ads/bulk.py)"""
+        result = bulk_create_ads(request.data, request.user, self.get_serializer_context())
+        return Response(result.as_dict(), status=result.status_code(status.HTTP_201_CREATED))
+    
+    @action(detail=False, methods=['patch'], permission_classes=[IsAuthenticated])
+    def bulk_update(self, request):
+        """Изменить пакет своих объявлений: [{'id': ..., поля}, ...]"""
+        result = bulk_update_ads(request.data, request.user, self.get_serializer_context())
+        return Response(result.as_dict(), status=result.status_code(status.HTTP_200_OK))
+    
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def bulk_deactivate(self, request):
+        """Деактивировать пакет своих объявлений: {'ids': [...]}"""
+        result = bulk_deactivate_ads(request.data, request.user, self.get_serializer_context())
+        return Response(result.as_dict(), status=result.status_code(status.HTTP_200_OK))
+    
+    @action(detail=False, methods=['get'])
+    def sync(self, request):
+        """Изменения ленты после курсора ?since=: новые и измененные, удаленные и деактивированные"""
+        # is_active отделяет деактивированные, updated_at - позиция курсора
+        fields = AdReadSerializer.values_fields(self.requested_fields)
+        ads = Ad.objects.values(*dict.fromkeys([*fields, 'is_active', 'updated_at']))
+        result = self.sync_changes(
+            ads, Tombstone.objects.filter(kind=Tombstone.KIND_AD), initial=ads.filter(is_active=True)
+        )
+        rows = result.pop('rows')
+        result['deleted'] = [row['id'] for row in rows if not row['is_active']] + result['deleted']
+        active = [row for row in rows if row['is_active']]
+        result['results'] = AdReadSerializer(active, many=True, context=self.get_serializer_context()).data
+        return Response(result)
+    
+    def read_response(self, queryset):
+        """Страница объявлений через AdReadSerializer (values() вместо моделей)"""
+        rows = queryset.values(*AdReadSerializer.values_fields(self.requested_fields))
+        context = self.get_serializer_context()
+        page = self.paginate_queryset(rows)
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(ads, many=True)
-        return Response(serializer.data)
+            return self.get_paginated_response(AdReadSerializer(page, many=True, context=context).data)
+        return Response(AdReadSerializer(rows, many=True, context=context).data)
+    
+    @action(detail=True, methods=['get'])
+    def matches(self, request, pk=None):
+        """Взаимные предложения: объявления, которые хотят это и предлагают то, что хочет его автор"""
+        ad = get_object_or_404(Ad.objects.filter(is_active=True), pk=pk)
+        rows = matching_ads(ad).values(*AdReadSerializer.values_fields(self.requested_fields))
+        return Response(AdReadSerializer(rows, many=True, context=self.get_serializer_context()).data)
+    
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """Похожие объявления по тексту - готовый список, без расчета в запросе"""
+        if parse_id(pk) is None:
+            raise Http404
+        rows = similar_ads(pk).values(*AdReadSerializer.values_fields(self.requested_fields))
+        return Response(AdReadSerializer(rows, many=True, context=self.get_serializer_context()).data)
     
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def deactivate(self, request, pk=None):
@@ -78,21 +187,68 @@ class AdViewSet(viewsets.ModelViewSet):
         return Response({'message': 'Объявление деактивировано'})
 
 
-class ExchangeProposalViewSet(viewsets.ModelViewSet):
-    """API для работы с предложениями обмена"""
+class ExchangeProposalViewSet(SparseFieldsViewMixin, ConditionalMixin, SyncViewMixin, viewsets.ModelViewSet):
+    """API для работы с предложениями обмена (чтение - с ETag/Last-Modified)"""
     serializer_class = ExchangeProposalSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = StandardPagination
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['status', 'sender', 'receiver']
     ordering_fields = ['created_at']
     ordering = ['-created_at']
+    private_validators = True
+    
+    @property
+    def validator_fields(self):
+        """В ответе есть объявления, поэтому их изменения тоже меняют ETag"""
+        return ('updated_at', *(f'{name}__updated_at' for name in ('ad_sender', 'ad_receiver') if self.wants(name)))
+    
+    def list(self, request, *args, **kwargs):
+        return self.conditional(
+            request,
+            self.filter_queryset(self.get_queryset()),
+            lambda: super(ExchangeProposalViewSet, self).list(request, *args, **kwargs),
+        )
+    
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_retrieve(
+            request, lambda: super(ExchangeProposalViewSet, self).retrieve(request, *args, **kwargs)
+        )
     
     def get_queryset(self):
         """Получить предложения текущего пользователя"""
         user = self.request.user
-        return ExchangeProposal.objects.filter(
-            Q(sender=user) | Q(receiver=user)
-        ).select_related('ad_sender', 'ad_receiver', 'sender', 'receiver')
+        queryset = ExchangeProposal.objects.filter(Q(sender=user) | Q(receiver=user))
+        if self.request.method not in SAFE_METHODS:
+            # Принятие и отклонение работают с полными объектами
+            return queryset.select_related('ad_sender__user', 'ad_receiver__user', 'sender', 'receiver')
+        return self.select_requested(queryset)
+    
+    def select_requested(self, queryset):
+        """JOIN и колонки только для полей ответа (?fields=, ?expand=)"""
+        expand = self.requested_expand
+        # created_at нужен keyset-пагинации
+        related, columns = [], ['created_at']
+        columns += [name for name in ('comment', 'updated_at') if self.wants(name)]
+        if self.wants('status') or self.wants('status_display'):
+            columns.append('status')
+        for name in ('ad_sender', 'ad_receiver'):
+            if not self.wants(name):
+                continue
+            if name in expand:
+                related.append(f'{name}__user')
+                columns += [only_path(source) for source in ad_sources(prefix=f'{name}__')]
+            else:
+                related.append(name)
+                columns += [f'{name}__id', f'{name}__title']
+        for name in ('sender', 'receiver'):
+            if self.wants(name):
+                related.append(name)
+                columns += [f'{name}__{field}' for field in USER_FIELD_SOURCES]
+        if related:
+            # select_related() без аргументов подключил бы все связи
+            queryset = queryset.select_related(*related)
+        return queryset.only(*columns)
     
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def accept(self, request, pk=None):
@@ -105,7 +261,10 @@ class ExchangeProposalViewSet(viewsets.ModelViewSet):
         )
         status_serializer.is_valid(raise_exception=True)
         
-        proposal.accept()
+        try:
+            proposal.accept()
+        except ProposalConflict as exc:
+            raise ValidationError({'status': [str(exc)]})
         serializer = self.get_serializer(proposal)
         return Response(serializer.data)
     
@@ -120,77 +279,267 @@ class ExchangeProposalViewSet(viewsets.ModelViewSet):
         )
         status_serializer.is_valid(raise_exception=True)
         
-        proposal.reject()
+        try:
+            proposal.reject()
+        except ProposalConflict as exc:
+            raise ValidationError({'status': [str(exc)]})
         serializer = self.get_serializer(proposal)
         return Response(serializer.data)
     
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def resolve(self, request):
+        """Принять одно и отклонить несколько полученных предложений: {"accept": id, "reject": [id, ...]}"""
+        accept, reject = parse_resolve_request(request.data)
+        try:
+            accepted, rejected, competing, errors = resolve_proposals(request.user, accept, reject)
+        except ProposalConflict as exc:
+            raise ValidationError({'status': [str(exc)]})
+        if errors:
+            raise ValidationError({'proposals': {pk: [error] for pk, error in errors.items()}})
+        return Response({
+            'accepted': accepted.pk if accepted else None,
+            'rejected': [proposal.pk for proposal in rejected],
+            'competing_rejected': competing,
+        })
+    
+    @action(detail=False, methods=['get'])
+    def sync(self, request):
+        """Изменения предложений пользователя после курсора ?since="""
+        user = request.user
+        tombstones = Tombstone.objects.filter(kind=Tombstone.KIND_PROPOSAL).filter(
+            Q(sender_id=user.pk) | Q(receiver_id=user.pk)
+        )
+        result = self.sync_changes(self.get_queryset(), tombstones)
+        result['results'] = self.get_serializer(result.pop('rows'), many=True).data
+        return Response(result)
+    
     @action(detail=False, methods=['get'])
     def sent(self, request):
         """Получить отправленные предложения"""
         proposals = self.get_queryset().filter(sender=request.user)
-        page = self.paginate_queryset(proposals)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(proposals, many=True)
-        return Response(serializer.data)
+        return self.conditional(request, proposals, lambda: self.paginated_response(proposals))
     
     @action(detail=False, methods=['get'])
     def received(self, request):
         """Получить полученные предложения"""
         proposals = self.get_queryset().filter(receiver=request.user)
-        page = self.paginate_queryset(proposals)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(proposals, many=True)
-        return Response(serializer.data)
+        return self.conditional(request, proposals, lambda: self.paginated_response(proposals))
+
+
+class TradeCycleViewSet(viewsets.ReadOnlyModelViewSet):
+    """Цепочные обмены с участием текущего пользователя (apps/ads/cycles.py)"""
+    serializer_class = TradeCycleSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = StandardPagination
+    
+    def get_queryset(self):
+        steps = ExchangeProposal.objects.select_related('ad_sender', 'ad_receiver', 'sender').only(
+            'id', 'ad_sender__id', 'ad_sender__title', 'ad_receiver__id', 'ad_receiver__title', 'sender__username',
+        )
+        return user_cycles(self.request.user).prefetch_related(Prefetch('proposals', queryset=steps))
+
+
+class ApiBatchView(APIView):
+    """Составной запрос: несколько GET-запросов к API за один (apps/ads/batch.py)"""
+    # Части проверяют права сами: гость получит то же, что и отдельными запросами
+    permission_classes = [AllowAny]
+    
+    def post(self, request):
+        return Response({'responses': run_batch(request)})
+
+
+class TaskQueueView(APIView):
+    """Состояние очереди фоновых задач этого процесса (пул потоков виден только изнутри сервера)"""
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        return Response({'registered': sorted(task_registry), **get_task_backend().inspect()})
 
 
 # ============= WEB VIEWS =============
 
 class AdListView(ListView):
-    """Список всех активных объявлений"""
+    """
+    Список всех активных объявлений.
+    
+    Параметр ?cursor= включает режим "следующая страница": keyset-пагинация
+    без подсчета общего количества объявлений (кроме поиска по тексту).
+    
+    Страницы кэшируются (apps/ads/cache.py) по нормализованным параметрам
+    поиска и номеру страницы; при попадании в кэш запросов к базе нет.
+    Устаревшую страницу пересчитывает один запрос, остальные получают прежнюю.
+    """
     model = Ad
     template_name = 'ads/ad_list.html'
     context_object_name = 'ads'
     paginate_by = 12
+    next_cursor = None
+    
+    @property
+    def cursor_mode(self):
+        # Результаты поиска отсортированы по релевантности, а курсор - позиция по
+        # created_at: они листаются по номерам страниц
+        return CURSOR_PARAM in self.request.GET and not self.search_params.get('query')
+    
+    @cached_property
+    def search_params(self):
+        """Нормализованные параметры поиска: {'query', 'category', 'condition'} без пустых"""
+        form = SearchForm(self.request.GET)
+        if not form.is_valid():
+            return {}
+        params = {
+            'query': ' '.join(tokenize_query(form.cleaned_data.get('query'))),
+            'category': form.cleaned_data.get('category'),
+            'condition': form.cleaned_data.get('condition'),
+        }
+        return {name: value for name, value in params.items() if value}
+    
+    def paginate_queryset(self, queryset, page_size):
+        if self.cursor_mode:
+            page = f'{CURSOR_PARAM}:{self.request.GET.get(CURSOR_PARAM)}'
+        else:
+            page = str(self.request.GET.get(self.page_kwarg) or 1)
+        key = list_cache_key(
+            'page', self.search_params.get('category'), sorted(self.search_params.items()), page, page_size
+        )
+        result = get_or_refresh(key, lambda: self.build_page(queryset, page_size))
+        
+        self.next_cursor = result['next_cursor']
+        if self.cursor_mode:
+            return None, None, result['ads'], False
+        paginator = self.get_paginator([], page_size, allow_empty_first_page=self.get_allow_empty())
+        paginator.count = result['count']
+        page_obj = paginator._get_page(result['ads'], result['number'], paginator)
+        return paginator, page_obj, result['ads'], page_obj.has_other_pages()
+    
+    def build_page(self, queryset, page_size):
+        """Страница из базы в виде, пригодном для кэша"""
+        if self.cursor_mode:
+            try:
+                ads, next_cursor = keyset_page(queryset, self.request.GET.get(CURSOR_PARAM), page_size)
+            except ValueError:
+                raise Http404('Некорректный курсор')
+            return {'ads': ads, 'next_cursor': next_cursor}
+        paginator, page_obj, ads, _ = super().paginate_queryset(queryset, page_size)
+        return {'ads': list(ads), 'count': paginator.count, 'number': page_obj.number, 'next_cursor': None}
     
     def get_queryset(self):
-        queryset = Ad.objects.filter(is_active=True).select_related('user')
+        queryset = cacheable_ads(Ad.objects.filter(is_active=True))
         
         # Поиск и фильтрация
-        form = SearchForm(self.request.GET)
-        if form.is_valid():
-            query = form.cleaned_data.get('query')
-            category = form.cleaned_data.get('category')
-            condition = form.cleaned_data.get('condition')
-            
-            if query:
-                queryset = queryset.filter(
-                    Q(title__icontains=query) | Q(description__icontains=query)
-                )
-            if category:
-                queryset = queryset.filter(category=category)
-            if condition:
-                queryset = queryset.filter(condition=condition)
+        params = self.search_params
+        if params.get('query'):
+            queryset = search_ads(queryset, params['query'])
+        if params.get('category'):
+            queryset = queryset.filter(category=params['category'])
+        if params.get('condition'):
+            queryset = queryset.filter(condition=params['condition'])
         
         return queryset
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['search_form'] = SearchForm(self.request.GET)
+        context['cursor_mode'] = self.cursor_mode
+        if not self.search_params and not self.cursor_mode and context['page_obj'].number == 1:
+            # Витрина меняется раз в SHOWCASE_TTL секунд, а не на каждый запрос
+            context['showcase_ads'] = get_or_refresh(
+                list_cache_key('showcase', None, SHOWCASE_SIZE), random_active_ads, soft_ttl=SHOWCASE_TTL
+            )
+        if self.next_cursor:
+            query = self.request.GET.copy()
+            query[CURSOR_PARAM] = self.next_cursor
+            query.pop('page', None)
+            context['next_page_query'] = query.urlencode()
         return context
 
 
 class AdDetailView(DetailView):
-    """Детальная страница объявления"""
+    """Детальная страница объявления (само объявление берется из кэша)"""
     model = Ad
+    queryset = cacheable_ads(Ad.objects.all())
     template_name = 'ads/ad_detail.html'
     context_object_name = 'ad'
+    
+    def get_object(self, queryset=None):
+        return get_or_refresh(
+            detail_cache_key(self.kwargs[self.pk_url_kwarg]),
+            lambda: super(AdDetailView, self).get_object(queryset),
+        )
+
+    def get(self, request, *args, **kwargs):
+        """Страница с ETag/Last-Modified: при совпадении валидаторов - 304 без рендеринга"""
+        if messages.get_messages(request):
+            # Сообщения показываются один раз, их нельзя потерять в 304
+            return super().get(request, *args, **kwargs)
+        validators = self.get_validators()
+        if validators is None:
+            return super().get(request, *args, **kwargs)
+        last_modified = max(value for value in validators.values() if hasattr(value, 'timestamp'))
+        etag = make_etag(
+            sorted(validators.items()),
+            request.user.pk,
+            # Форма предложения содержит CSRF-токен, он зависит от cookie
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME),
+        )
+        return conditional_response(
+            request, etag, last_modified,
+            lambda: super(AdDetailView, self).get(request, *args, **kwargs),
+            private=request.user.is_authenticated,
+        )
+
+    def get_validators(self):
+        """
+        Все, от чего зависит страница, одним запросом: само объявление, а для
+        вошедшего пользователя - другие объявления автора, свои активные
+        объявления (форма обмена) и счетчик входящих в меню. Автору объявления -
+        еще взаимные предложения, вторым запросом. Похожие объявления берутся
+        из кэша. None - объявления нет.
+        """
+        user = self.request.user
+        if not user.is_authenticated:
+            # Гостю страница зависит только от объявления и похожих, а они уже в кэше
+            return self.add_similar_validators({'updated_at': self.get_object().updated_at})
+        ads = Ad.objects.filter(pk=self.kwargs[self.pk_url_kwarg])
+        others = Ad.objects.filter(user_id=OuterRef('user_id'), is_active=True).exclude(pk=OuterRef('pk'))
+        own = Ad.objects.filter(user=user, is_active=True).exclude(pk=OuterRef('pk'))
+        ads = ads.annotate(
+            others_last=grouped_aggregate(others, 'user_id', Max('updated_at')),
+            others_count=grouped_aggregate(others, 'user_id', Count('pk')),
+            own_last=grouped_aggregate(own, 'user_id', Max('updated_at')),
+            own_count=grouped_aggregate(own, 'user_id', Count('pk')),
+            pending=Subquery(UserProfile.objects.filter(user=user).values('pending_received_count')),
+        )
+        validators = ads.values(
+            'user_id', 'updated_at', 'others_last', 'others_count', 'own_last', 'own_count', 'pending',
+        ).first()
+        if validators is not None and validators.pop('user_id') == user.pk:
+            # Автору показываются взаимные предложения: новые объявления меняют страницу
+            validators['matches'] = [ad.pk for ad in self.matches]
+            validators['matches_last'] = max((ad.updated_at for ad in self.matches), default=None)
+        return validators and self.add_similar_validators(validators)
+    
+    def add_similar_validators(self, validators):
+        validators['similar'] = [ad.pk for ad in self.similar]
+        validators['similar_last'] = max((ad.updated_at for ad in self.similar), default=None)
+        return validators
+    
+    @cached_property
+    def similar(self):
+        """Похожие объявления из готового списка (apps/ads/similar.py)"""
+        return cached_similar_ads(self.kwargs[self.pk_url_kwarg])
+    
+    @cached_property
+    def matches(self):
+        """Взаимные предложения для своего объявления (apps/ads/wants.py)"""
+        ad = self.get_object()
+        if ad.user_id != self.request.user.pk:
+            return []
+        return list(matching_ads(ad).select_related('user'))
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        context['similar_ads'] = self.similar
         
         if self.request.user.is_authenticated:
             context['can_edit'] = self.object.can_edit(self.request.user)
@@ -202,10 +551,11 @@ class AdDetailView(DetailView):
             ).exclude(pk=self.object.pk)
             
             # Другие объявления этого же пользователя
-            context['other_ads_from_user'] = Ad.objects.filter(
-                user=self.object.user,
-                is_active=True
-            ).exclude(pk=self.object.pk).order_by('?')[:5]
+            context['other_ads_from_user'] = random_sample(
+                Ad.objects.filter(user=self.object.user, is_active=True).exclude(pk=self.object.pk), 5
+            )
+            
+            context['matches'] = self.matches
 
         return context
 
@@ -216,6 +566,9 @@ class AdCreateView(LoginRequiredMixin, CreateView):
     form_class = AdForm
     template_name = 'ads/ad_form.html'
     
+    def get_form_kwargs(self):
+        return {**super().get_form_kwargs(), 'user': self.request.user}
+    
     def form_valid(self, form):
         form.instance.user = self.request.user
         messages.success(self.request, 'Объявление успешно создано!')
@@ -231,6 +584,9 @@ class AdUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     def test_func(self):
         return self.get_object().can_edit(self.request.user)
     
+    def get_form_kwargs(self):
+        return {**super().get_form_kwargs(), 'user': self.request.user}
+    
     def form_valid(self, form):
         messages.success(self.request, 'Объявление успешно обновлено!')
         return super().form_valid(form)
@@ -334,8 +690,49 @@ def accept_proposal_view(request, pk):
         messages.error(request, 'Вы не можете принять это предложение!')
         return redirect('ads:proposal_list')
     
-    proposal.accept()
-    messages.success(request, 'Предложение обмена принято! Объявления деактивированы.')
+    try:
+        rejected = proposal.accept()
+    except ProposalConflict as exc:
+        messages.error(request, str(exc))
+        return redirect('ads:proposal_list')
+    
+    message = 'Предложение обмена принято! Объявления деактивированы.'
+    if rejected:
+        message += f' Другие предложения с этими объявлениями отклонены: {rejected}.'
+    messages.success(request, message)
+    return redirect('ads:proposal_list')
+
+
+@login_required
+def resolve_proposals_view(request):
+    """Отклонить отмеченные полученные предложения (и принять одно, если нажато «Принять»)"""
+    if request.method != 'POST':
+        return redirect('ads:proposal_list')
+    accept = parse_id(request.POST.get('accept')) if request.POST.get('accept') else None
+    reject = [pk for pk in map(parse_id, request.POST.getlist('reject')) if pk is not None and pk != accept]
+    if accept is None and not reject:
+        messages.error(request, 'Отметьте предложения, которые нужно отклонить.')
+        return redirect('ads:proposal_list')
+    
+    try:
+        accepted, rejected, competing, errors = resolve_proposals(request.user, accept, reject)
+    except ProposalConflict as exc:
+        messages.error(request, str(exc))
+        return redirect('ads:proposal_list')
+    if errors:
+        messages.error(request, 'Предложения не обработаны: ' + '; '.join(
+            f'#{pk}: {error}' for pk, error in errors.items()
+        ))
+        return redirect('ads:proposal_list')
+    
+    parts = []
+    if accepted is not None:
+        parts.append('Предложение обмена принято! Объявления деактивированы.')
+    if rejected:
+        parts.append(f'Отклонено предложений: {len(rejected)}.')
+    if competing:
+        parts.append(f'Другие предложения с этими объявлениями отклонены: {competing}.')
+    messages.success(request, ' '.join(parts))
     return redirect('ads:proposal_list')
 
 
@@ -348,6 +745,11 @@ def reject_proposal_view(request, pk):
         messages.error(request, 'Вы не можете отклонить это предложение!')
         return redirect('ads:proposal_list')
     
-    proposal.reject()
+    try:
+        proposal.reject()
+    except ProposalConflict as exc:
+        messages.error(request, str(exc))
+        return redirect('ads:proposal_list')
+    
     messages.success(request, 'Предложение обмена отклонено.')
     return redirect('ads:proposal_list')
\ No newline at end of file
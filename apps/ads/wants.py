@@ -0,0 +1,109 @@
+"""
+Взаимные предложения: объявления, владельцы которых хотят то, что предлагает
+это объявление, и предлагают то, что хочет его владелец.
+
+Объявление предлагает свою категорию и слова заголовка, а хочет категории из
+wanted_categories и слова из wanted_keywords. Слова сводятся к термам по первым
+TERM_LENGTH буквам ('ноутбуки' и 'ноутбук' -> 'w:ноутбу'), категории - к
+'c:<код>'. Для каждой пары (что предлагает, что хочет) хранится ключ AdTradeKey;
+объявление Y подходит X, если у Y есть ключ (то, что хочет X; то, что предлагает
+X). Поиск - по LIMIT новейших ключей на каждую такую пару обратным проходом
+индекса (offer, want, ad), поэтому время зависит от числа пар, а не от числа
+объявлений и ключей.
+
+Ключи обновляются при сохранении объявления (сигнал update_trade_keys), при
+обмене и в массовых операциях API; снятые с публикации объявления ключей не
+имеют. Объявления, снятые другим update(), все равно отсекаются по is_active;
+команда rebuild_trade_keys пересобирает индекс целиком.
+"""
+import re
+
+from django.db.models import Q
+
+from .models import Ad, AdTradeKey
+
+# Сколько первых букв слова образуют терм: грубая замена стемминга
+TERM_LENGTH = 6
+# Сколько слов заголовка и пожеланий попадает в ключи
+MAX_WORDS = 5
+# Размер подборки взаимных предложений
+MATCH_LIMIT = 12
+BATCH_SIZE = 5000
+
+STOP_WORDS = {'для', 'или', 'под', 'над', 'без', 'при', 'другой', 'другую', 'and', 'the', 'for'}
+
+
+def word_terms(text):
+    """Термы слов текста: не короче 3 букв, без чисел и служебных слов"""
+    words = re.findall(r'\w+', (text or '').lower().replace('ё', 'е'))
+    terms = dict.fromkeys(
+        f'w:{word[:TERM_LENGTH]}' for word in words
+        if len(word) >= 3 and not word.isdigit() and word not in STOP_WORDS
+    )
+    return list(terms)[:MAX_WORDS]
+
+
+def offer_terms(title, category):
+    return [f'c:{category}', *word_terms(title)]
+
+
+def want_terms(wanted_categories, wanted_keywords):
+    return [*(f'c:{code}' for code in wanted_categories or ()), *word_terms(wanted_keywords)]
+
+
+def build_keys(ad_id, owner_id, title, category, wanted_categories, wanted_keywords):
+    wants = want_terms(wanted_categories, wanted_keywords)
+    return [
+        AdTradeKey(ad_id=ad_id, owner_id=owner_id, offer=offer, want=want)
+        for offer in offer_terms(title, category)
+        for want in wants
+    ]
+
+
+def refresh_trade_keys(ads, replace=True):
+    """Пересобрать ключи объявлений: одно удаление и одна вставка"""
+    if replace:
+        AdTradeKey.objects.filter(ad__in=[ad.pk for ad in ads]).delete()
+    keys = [
+        key
+        for ad in ads if ad.is_active
+        for key in build_keys(ad.pk, ad.user_id, ad.title, ad.category, ad.wanted_categories, ad.wanted_keywords)
+    ]
+    AdTradeKey.objects.bulk_create(keys, batch_size=BATCH_SIZE)
+
+
+def rebuild_trade_keys(batch_size=BATCH_SIZE, log=None):
+    """Пересобрать весь индекс по активным объявлениям с пожеланиями; возвращает число ключей"""
+    log = log or (lambda message: None)
+    AdTradeKey.objects.all().delete()
+    rows = (
+        Ad.objects.filter(is_active=True)
+        .exclude(wanted_categories=[], wanted_keywords='')
+        .values_list('pk', 'user_id', 'title', 'category', 'wanted_categories', 'wanted_keywords')
+        .iterator(chunk_size=batch_size)
+    )
+    batch, total = [], 0
+    for row in rows:
+        batch += build_keys(*row)
+        if len(batch) >= batch_size:
+            AdTradeKey.objects.bulk_create(batch, batch_size=batch_size)
+            total += len(batch)
+            batch = []
+            log(f'ключей: {total}')
+    AdTradeKey.objects.bulk_create(batch, batch_size=batch_size)
+    return total + len(batch)
+
+
+def matching_ads(ad, limit=MATCH_LIMIT):
+    """Активные объявления других пользователей, взаимно подходящие объявлению ad (новые первыми)"""
+    wants = want_terms(ad.wanted_categories, ad.wanted_keywords)
+    if not ad.is_active or not wants:
+        return Ad.objects.none()
+    # По каждой паре (что хочет ad, что предлагает ad) - limit новейших ключей:
+    # обратный проход индекса без сортировки, сколько бы ключей ни было у пары
+    keys = AdTradeKey.objects.exclude(owner_id=ad.user_id).order_by('-ad_id').values('ad_id')
+    condition = Q()
+    for want in wants:
+        for offer in offer_terms(ad.title, ad.category):
+            condition |= Q(pk__in=keys.filter(offer=want, want=offer)[:limit])
+    return Ad.objects.filter(condition, is_active=True).order_by('-pk')[:limit]
@@ -11,7 +11,10 @@ class UserProfileInline(admin.StackedInline):
     verbose_name_plural = 'Профиль'
     
     # Поля только для чтения
-    readonly_fields = ['successful_exchanges', 'rating', 'created_at', 'updated_at']
+    readonly_fields = [
+        'successful_exchanges', 'active_ads_count', 'pending_received_count', 'pending_sent_count',
+        'rating', 'created_at', 'updated_at',
+    ]
 
 
 class UserAdmin(BaseUserAdmin):
@@ -31,7 +34,10 @@ class UserProfileAdmin(admin.ModelAdmin):
     """Админ-панель для профилей пользователей"""
     list_display = ['user', 'phone', 'city', 'successful_exchanges', 'rating', 'created_at']
     search_fields = ['user__username', 'user__email', 'phone', 'city']
-    readonly_fields = ['successful_exchanges', 'rating', 'created_at', 'updated_at']
+    readonly_fields = [
+        'successful_exchanges', 'active_ads_count', 'pending_received_count', 'pending_sent_count',
+        'rating', 'created_at', 'updated_at',
+    ]
     
     # Группировка полей
     fieldsets = (
@@ -45,7 +51,10 @@ class UserProfileAdmin(admin.ModelAdmin):
             'fields': ('bio',)
         }),
         ('Статистика', {
-            'fields': ('successful_exchanges', 'rating'),
+            'fields': (
+                'successful_exchanges', 'active_ads_count',
+                'pending_received_count', 'pending_sent_count', 'rating',
+            ),
             'classes': ('collapse',)
         }),
         ('Временные метки', {
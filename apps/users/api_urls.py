@@ -0,0 +1,9 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'api_users'
+
+urlpatterns = [
+    path('me/', views.ProfileAPIView.as_view(), name='profile'),
+]
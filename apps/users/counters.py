@@ -0,0 +1,113 @@
+"""
+Денормализованные счетчики профиля пользователя.
+
+Счетчики обновляются инкрементально при изменении объявлений и предложений
+обмена (сигналы и методы моделей в apps.ads.models) через F()-выражения, без
+чтения текущего значения. Расхождения исправляет команда recount.
+"""
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import UserProfile
+
+COUNTER_FIELDS = UserProfile.COUNTER_FIELDS
+
+
+def proposal_counters(status, sender_id, receiver_id):
+    """Счетчики, которые учитывают предложение в данном статусе: [(user_id, поле)]"""
+    if status == 'pending':
+        return [(sender_id, 'pending_sent_count'), (receiver_id, 'pending_received_count')]
+    if status == 'accepted':
+        return [(sender_id, 'successful_exchanges'), (receiver_id, 'successful_exchanges')]
+    return []
+
+
+class CounterChanges:
+    """Накопленные изменения счетчиков, применяемые через F()-выражения"""
+
+    def __init__(self):
+        self.deltas = defaultdict(Counter)
+
+    def add(self, user_id, field, delta=1):
+        self.deltas[user_id][field] += delta
+
+    def add_proposal(self, status, sender_id, receiver_id, delta=1):
+        for user_id, field in proposal_counters(status, sender_id, receiver_id):
+            self.add(user_id, field, delta)
+
+    def change_proposal_status(self, old_status, new_status, sender_id, receiver_id):
+        if old_status != new_status:
+            self.add_proposal(old_status, sender_id, receiver_id, -1)
+            self.add_proposal(new_status, sender_id, receiver_id)
+
+    def apply(self):
+        # Пользователи с одинаковыми изменениями обновляются одним UPDATE
+        groups = defaultdict(list)
+        for user_id, fields in self.deltas.items():
+            key = tuple(sorted((field, delta) for field, delta in fields.items() if delta))
+            if key:
+                groups[key].append(user_id)
+        for key, user_ids in groups.items():
+            # Greatest не дает счетчику уйти в минус при рассинхронизации
+            changes = {field: Greatest(F(field) + delta, Value(0)) for field, delta in key}
+            UserProfile.objects.filter(user_id__in=user_ids).update(**changes)
+        self.deltas.clear()
+
+
+def adjust_counters(user_id, **deltas):
+    """Изменить счетчики одного пользователя: adjust_counters(user_id, active_ads_count=1)"""
+    changes = CounterChanges()
+    for field, delta in deltas.items():
+        changes.add(user_id, field, delta)
+    changes.apply()
+
+
+def count_subquery(queryset, field):
+    """Подзапрос COUNT(*) по пользователю из поля field"""
+    counts = queryset.filter(**{field: OuterRef('user')}).order_by().values(field).annotate(
+        total=Count('pk')
+    ).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def expected_counters(profiles):
+    """Аннотировать профили значениями счетчиков, посчитанными по таблицам"""
+    from apps.ads.models import Ad, ExchangeProposal
+
+    accepted = ExchangeProposal.objects.filter(status='accepted')
+    pending = ExchangeProposal.objects.filter(status='pending')
+    return profiles.annotate(
+        expected_active_ads_count=count_subquery(Ad.objects.filter(is_active=True), 'user'),
+        expected_pending_received_count=count_subquery(pending, 'receiver'),
+        expected_pending_sent_count=count_subquery(pending, 'sender'),
+        # Пользователь не может быть отправителем и получателем одного предложения
+        expected_successful_exchanges=(
+            count_subquery(accepted, 'sender') + count_subquery(accepted, 'receiver')
+        ),
+    )
+
+
+def recount(user_ids=None, batch_size=500):
+    """
+    Пересчитать счетчики по таблицам объявлений и предложений.
+
+    Возвращает количество профилей, в которых счетчики разошлись с данными.
+    """
+    profiles = UserProfile.objects.only('id', *COUNTER_FIELDS)
+    if user_ids is not None:
+        profiles = profiles.filter(user_id__in=user_ids)
+
+    fixed = []
+    for profile in expected_counters(profiles).iterator(chunk_size=batch_size):
+        changed = False
+        for field in COUNTER_FIELDS:
+            expected = getattr(profile, f'expected_{field}')
+            if getattr(profile, field) != expected:
+                setattr(profile, field, expected)
+                changed = True
+        if changed:
+            fixed.append(profile)
+    UserProfile.objects.bulk_update(fixed, COUNTER_FIELDS, batch_size=batch_size)
+    return len(fixed)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from apps.users.counters import recount
+
+
+class Command(BaseCommand):
+    help = 'Пересчет счетчиков профилей пользователей (объявления, предложения, обмены)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help='ID пользователя (можно несколько раз)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Размер пачки профилей')
+
+    def handle(self, *args, **options):
+        fixed = recount(user_ids=options['user_ids'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Счетчики пересчитаны, исправлено профилей: {fixed}'))
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:44
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(queryset, field):
+    counts = queryset.filter(**{field: OuterRef('user')}).order_by().values(field).annotate(
+        total=Count('pk')
+    ).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def fill_counters(apps, schema_editor):
+    """Заполнить счетчики существующих профилей"""
+    UserProfile = apps.get_model('users', 'UserProfile')
+    Ad = apps.get_model('ads', 'Ad')
+    ExchangeProposal = apps.get_model('ads', 'ExchangeProposal')
+    pending = ExchangeProposal.objects.filter(status='pending')
+    accepted = ExchangeProposal.objects.filter(status='accepted')
+    UserProfile.objects.update(
+        active_ads_count=count_subquery(Ad.objects.filter(is_active=True), 'user'),
+        pending_received_count=count_subquery(pending, 'receiver'),
+        pending_sent_count=count_subquery(pending, 'sender'),
+        successful_exchanges=count_subquery(accepted, 'sender') + count_subquery(accepted, 'receiver'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('ads', '0005_ad_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='active_ads_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Активных объявлений'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='pending_received_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Ожидающих входящих предложений'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='pending_sent_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Ожидающих исходящих предложений'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -11,19 +11,34 @@ class UserProfile(models.Model):
     city = models.CharField(max_length=100, blank=True, verbose_name='Город')
     bio = models.TextField(blank=True, verbose_name='О себе')
     
-    # Статистика пользователя
+    # Статистика пользователя (счетчики обновляет apps.users.counters)
     successful_exchanges = models.PositiveIntegerField(default=0, verbose_name='Успешных обменов')
+    active_ads_count = models.PositiveIntegerField(default=0, verbose_name='Активных объявлений')
+    pending_received_count = models.PositiveIntegerField(default=0, verbose_name='Ожидающих входящих предложений')
+    pending_sent_count = models.PositiveIntegerField(default=0, verbose_name='Ожидающих исходящих предложений')
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=0, verbose_name='Рейтинг')
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Счетчики меняются только F()-выражениями (apps.users.counters)
+    COUNTER_FIELDS = ('active_ads_count', 'pending_received_count', 'pending_sent_count', 'successful_exchanges')
+    
     class Meta:
         verbose_name = 'Профиль пользователя'
         verbose_name_plural = 'Профили пользователей'
     
     def __str__(self):
         return f'Профиль {self.user.username}'
+    
+    def save(self, *args, **kwargs):
+        """Сохранение без счетчиков: загруженные значения могли устареть"""
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
 
 
 # Автоматическое создание профиля при создании пользователя
@@ -34,6 +49,7 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    if hasattr(instance, 'profile'):
+def save_user_profile(sender, instance, update_fields=None, **kwargs):
+    # Частичное сохранение пользователя (например, last_login при входе) профиль не меняет
+    if update_fields is None and hasattr(instance, 'profile'):
         instance.profile.save()
\ No newline at end of file
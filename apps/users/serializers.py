@@ -0,0 +1,21 @@
+from rest_framework import serializers
+
+from .models import UserProfile
+
+
+class UserProfileSerializer(serializers.ModelSerializer):
+    """Сериализатор профиля текущего пользователя со счетчиками"""
+    username = serializers.CharField(source='user.username', read_only=True)
+    email = serializers.EmailField(source='user.email', read_only=True)
+    
+    class Meta:
+        model = UserProfile
+        fields = [
+            'username', 'email', 'phone', 'city', 'bio',
+            'active_ads_count', 'pending_received_count', 'pending_sent_count',
+            'successful_exchanges', 'rating',
+        ]
+        read_only_fields = [
+            'active_ads_count', 'pending_received_count', 'pending_sent_count',
+            'successful_exchanges', 'rating',
+        ]
@@ -2,8 +2,15 @@ from django.test import TestCase, Client
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+import io
 
 from .models import UserProfile
+from .counters import COUNTER_FIELDS, recount
+from barter_platform.querybudget import assert_query_budget
 from .forms import CustomUserCreationForm, CustomAuthenticationForm, UserProfileForm
 
 
@@ -541,4 +548,178 @@ class UserIntegrationTest(TestCase):
         self.assertFalse(Ad.objects.filter(id=ad_id).exists())
         
         # Проверяем, что профиль тоже удалился
-        self.assertFalse(UserProfile.objects.filter(user_id=self.user.id).exists())
\ No newline at end of file
+        self.assertFalse(UserProfile.objects.filter(user_id=self.user.id).exists())
+
+
+class UserCountersTest(TestCase):
+    """Тесты денормализованных счетчиков профиля"""
+    
+    def setUp(self):
+        from apps.ads.models import Ad
+        
+        self.user1 = User.objects.create_user(username='trader1', password='pass123')
+        self.user2 = User.objects.create_user(username='trader2', password='pass123')
+        self.user3 = User.objects.create_user(username='trader3', password='pass123')
+        self.ad1 = self.create_ad(self.user1, 'Фотоаппарат')
+        self.ad2 = self.create_ad(self.user2, 'Самокат')
+        self.ad3 = self.create_ad(self.user3, 'Настольная игра')
+        self.Ad = Ad
+    
+    def create_ad(self, user, title, **kwargs):
+        from apps.ads.models import Ad
+        return Ad.objects.create(
+            user=user, title=title, description=f'{title} для обмена',
+            category='other', condition='good', **kwargs
+        )
+    
+    def create_proposal(self, ad_sender, ad_receiver, **kwargs):
+        from apps.ads.models import ExchangeProposal
+        return ExchangeProposal.objects.create(
+            ad_sender=ad_sender, ad_receiver=ad_receiver,
+            sender=ad_sender.user, receiver=ad_receiver.user, comment='Предлагаю обмен', **kwargs
+        )
+    
+    def counters(self, user):
+        profile = UserProfile.objects.get(user=user)
+        return {field: getattr(profile, field) for field in COUNTER_FIELDS}
+    
+    def test_active_ads_counter(self):
+        """Тест счетчика активных объявлений"""
+        self.create_ad(self.user1, 'Неактивное объявление', is_active=False)
+        self.assertEqual(self.counters(self.user1)['active_ads_count'], 1)
+        
+        self.ad1.is_active = False
+        self.ad1.save()
+        self.assertEqual(self.counters(self.user1)['active_ads_count'], 0)
+        
+        ad = self.Ad.objects.get(pk=self.ad1.pk)
+        ad.is_active = True
+        ad.save()
+        ad.save()
+        self.assertEqual(self.counters(self.user1)['active_ads_count'], 1)
+        
+        ad.delete()
+        self.assertEqual(self.counters(self.user1)['active_ads_count'], 0)
+    
+    def test_proposal_counters_through_lifecycle(self):
+        """Тест счетчиков предложений: создание, принятие, конкурирующие, отклонение"""
+        proposal = self.create_proposal(self.ad1, self.ad2)
+        competing = self.create_proposal(self.ad3, self.ad2)
+        self.assertEqual(self.counters(self.user1)['pending_sent_count'], 1)
+        self.assertEqual(self.counters(self.user2)['pending_received_count'], 2)
+        
+        proposal.accept()
+        self.assertEqual(self.counters(self.user1), {
+            'active_ads_count': 0, 'pending_received_count': 0,
+            'pending_sent_count': 0, 'successful_exchanges': 1,
+        })
+        self.assertEqual(self.counters(self.user2), {
+            'active_ads_count': 0, 'pending_received_count': 0,
+            'pending_sent_count': 0, 'successful_exchanges': 1,
+        })
+        self.assertEqual(self.counters(self.user3)['pending_sent_count'], 0)
+        
+        ad4 = self.create_ad(self.user1, 'Велосипед')
+        rejected = self.create_proposal(self.ad3, ad4)
+        rejected.reject()
+        self.assertEqual(self.counters(self.user1)['pending_received_count'], 0)
+        self.assertEqual(self.counters(self.user3)['pending_sent_count'], 0)
+    
+    def test_deleting_ad_releases_proposal_counters(self):
+        """Тест счетчиков при каскадном удалении предложений"""
+        self.create_proposal(self.ad1, self.ad2)
+        self.ad2.delete()
+        self.assertEqual(self.counters(self.user1)['pending_sent_count'], 0)
+        self.assertEqual(self.counters(self.user2)['pending_received_count'], 0)
+    
+    def test_recount_fixes_drift(self):
+        """Тест пересчета рассинхронизированных счетчиков"""
+        self.create_proposal(self.ad1, self.ad2, status='accepted')
+        self.create_proposal(self.ad3, self.ad2)
+        expected = {user.pk: self.counters(user) for user in (self.user1, self.user2, self.user3)}
+        self.assertEqual(recount(), 0)
+        
+        UserProfile.objects.update(active_ads_count=7, pending_received_count=0, successful_exchanges=0)
+        out = io.StringIO()
+        call_command('recount', stdout=out)
+        self.assertIn('исправлено профилей: 3', out.getvalue())
+        for user in (self.user1, self.user2, self.user3):
+            self.assertEqual(self.counters(user), expected[user.pk])
+    
+    def test_profile_and_api_read_counters(self):
+        """Тест, что профиль и API не считают объявления и предложения запросами COUNT"""
+        self.create_proposal(self.ad2, self.ad1)
+        client = Client()
+        client.login(username='trader1', password='pass123')
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse('users:profile'))
+        self.assertEqual(response.context['active_ads_count'], 1)
+        self.assertContains(response, 'title="Ожидают вашего решения">1</span>')
+        self.assertFalse([q for q in queries if '"ads_' in q['sql']])
+        
+        api = APIClient()
+        api.force_authenticate(user=self.user1)
+        response = api.get('/api/users/me/')
+        self.assertEqual(response.data['active_ads_count'], 1)
+        self.assertEqual(response.data['pending_received_count'], 1)
+        self.assertEqual(response.data['pending_sent_count'], 0)
+    
+    def test_stale_saves_keep_counters(self):
+        """Тест, что сохранение загруженных раньше профиля и пользователя не перезаписывает счетчики"""
+        user = User.objects.get(pk=self.user1.pk)
+        profile = user.profile
+        self.create_ad(self.user1, 'Еще одно объявление')
+        
+        profile.city = 'Казань'
+        profile.save()
+        user.first_name = 'Иван'
+        user.save()
+        self.assertEqual(self.counters(self.user1)['active_ads_count'], 2)
+        self.assertEqual(UserProfile.objects.get(user=self.user1).city, 'Казань')
+        
+        # Частичное сохранение пользователя (last_login при входе) профиль не трогает
+        with CaptureQueriesContext(connection) as queries:
+            user.save(update_fields=['last_login'])
+        self.assertEqual(len(queries), 1)
+
+
+class UserRoutesQueryBudgetTest(TestCase):
+    """Бюджеты запросов маршрутов пользователей (apps/users/urls.py, apps/users/api_urls.py)"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='budgetuser', email='budget@example.com', password='testpass123')
+    
+    def test_user_routes_within_budget(self):
+        """Тест регистрации, входа, профиля и выхода в пределах бюджета"""
+        with assert_query_budget(view_name='users:register'):
+            self.client.get(reverse('users:register'))
+        with assert_query_budget(view_name='users:register', method='POST'):
+            response = self.client.post(reverse('users:register'), {
+                'username': 'newbudgetuser', 'email': 'newbudget@example.com',
+                'password1': 'ComplexPass123!', 'password2': 'ComplexPass123!',
+            })
+        self.assertEqual(response.status_code, 302)
+        with assert_query_budget(view_name='users:logout'):
+            self.client.get(reverse('users:logout'))
+        
+        with assert_query_budget(view_name='users:login'):
+            self.client.get(reverse('users:login'))
+        with assert_query_budget(view_name='users:login', method='POST'):
+            response = self.client.post(reverse('users:login'), {'username': 'budgetuser', 'password': 'testpass123'})
+        self.assertEqual(response.status_code, 302)
+        
+        with assert_query_budget(view_name='users:profile'):
+            self.client.get(reverse('users:profile'))
+        with assert_query_budget(view_name='users:profile', method='POST'):
+            response = self.client.post(reverse('users:profile'), {
+                'first_name': 'Иван', 'last_name': 'Петров', 'email': 'budget@example.com',
+                'phone': '', 'city': 'Москва', 'bio': '',
+            })
+        self.assertEqual(response.status_code, 302)
+        
+        api = APIClient()
+        api.force_authenticate(user=self.user)
+        with assert_query_budget(view_name='api_users:profile'):
+            response = api.get('/api/users/me/')
+        self.assertEqual(response.data['city'], 'Москва')
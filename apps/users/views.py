@@ -5,8 +5,11 @@ from django.contrib import messages
 from django.views.generic import CreateView
 from django.contrib.auth.views import LoginView, LogoutView
 from django.urls import reverse_lazy
+from rest_framework import generics
+from rest_framework.permissions import IsAuthenticated
 from .forms import CustomUserCreationForm, CustomAuthenticationForm, UserProfileForm
 from .models import UserProfile
+from .serializers import UserProfileSerializer
 
 
 class RegisterView(CreateView):
@@ -17,8 +20,8 @@ class RegisterView(CreateView):
     
     def form_valid(self, form):
         # Сохраняем пользователя и автоматически входим в систему
-        response = super().form_valid(form)
-        user = form.save()
+        super().form_valid(form)
+        user = self.object
         login(self.request, user)
         messages.success(self.request, f'Добро пожаловать, {user.username}! Ваша учетная запись создана.')
         return redirect('ads:ad_list')
@@ -68,22 +71,21 @@ def profile_view(request):
     else:
         form = UserProfileForm(instance=profile, user=request.user)
     
-    # Получаем статистику пользователя
-    from apps.ads.models import Ad, ExchangeProposal
-    from django.db import models
-    
-    active_ads_count = Ad.objects.filter(user=request.user, is_active=True).count()
-    completed_exchanges = ExchangeProposal.objects.filter(
-        status='accepted'
-    ).filter(
-        models.Q(sender=request.user) | models.Q(receiver=request.user)
-    ).count()
-    
+    # Статистика пользователя из счетчиков профиля
     context = {
         'form': form,
         'profile': profile,
-        'active_ads_count': active_ads_count,
-        'completed_exchanges': completed_exchanges,
+        'active_ads_count': profile.active_ads_count,
+        'completed_exchanges': profile.successful_exchanges,
     }
     
-    return render(request, 'users/profile.html', context)
\ No newline at end of file
+    return render(request, 'users/profile.html', context)
+
+
+class ProfileAPIView(generics.RetrieveUpdateAPIView):
+    """API профиля текущего пользователя (счетчики только для чтения)"""
+    serializer_class = UserProfileSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_object(self):
+        return UserProfile.objects.select_related('user').get(user=self.request.user)
@@ -0,0 +1,18 @@
+"""
+Celery для фоновых задач в продакшене.
+
+Задачи объявляются через barter_platform.tasks.task и регистрируются здесь
+автоматически; запуск воркера:
+
+    celery -A barter_platform worker -l info
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'barter_platform.settings')
+
+app = Celery('barter_platform')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
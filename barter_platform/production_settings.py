@@ -38,6 +38,27 @@ CACHES = {
     }
 }
 
+# Шаблоны компилируются один раз на процесс (явно включенный cached loader)
+TEMPLATES[0]['APP_DIRS'] = False
+TEMPLATES[0]['OPTIONS']['loaders'] = [
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+
+# Фоновые задачи через Celery, брокер - Redis
+TASKS_BACKEND = 'barter_platform.tasks.CeleryBackend'
+
+# Бюджет запросов (barter_platform/querybudget.py) - только при разработке и в тестах;
+# включается переменной QUERY_BUDGET_MODE=log для диагностики
+QUERY_BUDGET_MODE = os.getenv('QUERY_BUDGET_MODE', 'off')
+
+# Модель похожих объявлений (apps/ads/similar.py): команда rebuild_similar_ads пишет
+# файл, а воркеры фоновых задач читают его - путь должен вести в общее для них
+# хранилище (общий том), иначе новые объявления не получают похожих
+SIMILAR_ADS_MODEL_PATH = os.getenv('SIMILAR_ADS_MODEL_PATH', '/var/lib/barter_platform/similar_ads.npz')
+
 # Email настройки для продакшена
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = os.getenv('EMAIL_HOST')
@@ -58,6 +79,11 @@ LOGGING = {
         },
     },
     'handlers': {
+        'console': {
+            'level': 'WARNING',
+            'class': 'logging.StreamHandler',
+            'formatter': 'verbose',
+        },
         'file': {
             'level': 'ERROR',
             'class': 'logging.FileHandler',
@@ -69,6 +95,13 @@ LOGGING = {
             'class': 'django.utils.log.AdminEmailHandler',
         },
     },
+    'loggers': {
+        # Предупреждения приложений (например, нет модели похожих объявлений) - в вывод процесса
+        'apps': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
+    },
     'root': {
         'handlers': ['file', 'mail_admins'],
         'level': 'ERROR',
@@ -0,0 +1,165 @@
+"""
+Бюджет SQL-запросов на запрос и поиск N+1.
+
+QueryBudgetMiddleware считает запросы к базе за время обработки запроса,
+сравнивает их количество с бюджетом представления (QUERY_BUDGETS, ключ -
+имя маршрута и HTTP-метод: ('ads:ad_list', 'GET')) и ищет одинаковые по форме запросы: один и
+тот же SELECT, повторенный с разными параметрами, - признак N+1.
+
+Режим задается настройкой QUERY_BUDGET_MODE:
+
+- 'off' - ничего не проверяется;
+- 'log' - нарушения пишутся в лог barter_platform.querybudget;
+- 'raise' - нарушение приводит к исключению QueryBudgetExceeded (тесты, разработка).
+
+Для тестов есть контекстный менеджер assert_query_budget.
+"""
+import collections
+import logging
+import re
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Сколько одинаковых запросов за один HTTP-запрос считается N+1
+DEFAULT_DUPLICATE_THRESHOLD = 3
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN \((?:\s*(?:%s|\?|NULL)\s*,?)+\)', re.IGNORECASE)
+_PLACEHOLDER_RE = re.compile(r'%s')
+# Служебные команды транзакций в бюджет не входят: в тестах atomic() дает
+# SAVEPOINT там, где вне тестов - BEGIN (в SQLite он проходит через курсор, в
+# PostgreSQL его посылает драйвер), и число запросов не зависело бы от окружения
+_TRANSACTION_RE = re.compile(r'^\s*(BEGIN|SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT)\b', re.IGNORECASE)
+
+
+def normalize_sql(sql):
+    """Форма запроса: литералы и списки IN заменены на ?, чтобы сравнивать запросы"""
+    shape = _STRING_RE.sub('?', sql)
+    shape = _NUMBER_RE.sub('?', shape)
+    shape = _PLACEHOLDER_RE.sub('?', shape)
+    return _IN_LIST_RE.sub('IN (...)', shape)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Превышен бюджет запросов или найден N+1"""
+
+
+class QueryRecorder:
+    """Записывает SQL-запросы всех подключений внутри блока with"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if _TRANSACTION_RE.match(sql):
+            return execute(sql, params, many, context)
+        start = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'alias': context['connection'].alias,
+                'time': time.monotonic() - start,
+            })
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __len__(self):
+        return len(self.queries)
+
+    def duplicates(self, threshold=DEFAULT_DUPLICATE_THRESHOLD):
+        """Повторяющиеся формы запросов: {форма: количество} для повторов >= threshold"""
+        shapes = collections.Counter(normalize_sql(query['sql']) for query in self.queries)
+        return {shape: count for shape, count in shapes.items() if count >= threshold}
+
+    def report(self, budget=None, threshold=DEFAULT_DUPLICATE_THRESHOLD):
+        """Список нарушений (пустой, если все в порядке)"""
+        problems = []
+        if budget is not None and len(self) > budget:
+            problems.append(f'{len(self)} запросов при бюджете {budget}')
+        for shape, count in self.duplicates(threshold).items():
+            problems.append(f'N+1: {count} одинаковых запросов: {shape}')
+        return problems
+
+
+def get_budget(view_name, method='GET'):
+    """
+    Бюджет запросов для маршрута и метода.
+
+    Чтение и изменение одного маршрута стоят по-разному, поэтому ключ -
+    (view_name, method); ключ из одного имени маршрута действует для всех
+    методов, иначе - QUERY_BUDGET_DEFAULT.
+    """
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    default = budgets.get(view_name, getattr(settings, 'QUERY_BUDGET_DEFAULT', None))
+    return budgets.get((view_name, method.upper()), default)
+
+
+class QueryBudgetMiddleware:
+    """Проверка бюджета запросов и N+1 для каждого HTTP-запроса"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = getattr(settings, 'QUERY_BUDGET_MODE', 'off')
+        if mode == 'off':
+            return self.get_response(request)
+
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        view_name = match.view_name if match else None
+        response['X-Query-Count'] = str(len(recorder))
+        # Составной запрос (apps/ads/batch.py) проверяет каждую часть по ее бюджету сам
+        if view_name is None or getattr(request, 'query_budget_checked', False):
+            return response
+        check_query_budget(recorder, view_name, request.method, f'{request.method} {request.path}')
+        return response
+
+
+def check_query_budget(recorder, view_name, method, label):
+    """Сравнить записанные запросы с бюджетом маршрута и метода: нарушения - в лог или исключение"""
+    mode = getattr(settings, 'QUERY_BUDGET_MODE', 'off')
+    problems = recorder.report(
+        budget=get_budget(view_name, method),
+        threshold=getattr(settings, 'QUERY_BUDGET_DUPLICATE_THRESHOLD', DEFAULT_DUPLICATE_THRESHOLD),
+    )
+    if problems:
+        message = f'{label} ({view_name}): ' + '; '.join(problems)
+        if mode == 'raise':
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+@contextmanager
+def assert_query_budget(budget=None, view_name=None, method='GET', threshold=DEFAULT_DUPLICATE_THRESHOLD):
+    """
+    Проверить в тесте бюджет запросов и отсутствие N+1 внутри блока.
+
+        with assert_query_budget(view_name='ads:ad_create', method='POST'):
+            self.client.post(reverse('ads:ad_create'), data)
+    """
+    if budget is None and view_name is not None:
+        budget = get_budget(view_name, method)
+    with QueryRecorder() as recorder:
+        yield recorder
+    problems = recorder.report(budget=budget, threshold=threshold)
+    if problems:
+        queries = '\n'.join(f'{i}. {query["sql"]}' for i, query in enumerate(recorder.queries, 1))
+        raise QueryBudgetExceeded('; '.join(problems) + '\n' + queries)
@@ -0,0 +1,62 @@
+"""
+Рендереры ответов API.
+
+FastJSONRenderer - замена JSONRenderer из DRF на orjson: тот же JSON байт в байт
+(компактные разделители, UTF-8 без экранирования, даты через кодировщик DRF),
+но в несколько раз быстрее. Если запрошен отступ (Accept: application/json;
+indent=4), настройки DRF требуют ensure_ascii или orjson не установлен,
+используется обычный JSONRenderer.
+
+MessagePackRenderer отдает ответ в MessagePack (Accept: application/msgpack).
+Пакет msgpack необязателен: без него рендерер не подключается (см. settings).
+"""
+from rest_framework import renderers
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+# Кодировщик DRF для типов, которые orjson и msgpack не сериализуют сами
+# (Decimal, ленивые строки, QuerySet) или сериализуют иначе (даты)
+default_encoder = encoders.JSONEncoder()
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """JSONRenderer на orjson с тем же результатом"""
+
+    if orjson is not None:
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=default_encoder.default, option=self.options)
+        except orjson.JSONEncodeError:
+            # Например, целые больше 64 бит: их умеет только json
+            return super().render(data, accepted_media_type, renderer_context)
+        # Как и JSONRenderer, экранируем разделители строк для встраивания в JavaScript
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    """Ответ в формате MessagePack"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=default_encoder.default, use_bin_type=True)
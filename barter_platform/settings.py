@@ -2,6 +2,7 @@
 Django settings for barter_platform project.
 """
 
+import importlib.util
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -40,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'barter_platform.querybudget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -133,6 +135,10 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'barter_platform.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_FILTER_BACKENDS': [
@@ -142,12 +148,119 @@ REST_FRAMEWORK = {
     ],
 }
 
+# MessagePack (Accept: application/msgpack) - если установлен пакет msgpack
+if importlib.util.find_spec('msgpack'):
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('barter_platform.renderers.MessagePackRenderer')
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = os.getenv('CORS_ALLOWED_ORIGINS', 'http://localhost:3000').split(',')
 
 # Email settings (for future notifications)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
+# Бюджет SQL-запросов на HTTP-запрос и поиск N+1 (barter_platform/querybudget.py):
+# 'off', 'log' или 'raise'. Без DEBUG по умолчанию выключен: обертка каждого
+# запроса к базе и заголовок X-Query-Count нужны только при разработке
+QUERY_BUDGET_MODE = os.getenv('QUERY_BUDGET_MODE', 'log' if DEBUG else 'off')
+QUERY_BUDGET_DUPLICATE_THRESHOLD = 3
+
+# Максимум запросов по имени маршрута и HTTP-методу; не зависит от количества
+# объектов на странице. Ключ из одного имени маршрута действует для всех методов
+# (функции-представления, которые делают одно и то же на GET и POST)
+QUERY_BUDGETS = {
+    # apps/ads/urls.py
+    ('ads:ad_list', 'GET'): 8,
+    ('ads:ad_create', 'GET'): 3,
+    ('ads:ad_create', 'POST'): 8,
+    ('ads:ad_detail', 'GET'): 11,
+    ('ads:ad_edit', 'GET'): 6,
+    ('ads:ad_edit', 'POST'): 10,
+    ('ads:ad_delete', 'GET'): 6,
+    ('ads:ad_delete', 'POST'): 21,
+    ('ads:my_ads', 'GET'): 8,
+    ('ads:proposal_list', 'GET'): 8,
+    ('ads:proposal_create', 'GET'): 6,
+    ('ads:proposal_create', 'POST'): 13,
+    'ads:proposal_accept': 17,
+    'ads:proposal_reject': 11,
+    ('ads:proposal_resolve', 'POST'): 17,
+    # apps/ads/api_urls.py
+    ('api_ads:api-root', 'GET'): 0,
+    ('api_ads:ad-list', 'GET'): 4,
+    ('api_ads:ad-list', 'POST'): 4,
+    ('api_ads:ad-detail', 'GET'): 4,
+    ('api_ads:ad-detail', 'PUT'): 6,
+    ('api_ads:ad-detail', 'PATCH'): 6,
+    ('api_ads:ad-detail', 'DELETE'): 17,
+    ('api_ads:ad-my-ads', 'GET'): 4,
+    ('api_ads:ad-deactivate', 'POST'): 5,
+    ('api_ads:ad-sync', 'GET'): 3,
+    ('api_ads:ad-matches', 'GET'): 2,
+    ('api_ads:ad-similar', 'GET'): 2,
+    ('api_ads:ad-bulk-create', 'POST'): 4,
+    ('api_ads:ad-bulk-update', 'PATCH'): 7,
+    ('api_ads:ad-bulk-deactivate', 'POST'): 5,
+    ('api_ads:proposal-list', 'GET'): 4,
+    ('api_ads:proposal-list', 'POST'): 10,
+    ('api_ads:proposal-detail', 'GET'): 3,
+    ('api_ads:proposal-accept', 'POST'): 12,
+    ('api_ads:proposal-reject', 'POST'): 6,
+    ('api_ads:proposal-resolve', 'POST'): 16,
+    ('api_ads:proposal-sent', 'GET'): 4,
+    ('api_ads:proposal-received', 'GET'): 4,
+    ('api_ads:proposal-sync', 'GET'): 3,
+    ('api_ads:trade-cycle-list', 'GET'): 3,
+    ('api_ads:trade-cycle-detail', 'GET'): 2,
+    ('api_ads:task-queue', 'GET'): 2,
+    # apps/users/urls.py и apps/users/api_urls.py
+    ('users:register', 'GET'): 2,
+    ('users:register', 'POST'): 11,
+    ('users:login', 'GET'): 1,
+    ('users:login', 'POST'): 6,
+    'users:logout': 5,
+    ('users:profile', 'GET'): 3,
+    ('users:profile', 'POST'): 8,
+    'api_users:profile': 3,
+}
+
+# Наибольшее число частей составного запроса /api/batch/ (apps/ads/batch.py)
+API_BATCH_MAX_REQUESTS = int(os.getenv('API_BATCH_MAX_REQUESTS', '20'))
+
+# Наибольшая длина цепочного обмена (apps/ads/cycles.py, от 3 до 8)
+TRADE_CYCLE_MAX_LENGTH = int(os.getenv('TRADE_CYCLE_MAX_LENGTH', '4'))
+
+# Модель похожих объявлений (apps/ads/similar.py): словарь и векторы последнего пересчета
+SIMILAR_ADS_MODEL_PATH = os.getenv('SIMILAR_ADS_MODEL_PATH', str(BASE_DIR / 'var' / 'similar_ads.npz'))
+
+# Наибольший размер пакета в массовых операциях API (apps/ads/bulk.py, не больше 1000)
+ADS_BULK_MAX_ITEMS = int(os.getenv('ADS_BULK_MAX_ITEMS', '100'))
+
+# Синхронизация для мобильных клиентов (apps/ads/sync.py): строки моложе
+# SYNC_SETTLE_SECONDS ждут следующего запроса (транзакции успевают закоммититься),
+# журнал удалений хранится SYNC_TOMBSTONE_DAYS дней
+SYNC_SETTLE_SECONDS = 2
+SYNC_TOMBSTONE_DAYS = 30
+
+# Кэш списков и карточек объявлений (apps/ads/cache.py), секунд: после мягкого срока
+# значение пересчитывает один запрос, до жесткого срока остальные получают устаревшее
+ADS_CACHE_SOFT_TTL = int(os.getenv('ADS_CACHE_SOFT_TTL', 300))
+ADS_CACHE_HARD_TTL = int(os.getenv('ADS_CACHE_HARD_TTL', 900))
+# Сколько ждать значения, которое считает другой запрос
+ADS_CACHE_LOCK_TIMEOUT = int(os.getenv('ADS_CACHE_LOCK_TIMEOUT', 10))
+# Фрагменты шаблонов с объявлением (apps/ads/templatetags/ads_tags.py); ключ содержит
+# updated_at, поэтому срок нужен только для вытеснения неиспользуемых записей
+ADS_FRAGMENT_CACHE_TTL = int(os.getenv('ADS_FRAGMENT_CACHE_TTL', 24 * 60 * 60))
+
+# Фоновые задачи (barter_platform/tasks.py): в разработке - пул потоков в процессе
+TASKS_BACKEND = os.getenv('TASKS_BACKEND', 'barter_platform.tasks.ThreadPoolBackend')
+TASKS_THREAD_WORKERS = int(os.getenv('TASKS_THREAD_WORKERS', 4))
+
+# Celery (используется при TASKS_BACKEND = CeleryBackend)
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/0'))
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TASK_IGNORE_RESULT = True
+
 # ========================================
 # НАСТРОЙКИ ДЛЯ ТЕСТИРОВАНИЯ
 # ========================================
@@ -181,6 +294,12 @@ if 'test' in sys.argv or 'pytest' in sys.modules:
     # Email backend для тестов
     EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
     
+    # Превышение бюджета запросов и N+1 в тестах - ошибка
+    QUERY_BUDGET_MODE = 'raise'
+    
+    # Фоновые задачи выполняются сразу, чтобы тесты видели результат
+    TASKS_BACKEND = 'barter_platform.tasks.ImmediateBackend'
+    
     # Отключаем кэширование в тестах
     CACHES = {
         'default': {
@@ -191,6 +310,7 @@ if 'test' in sys.argv or 'pytest' in sys.modules:
     # Используем временную директорию для медиа файлов
     import tempfile
     MEDIA_ROOT = tempfile.mkdtemp()
+    SIMILAR_ADS_MODEL_PATH = os.path.join(tempfile.mkdtemp(), 'similar_ads.npz')
     
     # Упрощенное логирование для тестов
     LOGGING = {
@@ -0,0 +1,209 @@
+"""
+Фоновые задачи.
+
+Задача объявляется декоратором @task и ставится в очередь через .delay().
+Способ выполнения задается настройкой TASKS_BACKEND:
+
+- CeleryBackend - очередь в Redis и отдельные воркеры (продакшн);
+- ThreadPoolBackend - пул потоков внутри процесса (разработка);
+- ImmediateBackend - синхронное выполнение сразу при вызове (тесты).
+
+Celery и пул потоков запускают задачу только после фиксации текущей
+транзакции, чтобы задача видела сохраненные данные.
+"""
+import collections
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+
+from .celery import app as celery_app
+
+logger = logging.getLogger(__name__)
+
+# Все объявленные задачи: {имя: Task}
+registry = {}
+
+
+class Task:
+    """Фоновая задача с повторными попытками при ошибках"""
+
+    def __init__(self, func, name, max_retries, retry_delay):
+        self.func = func
+        self.name = name
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.celery_task = celery_app.task(
+            name=name, bind=True, max_retries=max_retries, default_retry_delay=retry_delay
+        )(self._run_celery)
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def __repr__(self):
+        return f'<Task {self.name}>'
+
+    def delay(self, *args, **kwargs):
+        """Поставить задачу в очередь"""
+        get_backend().enqueue(self, args, kwargs)
+
+    def get_retry_delay(self, attempt):
+        """Задержка перед повтором: экспоненциальная, начиная с retry_delay"""
+        return self.retry_delay * (2 ** attempt)
+
+    def _run_celery(self, celery_task, *args, **kwargs):
+        try:
+            return self.func(*args, **kwargs)
+        except Exception as exc:
+            retries = celery_task.request.retries
+            raise celery_task.retry(exc=exc, countdown=self.get_retry_delay(retries))
+
+
+def task(name=None, max_retries=3, retry_delay=5):
+    """Декоратор объявления фоновой задачи"""
+    def decorator(func):
+        task_name = name or f'{func.__module__}.{func.__name__}'
+        registry[task_name] = Task(func, task_name, max_retries, retry_delay)
+        return registry[task_name]
+    return decorator
+
+
+class BaseBackend:
+    """Базовый класс бэкенда очереди задач"""
+    # Очередь живет в памяти процесса: другой процесс (команда task_queue) ее не видит
+    in_process = False
+
+    def enqueue(self, task, args, kwargs):
+        raise NotImplementedError
+
+    def inspect(self):
+        """Состояние очереди в виде словаря"""
+        return {'backend': self.__class__.__name__}
+
+
+class ImmediateBackend(BaseBackend):
+    """Синхронное выполнение сразу при постановке в очередь (для тестов)"""
+    in_process = True
+
+    def enqueue(self, task, args, kwargs):
+        for attempt in range(task.max_retries + 1):
+            try:
+                return task(*args, **kwargs)
+            except Exception:
+                if attempt == task.max_retries:
+                    raise
+
+
+class ThreadPoolBackend(BaseBackend):
+    """Пул потоков внутри процесса: задачи не блокируют обработку запроса"""
+    in_process = True
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'TASKS_THREAD_WORKERS', 4),
+            thread_name_prefix='tasks',
+        )
+        self.lock = threading.Lock()
+        self.stats = collections.Counter()
+        self.pending = collections.Counter()
+        self.failures = collections.deque(maxlen=50)
+
+    def enqueue(self, task, args, kwargs):
+        # Считаем задачу только после коммита: при откате она не выполнится
+        transaction.on_commit(lambda: self.accept(task, args, kwargs))
+
+    def accept(self, task, args, kwargs):
+        with self.lock:
+            self.stats['queued'] += 1
+            self.pending[task.name] += 1
+        self.submit(task, args, kwargs, attempt=0)
+
+    def submit(self, task, args, kwargs, attempt):
+        self.executor.submit(self.run, task, args, kwargs, attempt)
+
+    def run(self, task, args, kwargs, attempt):
+        close_old_connections()
+        try:
+            task(*args, **kwargs)
+        except Exception as exc:
+            if attempt < task.max_retries:
+                delay = task.get_retry_delay(attempt)
+                logger.warning('Задача %s упала (%s), повтор через %s с', task.name, exc, delay)
+                with self.lock:
+                    self.stats['retried'] += 1
+                timer = threading.Timer(delay, self.submit, (task, args, kwargs, attempt + 1))
+                timer.daemon = True
+                timer.start()
+                return
+            logger.exception('Задача %s завершилась ошибкой', task.name)
+            self.finish(task, 'failed', {
+                'task': task.name, 'args': args, 'kwargs': kwargs,
+                'error': repr(exc), 'time': time.time(),
+            })
+        else:
+            self.finish(task, 'succeeded')
+        finally:
+            close_old_connections()
+
+    def finish(self, task, outcome, failure=None):
+        with self.lock:
+            self.stats[outcome] += 1
+            self.pending[task.name] -= 1
+            if not self.pending[task.name]:
+                del self.pending[task.name]
+            if failure:
+                self.failures.append(failure)
+
+    def inspect(self):
+        with self.lock:
+            return {
+                'backend': self.__class__.__name__,
+                'stats': dict(self.stats),
+                'pending': dict(self.pending),
+                'recent_failures': list(self.failures),
+            }
+
+
+class CeleryBackend(BaseBackend):
+    """Очередь Celery (брокер - Redis)"""
+
+    def enqueue(self, task, args, kwargs):
+        transaction.on_commit(lambda: task.celery_task.apply_async(args, kwargs))
+
+    def inspect(self):
+        inspector = celery_app.control.inspect(timeout=1.0)
+        return {
+            'backend': self.__class__.__name__,
+            'broker': celery_app.conf.broker_url,
+            'queue_length': self.queue_length(),
+            'active': inspector.active() or {},
+            'reserved': inspector.reserved() or {},
+            'scheduled': inspector.scheduled() or {},
+        }
+
+    def queue_length(self):
+        """Количество задач, ожидающих воркера, в очереди по умолчанию"""
+        with celery_app.connection_or_acquire() as connection:
+            queue = connection.default_channel.queue_declare(
+                queue=celery_app.conf.task_default_queue, passive=True
+            )
+            return queue.message_count
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Бэкенд очереди задач из настройки TASKS_BACKEND (создается один раз на процесс)"""
+    global _backend
+    path = getattr(settings, 'TASKS_BACKEND', 'barter_platform.tasks.ThreadPoolBackend')
+    with _backend_lock:
+        if _backend is None or _backend.path != path:
+            _backend = import_string(path)()
+            _backend.path = path
+    return _backend
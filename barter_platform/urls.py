@@ -29,6 +29,7 @@ urlpatterns = [
     path('users/', include('apps.users.urls', namespace='users')), 
     # API
     path('api/', include('apps.ads.api_urls', namespace='api_ads')), 
+    path('api/users/', include('apps.users.api_urls', namespace='api_users')),
     path('api-auth/', include('rest_framework.urls')),
 ]
 